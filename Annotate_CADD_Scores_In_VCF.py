@@ -9,6 +9,8 @@ import multiprocessing as mp
 
 from optparse import OptionParser
 
+from Run_monitor import RunMonitor
+
 """
 CADD FORMAT
 #Chrom	Pos Ref Alt RawScore	PHRED
@@ -21,6 +23,9 @@ parser.add_option("--snv",   dest="cadd_snvs",	 help="Path to prescored SNVs",
 parser.add_option("--indel", dest="cadd_indels", help="Path to prescored InDels",   default=False)
 parser.add_option("--t",     dest="nr_cpus", 	 help="Number of CPUs to use",	    default=8)
 parser.add_option("--out",   dest="out_file",	 help="Path to output VCF file",    default="out.vcf")
+parser.add_option("--report",   dest="report_file",	 help="Path of JSON run report to write",	default=False)
+parser.add_option("--profile",  dest="profile_file", help="Path of profile of the main process to write, pyinstrument for .html/.txt when installed, cProfile statistics otherwise", default=False)
+parser.add_option("--progress", dest="progress",	 help="Seconds between progress lines on stderr (0 = off)", default=30, type="float")
 (options, args) = parser.parse_args()
 
 
@@ -74,6 +79,7 @@ VALID_CHROMOSOMES = {"1":True,"2":True,"3":True,"4":True,"5":True,"6":True,"7":T
 # CADD extraction function
 def extract_CADD_score(arguments, q):
 	vcf_record, caddfile = arguments
+	start = time()
 	
 	tb = tabix.open(caddfile)
 
@@ -87,20 +93,23 @@ def extract_CADD_score(arguments, q):
 
 	# Look for matching mutation
 	# Works for SNVs, InDels optimisation is ongoing
+	found = False
 	for rec in records:
 		if rec[3] == vcf_record.ALT[0]:
 			# FIXME: Make requested fields optional through arguments
 			vcf_record.INFO["RAWCADD"]   = rec[4]
 			vcf_record.INFO["PHREDCADD"] = rec[5]
+			found = True
 			break
+	lookup_time = time() - start
 	
 	# workaround since multiprocess can't handle VCF record class objects
 	# FIXME: use VCF class records rather than this ugly string
 	annotated = VCF_WRITER._map(str, [vcf_record.CHROM, vcf_record.POS, vcf_record.ID, vcf_record.REF]) + [VCF_WRITER._format_alt(vcf_record.ALT), str(vcf_record.QUAL) or '.', VCF_WRITER._format_filter(vcf_record.FILTER), VCF_WRITER._format_info(vcf_record.INFO)]
 
-	# Return results to Queue
+	# Return results to Queue, the lookup statistics go back to the main process
 	q.put(annotated)
-	return(annotated)
+	return(lookup_time, found)
 
 
 def listener(q):
@@ -114,6 +123,8 @@ def listener(q):
 	f.write('#' + '\t'.join(VCF_WRITER.template._column_headers + VCF_WRITER.template.samples) + '\n')
 	f.flush()
 	
+	written = 0
+	write_time = 0.0
 	while 1:
 		m = q.get()
 		if m == 'kill':
@@ -126,13 +137,17 @@ def listener(q):
 			break
 		
 		# A vcf record was found, write to file
+		start = time()
 		f.write('\t'.join(m)+'\n')
 		f.flush()
+		write_time += time() - start
+		written += 1
 	f.close()
+	return(written, write_time)
 
 
 def main():
-	currtime = time()
+	monitor = RunMonitor("Annotate_CADD_Scores_In_VCF", interval=options.progress, report_file=options.report_file, profile_file=options.profile_file)
 
 	#Init Manager queue
 	manager = mp.Manager()
@@ -146,34 +161,48 @@ def main():
 	#print("Filling Queue")
 	#fire off workers
 	jobs = []
-	for vcf_record in VCF_READER:
-		chromosome = (vcf_record.CHROM).replace("chr","")
-		if chromosome not in VALID_CHROMOSOMES:
-			continue
-			
-		arguments = []
-		if vcf_record.is_indel:
-			arguments = [vcf_record, options.cadd_indels]
-		else:
-			arguments = [vcf_record, options.cadd_snvs]
-
-		job = pool.apply_async(extract_CADD_score, (arguments, q))
-		jobs.append(job)
-		
+	with monitor.stage("parse"):
+		for vcf_record in VCF_READER:
+			monitor.count("vcf_records")
+			chromosome = (vcf_record.CHROM).replace("chr","")
+			if chromosome not in VALID_CHROMOSOMES:
+				monitor.count("skipped_chromosome")
+				continue
+				
+			arguments = []
+			if vcf_record.is_indel:
+				monitor.count("indels")
+				arguments = [vcf_record, options.cadd_indels]
+			else:
+				monitor.count("snvs")
+				arguments = [vcf_record, options.cadd_snvs]
+
+			job = pool.apply_async(extract_CADD_score, (arguments, q))
+			jobs.append(job)
+
+	# progress and ETA over the submitted records
+	monitor.total = len(jobs)
 
 
 	#print("Collecting results")
 	# collect results from the workers through the pool result queue
 	for job in jobs:
-		job.get()
+		lookup_time, found = job.get()
+		monitor.add_time("lookup", lookup_time)
+		monitor.count("cadd_found" if found else "cadd_missing")
+		monitor.record()
 	
 	# now we are done, kill the listener
 	q.put('kill')
+	written, write_time = watcher.get()
+	monitor.count("written", written)
+	monitor.add_time("write", write_time)
 	
 	pool.close()
 	pool.join()
 
-	print 'time elapsed:', time() - currtime
+	report = monitor.finish(settings=vars(options))
+	print 'time elapsed:', report["wall_time"]
 
 if __name__ == "__main__":
 	main() 
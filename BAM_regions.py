@@ -0,0 +1,61 @@
+#!/usr/bin/python2.7
+
+# GENERAL
+import multiprocessing as mp
+
+# BAM handling
+from pysam import AlignmentFile
+
+# -------------------------------------------------
+
+# Open AlignmentFile handles of this process, per BAM file
+_handles = {}
+
+def get_handle(bam_file):
+	# Every process opens a BAM file once and reuses the handle for all of its regions
+	if bam_file not in _handles:
+		_handles[bam_file] = AlignmentFile(bam_file, "rb")
+	return _handles[bam_file]
+
+def close_handles():
+	for handle in _handles.values():
+		handle.close()
+	_handles.clear()
+
+# -------------------------------------------------
+
+def plan_regions(regions, merge_distance=0):
+	# Sorts (chrom, start, end) regions and merges overlapping regions and regions at most merge_distance apart,
+	# so BGZF blocks shared by neighbouring regions are decoded once.
+	# Returns the planned regions and per planned region the indices of the regions it contains.
+	planned = []
+	members = []
+	order = sorted(range(len(regions)), key=lambda i: regions[i])
+	for i in order:
+		chrom, start, end = regions[i]
+		if len(planned) > 0 and planned[-1][0] == chrom and start <= planned[-1][2] + merge_distance:
+			planned[-1][2] = max(planned[-1][2], end)
+			members[-1].append(i)
+		else:
+			planned.append([chrom, start, end])
+			members.append([i])
+	return [tuple(region) for region in planned], members
+
+def fetch_worker(args):
+	function, bam_file, region = args
+	return function(get_handle(bam_file), *region)
+
+def map_regions(function, bam_file, regions, nr_cpus=1):
+	# Calls function(handle, chrom, start, end) for every region, in a process pool when nr_cpus > 1.
+	# function has to be defined at module level, results are returned in region order.
+	jobs = [(function, bam_file, region) for region in regions]
+	if nr_cpus <= 1:
+		results = [fetch_worker(job) for job in jobs]
+		close_handles()
+		return results
+
+	pool = mp.Pool(processes=nr_cpus)
+	results = pool.map(fetch_worker, jobs, chunksize=max(1, len(jobs) // (nr_cpus * 4)))
+	pool.close()
+	pool.join()
+	return results
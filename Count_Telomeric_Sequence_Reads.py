@@ -3,13 +3,17 @@
 import pysam
 import glob
 import os
+import sys
 
 from time import time
 from time import sleep
+from time import strftime
 import subprocess
 import multiprocessing as mp
 
 from optparse import OptionParser
+
+from Run_monitor import RunMonitor
 # -------------------------------------------------
 parser = OptionParser()
 parser.add_option("--sambamba",	dest="sambamba",	help="Path to sambamba/samtools executable",		default="sambamba")
@@ -18,6 +22,9 @@ parser.add_option("--outdir",	dest="outdir",		help="Path to directory to write o
 parser.add_option("--repsize",	dest="repsize",		help="Number of required matching 6mers (TTAGGG)",	default=10)
 parser.add_option("--s",	dest="nr_samples",	help="Number of Samples to analyse simulatiously",	default=6)
 parser.add_option("--t",	dest="nr_cpus",		help="Number of CPUs to use per sample",		default=2)
+parser.add_option("--report",	dest="report_file",	help="Path of JSON run report to write",		default=False)
+parser.add_option("--profile",	dest="profile_file",	help="Path of profile of the main process to write, pyinstrument for .html/.txt when installed, cProfile statistics otherwise", default=False)
+parser.add_option("--progress",	dest="progress",	help="Seconds between progress lines on stderr (0 = off)", default=30, type="float")
 (options, args) = parser.parse_args()
 # -------------------------------------------------
 
@@ -29,7 +36,7 @@ def check_arguments():
 	if not os.path.exists(options.outdir):
 		print("Creating output folder %s"%(options.outdir))
 		try:
-			os.makedir(options.outdir)
+			os.makedirs(options.outdir)
 		except OSError:
 			print("Invalid / unable to create, output folder %s"%(options.outdir))
 			return False
@@ -49,30 +56,39 @@ def count_telomeric_reads(bamfile, q):
 	# generate Telomere reads file name
 	telofile = bamfile.replace(options.bamdir,options.outdir).replace(".bam","_TelomericReads.sam")
 
+	# stage timers are returned to the main process with the result
+	timers = {}
+
 	# check if the file was already generated
 	if not os.path.exists(telofile):
 		# print("---- Processing BAM file: "+bamfile)
 		# extract telomeric reads and write to file
+		start = time()
 		cmd = options.sambamba+" view "+bamfile+" -t "+ str(options.nr_cpus) +" | LC_ALL=C grep -E \"" + "TTAGGG"*options.repsize +"|"+ "CCCTAA"*options.repsize + "\"" + " > " + telofile
 		print("++++ Generating SAM file: "+telofile)
 		os.system(cmd)
+		timers["extract"] = time() - start
 
 	# count total number of reads
+	start = time()
 	total_rc = reduce(lambda x, y: x + y, [ eval('+'.join(l.rstrip('\n').split('\t')[2:]) ) for l in pysam.idxstats(bamfile) ])
+	timers["count_total"] = time() - start
 
 	sleep(1)
 
 	telomere_rc = 0
 	if os.path.exists(telofile):
 		# count number of telomeric reads by line count
+		start = time()
 		telomere_rc = sum(1 for line in open(telofile,'r'))
+		timers["count_telomeric"] = time() - start
 	else:
 		print("Something went wrong with BAM file: "+bamfile)
 
 	# return results
 	result = [str(bamfile.split("/")[-1].split("_")[0]), str(total_rc), str(telomere_rc), str((telomere_rc/(total_rc*1.0))*100000.0)]
 	q.put(result)
-	return(result)
+	return(result, timers)
 
 
 # -------------------------------------------------
@@ -80,7 +96,7 @@ def listener(q):
 	'''listens for messages on the q, writes to file. '''
 	#sys.stdout.write('Starting listener\n')
 
-	f = open(os.path.join(options.outdir, "TelomereCounts_"+time.strftime("%d_%m_%Y")+".txt"), 'wb')
+	f = open(os.path.join(options.outdir, "TelomereCounts_"+strftime("%d_%m_%Y")+".txt"), 'wb')
 	f.write('\t'.join(["#Sample","TotalReads","TelomericReads","NormalisedFraction"])+'\n')
 	f.flush()
 
@@ -102,7 +118,7 @@ def listener(q):
 # -------------------------------------------------
 
 def main():
-	currtime = time()
+	monitor = RunMonitor("Count_Telomeric_Sequence_Reads", interval=options.progress, report_file=options.report_file, profile_file=options.profile_file)
 
 	#Init Manager queue
 	manager = mp.Manager()
@@ -115,6 +131,7 @@ def main():
 	watcher = pool.apply_async(listener, (q,))
 
 	bamfiles = glob.glob(os.path.join(options.bamdir, "*.bam"))
+	monitor.total = len(bamfiles)
 	jobs = []
 
 	#fire off workers
@@ -125,13 +142,18 @@ def main():
 		if not os.path.exists(baifile):
 			print("No index file found for %s, indexing now"%(bamfile))
 			subprocess.call(options.sambamba, " index " + bamfile)
+			monitor.count("bam_indexed")
 
 		job = pool.apply_async(count_telomeric_reads, (bamfile, q))
 		jobs.append(job)
 
 
 	for job in jobs:
-		job.get()
+		result, timers = job.get()
+		monitor.merge(timers=timers)
+		monitor.count("total_reads", int(result[1]))
+		monitor.count("telomeric_reads", int(result[2]))
+		monitor.record()
 
 	# now we are done, kill the listener
 	q.put("kill")
@@ -139,7 +161,8 @@ def main():
 	pool.close()
 	pool.join()
 
-	print 'time elapsed:', time() - currtime
+	report = monitor.finish(settings=vars(options))
+	print 'time elapsed:', report["wall_time"]
 
 # -------------------------------------------------
 
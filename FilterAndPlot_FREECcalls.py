@@ -1,22 +1,270 @@
 #!/opt/local/bin/python2.7
 
-import glob, os
+import glob, os, sys, json
+import argparse
+import multiprocessing as mp
+import numpy as np
 
 def shellquote(s):
-    return "'" + s.replace("'", "'\\''").replace("\"","") + "'"
+	return "'" + s.replace("'", "'\\''").replace("\"","") + "'"
 
 
-samples = {}
 #os.chdir("/Users/test/data/CNVs/freec/new_analysis/")
 controls = ["BLOOD","BULK"]
-
-filenames = glob.glob("*_CNVs.txt")
-filenames.sort()
-
-
-for cnvfile in filenames:
-	sample,condition,rest = cnvfile.split("_")
-
+panelmap = "overlapmap/ALL_Controls_multisample_merged_CNVs.bed"
+min_size = 50000
+wind_size = 50000
+outdir = "results"
+# track and merged ratios are written in the output directory, unless given elsewhere
+trackdir = "ratio_track"
+cnvout = "All_CNVs_merged_ratios.txt"
+
+# -------------------------------------------------
+
+class IntervalSet:
+	"""Per chromosome sorted BED intervals, for vectorised overlap queries"""
+
+	def __init__(self, intervals):
+		# intervals: list of (chrom, start, end)
+		self.starts = {}
+		self.maxends = {}
+		bychrom = {}
+		for chrom, start, end in intervals:
+			bychrom.setdefault(chrom, []).append((start, end))
+
+		for chrom in bychrom:
+			arr = np.array(sorted(bychrom[chrom]), dtype=np.int64).reshape(-1, 2)
+			self.starts[chrom] = arr[:,0]
+			# running maximum of the ends, intervals before index i reach up to maxends[i-1]
+			self.maxends[chrom] = np.maximum.accumulate(arr[:,1])
+
+	def overlaps(self, chrom, starts, ends):
+		# boolean array, True where [start,end) overlaps at least one interval (as bedtools intersect)
+		starts = np.asarray(starts, dtype=np.int64)
+		ends = np.asarray(ends, dtype=np.int64)
+		if chrom not in self.starts:
+			return np.zeros(len(starts), dtype=bool)
+
+		idx = np.searchsorted(self.starts[chrom], ends, side='left')
+		hit = np.zeros(len(starts), dtype=bool)
+		found = idx > 0
+		hit[found] = self.maxends[chrom][idx[found]-1] > starts[found]
+		return hit
+
+def read_bed(bedfile):
+	# returns the lines and their (chrom, start, end)
+	lines = []
+	intervals = []
+	reader = open(bedfile,'r')
+	for line in reader:
+		items = line.strip().split('\t')
+		if len(items) < 3 or line.startswith("#"):
+			continue
+		lines.append(line)
+		intervals.append((items[0], int(items[1]), int(items[2])))
+	reader.close()
+	return lines, intervals
+
+def filter_cnvs(test, excluded, out):
+	# in-process version of: bedtools intersect -a test -b panel -v | bedtools intersect -a stdin -b control -v | awk '{if(($3-$2)>50000) print}'
+	lines, intervals = read_bed(test)
+
+	keep = np.ones(len(lines), dtype=bool)
+	bychrom = {}
+	for i, (chrom, start, end) in enumerate(intervals):
+		bychrom.setdefault(chrom, []).append(i)
+
+	for chrom in bychrom:
+		idx = np.array(bychrom[chrom])
+		starts = np.array([intervals[i][1] for i in idx], dtype=np.int64)
+		ends = np.array([intervals[i][2] for i in idx], dtype=np.int64)
+		drop = (ends - starts) <= min_size
+		for intervalset in excluded:
+			drop |= intervalset.overlaps(chrom, starts, ends)
+		keep[idx[drop]] = False
+
+	writer = open(out,'w')
+	writer.writelines([line for i, line in enumerate(lines) if keep[i]])
+	writer.close()
+
+	return [intervals[i] for i in range(len(lines)) if keep[i]]
+
+# -------------------------------------------------
+
+def read_ratios(ratiofile):
+	# one pass over a FREEC ratio file: per chromosome sorted positions and the MedianRatio column (as in cut -f 1-2,4)
+	bychrom = {}
+	reader = open(ratiofile,'r')
+	for line in reader:
+		items = line.strip().split('\t')
+		if len(items) < 4 or items[0] == "Chromosome":
+			continue
+		chrom = bychrom.setdefault(items[0], ([], []))
+		chrom[0].append(int(items[1]))
+		chrom[1].append(float(items[3]))
+	reader.close()
+
+	ratios = {}
+	for chrom in bychrom:
+		pos = np.array(bychrom[chrom][0], dtype=np.int64)
+		order = np.argsort(pos, kind='mergesort')
+		ratios[chrom] = (pos[order], np.array(bychrom[chrom][1], dtype=np.float32)[order])
+	return ratios
+
+class RatioTrack:
+	"""Binary FREEC ratio track: per chromosome a position array and a float32 ratio matrix (positions x samples), memory-mapped"""
+
+	def __init__(self, trackdir):
+		self.trackdir = trackdir
+		with open(os.path.join(trackdir, "index.json"), 'r') as infile:
+			index = json.load(infile)
+		self.samples = index["samples"]
+		self.chroms = index["chroms"]
+		self.positions = {}
+		self.ratios = {}
+
+	def load(self, chrom):
+		if chrom not in self.positions:
+			self.positions[chrom] = np.load(os.path.join(self.trackdir, chrom+".pos.npy"), mmap_mode='r')
+			self.ratios[chrom] = np.load(os.path.join(self.trackdir, chrom+".ratios.npy"), mmap_mode='r')
+
+	def window(self, chrom, start, stop):
+		# positions within [start, stop] and their ratios for all samples, NaN where a sample has no ratio
+		if chrom not in self.chroms:
+			return np.zeros(0, dtype=np.int64), np.zeros((0, len(self.samples)), dtype=np.float32)
+		self.load(chrom)
+		lo = np.searchsorted(self.positions[chrom], start, side='left')
+		hi = np.searchsorted(self.positions[chrom], stop, side='right')
+		return self.positions[chrom][lo:hi], self.ratios[chrom][lo:hi]
+
+	def window_rows(self, chrom, start, stop):
+		positions, ratios = self.window(chrom, start, stop)
+		return [chrom+"\t"+str(p)+"\t"+"\t".join(["NA" if np.isnan(r) else "%g"%(r) for r in row]) for p, row in zip(positions, ratios)]
+
+def build_ratio_track(rats, samplenames, trackdir):
+	# one-time conversion of the text ratio files, positions are the union over all samples
+	if not os.path.exists(trackdir):
+		os.makedirs(trackdir)
+
+	allratios = [read_ratios(rat) for rat in rats]
+	chroms = sorted(set([chrom for ratios in allratios for chrom in ratios]))
+	for chrom in chroms:
+		pos = np.unique(np.concatenate([ratios[chrom][0] for ratios in allratios if chrom in ratios]))
+		matrix = np.full((len(pos), len(rats)), np.nan, dtype=np.float32)
+		for j, ratios in enumerate(allratios):
+			if chrom in ratios:
+				matrix[np.searchsorted(pos, ratios[chrom][0]), j] = ratios[chrom][1]
+		np.save(os.path.join(trackdir, chrom+".pos.npy"), pos)
+		np.save(os.path.join(trackdir, chrom+".ratios.npy"), matrix)
+
+	# index is written last, an interrupted conversion is not used
+	with open(os.path.join(trackdir, "index.json"), 'w') as outfile:
+		json.dump({"samples":samplenames, "chroms":chroms, "files":rats, "mtimes":ratio_mtimes(rats)}, outfile)
+
+def ratio_mtimes(rats):
+	return [os.path.getmtime(rat) for rat in rats]
+
+def open_ratio_track(rats, samplenames, trackdir):
+	# (re)build the track when the samples, the ratio files or their modification times changed
+	indexfile = os.path.join(trackdir, "index.json")
+	rebuild = not os.path.exists(indexfile)
+	if not rebuild:
+		with open(indexfile, 'r') as infile:
+			index = json.load(infile)
+		rebuild = index["samples"] != samplenames or index["files"] != rats or index.get("mtimes") != ratio_mtimes(rats)
+	if rebuild:
+		print("Building ratio track %s"%(trackdir))
+		build_ratio_track(rats, samplenames, trackdir)
+	return RatioTrack(trackdir)
+
+def parse_region(region):
+	# chrom:start-stop
+	chrom, coords = region.rsplit(":", 1)
+	start, stop = coords.replace(",", "").split("-")
+	return chrom, int(start), int(stop)
+
+# -------------------------------------------------
+
+def merge_intervals(starts, ends):
+	# union of intervals, returns sorted non-overlapping starts and ends
+	order = np.argsort(starts, kind='mergesort')
+	starts = starts[order]
+	ends = ends[order]
+	reach = np.maximum.accumulate(ends)
+	new = np.ones(len(starts), dtype=bool)
+	new[1:] = starts[1:] > reach[:-1]
+	groups = np.flatnonzero(new)
+	return starts[groups], np.maximum.reduceat(ends, groups)
+
+def sweep_recurrence(controls_intervals, min_samples):
+	# controls_intervals: {control: [(chrom, start, end)]}
+	# sweep-line over all controls, returns (chrom, start, end, nr_controls) for merged segments covered by >= min_samples distinct controls
+	bychrom = {}
+	for control in controls_intervals:
+		percontrol = {}
+		for chrom, start, end in controls_intervals[control]:
+			percontrol.setdefault(chrom, []).append((start, end))
+		for chrom in percontrol:
+			arr = np.array(percontrol[chrom], dtype=np.int64).reshape(-1, 2)
+			# intervals of one control are merged first, so every control counts once
+			bychrom.setdefault(chrom, []).append(merge_intervals(arr[:,0], arr[:,1]))
+
+	segments = []
+	for chrom in sorted(bychrom):
+		starts = np.concatenate([merged[0] for merged in bychrom[chrom]])
+		ends = np.concatenate([merged[1] for merged in bychrom[chrom]])
+		boundaries, inverse = np.unique(np.concatenate([starts, ends]), return_inverse=True)
+		delta = np.concatenate([np.ones(len(starts)), -np.ones(len(ends))])
+		# number of distinct controls on [boundaries[i], boundaries[i+1])
+		coverage = np.cumsum(np.bincount(inverse, weights=delta, minlength=len(boundaries)))[:-1].astype(np.int64)
+
+		covered = coverage >= min_samples
+		if not covered.any():
+			continue
+		edges = np.diff(np.concatenate([[0], covered.astype(np.int8), [0]]))
+		runstarts = np.flatnonzero(edges == 1)
+		runends = np.flatnonzero(edges == -1)
+		maxcov = np.maximum.reduceat(coverage, runstarts)
+		for first, last, count in zip(runstarts, runends, maxcov):
+			segments.append((chrom, int(boundaries[first]), int(boundaries[last]), int(count)))
+	return segments
+
+def build_panel(controlfiles, panelfile, min_samples):
+	# control recurrence map, parsed control files are cached next to the panel so added controls are read incrementally
+	if os.path.dirname(panelfile) and not os.path.exists(os.path.dirname(panelfile)):
+		os.makedirs(os.path.dirname(panelfile))
+	cachefile = panelfile+".controls.json"
+	cache = {}
+	if os.path.exists(cachefile):
+		with open(cachefile, 'r') as infile:
+			cache = json.load(infile)
+
+	controls_intervals = {}
+	changed = False
+	for controlfile in controlfiles:
+		control = os.path.basename(controlfile).replace("_CNVs.txt", "")
+		mtime = os.path.getmtime(controlfile)
+		if control not in cache or cache[control]["mtime"] != mtime:
+			print("Adding control %s"%(control))
+			cache[control] = {"mtime":mtime, "intervals":read_bed(controlfile)[1]}
+			changed = True
+		controls_intervals[control] = cache[control]["intervals"]
+
+	if changed:
+		with open(cachefile, 'w') as outfile:
+			json.dump(cache, outfile)
+
+	segments = sweep_recurrence(controls_intervals, min_samples)
+
+	writer = open(panelfile, 'w')
+	for segment in segments:
+		writer.write("%s\t%i\t%i\t%i\n"%segment)
+	writer.close()
+	print("Wrote %i recurrent control CNV segments from %i controls to %s"%(len(segments), len(controls_intervals), panelfile))
+
+# -------------------------------------------------
+
+def add_sample(samples, sample, condition, cnvfile):
 	if (sample not in samples):
 		samples[sample] = {"control":False, "derivatives":[]}
 	#print sample, condition
@@ -27,72 +275,151 @@ for cnvfile in filenames:
 	else:
 		samples[sample]["derivatives"].append(cnvfile)
 
-#print(samples)
-
-
-
-# filter CNVs
-outfiles = {}
-for sample in samples:
-	if not samples[sample]["control"]:
-		continue
-	
-	cont = samples[sample]["control"]
-	for test in samples[sample]["derivatives"]:
-		out = test.replace("_CNVs.txt", "_CNVs.filtered.txt")
-		os.system("bedtools intersect -a %s -b overlapmap/ALL_Controls_multisample_merged_CNVs.bed -v | bedtools intersect -a stdin -b %s -v | awk '{if(($3-$2)>50000) print}' > %s" %(test, cont, out))
-		outfiles[out] = sample
-
-wind_size = 50000
-regions = []
-
-rats = [i.replace("_CNVs.txt","_ratio.txt") for i in filenames]
-samplenames = [i.replace("_CNVs.txt","") for i in filenames]
+def split_cnv_name(cnvfile):
+	# SAMPLE_CONDITION_CNVs.txt, returns (sample, condition) or None for other file names
+	items = os.path.basename(cnvfile).split("_", 2)
+	if len(items) < 3:
+		sys.stderr.write("WARNING:\tskipping "+cnvfile+", the name is not SAMPLE_CONDITION_CNVs.txt\n")
+		return None
+	return items[0], items[1]
+
+def find_samples(filenames):
+	samples = {}
+	for cnvfile in filenames:
+		name = split_cnv_name(cnvfile)
+		if name:
+			add_sample(samples, name[0], name[1], cnvfile)
+	return samples
+
+def read_sample_sheet(sheetfile):
+	# tab delimited: sample, condition, CNV file and optionally the ratio file, BULK/BLOOD conditions are the controls
+	samples = {}
+	filenames = []
+	ratiofiles = []
+	reader = open(sheetfile,'r')
+	for line in reader:
+		items = line.strip().split('\t')
+		if line.startswith("#") or len(items) < 3 or items[0].lower() == "sample":
+			continue
+		sample, condition, cnvfile = items[:3]
+		add_sample(samples, sample, condition, cnvfile)
+		filenames.append(cnvfile)
+		ratiofiles.append(items[3] if len(items) > 3 else cnvfile.replace("_CNVs.txt","_ratio.txt"))
+	reader.close()
+	return samples, filenames, ratiofiles
+
+def filter_group(arguments):
+	# runs in a worker process, filters all derivatives of one sample against the panel and its control
+	sample, control, derivatives, panelfile, resultdir = arguments
+	panel = IntervalSet(read_bed(panelfile)[1])
+	cont = IntervalSet(read_bed(control)[1])
+
+	outfiles = {}
+	for test in derivatives:
+		out = os.path.join(resultdir, os.path.basename(test).replace("_CNVs.txt", "_CNVs.filtered.txt"))
+		outfiles[out] = filter_cnvs(test, [panel, cont], out)
+	return outfiles
+
+def merge_windows(regions):
+	# windows around all regions, overlapping windows are merged so ratio rows are written once
+	bychrom = {}
+	for chrom, start, stop in regions:
+		bychrom.setdefault(chrom, []).append((max(0, start-wind_size), stop+wind_size+1))
+
+	windows = []
+	for chrom in sorted(bychrom):
+		arr = np.array(bychrom[chrom], dtype=np.int64).reshape(-1, 2)
+		starts, ends = merge_intervals(arr[:,0], arr[:,1])
+		windows.extend([(chrom, int(start), int(end)-1) for start, end in zip(starts, ends)])
+	return windows
+
+def main(args):
+	if args.sample_sheet:
+		samples, filenames, rats = read_sample_sheet(args.sample_sheet)
+	else:
+		# files that are not named SAMPLE_CONDITION_CNVs.txt are skipped, also for the ratio track
+		filenames = [cnvfile for cnvfile in sorted(glob.glob("*_CNVs.txt")) if split_cnv_name(cnvfile)]
+		samples = find_samples(filenames)
+		rats = [i.replace("_CNVs.txt","_ratio.txt") for i in filenames]
+	#print(samples)
+
+	for directory in [args.outdir, os.path.dirname(args.ratios_out)]:
+		if directory and not os.path.exists(directory):
+			os.makedirs(directory)
+
+	# filter CNVs, one job per sample group
+	jobs = [(sample, samples[sample]["control"], samples[sample]["derivatives"], args.panel, args.outdir) for sample in sorted(samples) if samples[sample]["control"]]
+	if args.threads > 1 and len(jobs) > 1:
+		pool = mp.Pool(args.threads)
+		results = pool.map(filter_group, jobs)
+		pool.close()
+		pool.join()
+	else:
+		results = [filter_group(job) for job in jobs]
 
+	regions = set()
+	for outfiles in results:
+		for out in outfiles:
+			regions.update(outfiles[out])
 
-cnvout = "ratios/All_CNVs_merged_ratios.txt"
-writer = open(cnvout,'w')
-writer.write("Chr\tPos\t"+'\t'.join(samplenames)+"\n")
-writer.close()
+	samplenames = [os.path.basename(i).replace("_CNVs.txt","") for i in filenames]
 
-# gather plot data
-for out in outfiles:
-	reader = open(out,'r')
-	#sample = outfiles[out]
+	# every ratio file is read once, into the binary track
+	track = open_ratio_track(rats, samplenames, args.track)
 
-	for region in reader:
-		chrom,start,stop,cn,typ = region.strip().split('\t')
-		reg = chrom+":"+start+stop
-		if reg in regions:
-			continue
+	writer = open(args.ratios_out,'w')
+	writer.write("Chr\tPos\t"+'\t'.join(samplenames)+"\n")
 
-		regions.append(reg)
+	# gather plot data
+	for chrom, start, stop in merge_windows(regions):
+		rows = track.window_rows(chrom, start, stop)
+		if rows:
+			writer.write("\n".join(rows)+"\n")
 
-		start = max(0,str(int(start)-wind_size))
-		stop  = str(int(stop) +wind_size)
-		
+	writer.close()
 
-		contfile = samples[sample]["control"].replace("_CNVs.txt","_ratio.txt")
-		paster = "paste <(awk '{if($1==%s && $2>=%s && $2<=%s) print}' %s | cut -f 1-2,4)"%(chrom,start,stop, rats[0])
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = 'Filter FREEC CNV calls against controls and gather ratios around the remaining CNVs')
+	parser.add_argument('--track', help = "directory of the binary ratio track (default: OUTDIR/%s)"%(trackdir))
+	parser.add_argument('--region', help = "print the ratios of all samples in chrom:start-stop from the ratio track and exit")
+	parser.add_argument('--panel', help = "BED file with recurrent control CNVs to filter against", default = panelmap)
+	parser.add_argument('--build_panel', help = "(re)build the --panel BED from the control (BULK/BLOOD) CNV files and exit", action = "store_true")
+	parser.add_argument('--controls', help = "glob of CNV files to build the panel from, only BULK/BLOOD files are used", default = "*_CNVs.txt")
+	parser.add_argument('--min_samples', help = "minimum number of distinct controls for a segment in the panel", type = int, default = 2)
+	parser.add_argument('--sample_sheet', help = "tab delimited sample sheet (sample, condition, CNV file, optional ratio file) instead of the *_CNVs.txt files in the working directory")
+	parser.add_argument('--outdir', help = "directory for the filtered CNV files, the ratio track and the merged ratios", default = outdir)
+	parser.add_argument('--ratios_out', help = "file for the merged ratios around the filtered CNVs (default: OUTDIR/%s)"%(cnvout))
+	parser.add_argument('--threads', help = "number of sample groups to filter simultaneously", type = int, default = 1)
+	args = parser.parse_args()
+	if not args.track:
+		args.track = os.path.join(args.outdir, trackdir)
+	if not args.ratios_out:
+		args.ratios_out = os.path.join(args.outdir, cnvout)
 
-		for test in rats[1:]:
-			scommand = " <(awk '{if($1==%s && $2>=%s && $2<=%s) print}' %s | cut -f 4)"%(chrom,start,stop, test)
-			paster += scommand
+	if args.build_panel:
+		controlfiles = []
+		for controlfile in sorted(glob.glob(args.controls)):
+			name = split_cnv_name(controlfile)
+			if name and name[1] in controls:
+				controlfiles.append(controlfile)
+		build_panel(controlfiles, args.panel, args.min_samples)
+		sys.exit(0)
 
-		paster+=" >> "+cnvout
-		
-		paster = paster.replace("$","\\$")
-		cmd = "/bin/bash -c \""+paster+"\""
-		os.system(cmd)
+	if args.region:
+		track = RatioTrack(args.track)
+		print("Chr\tPos\t"+'\t'.join(track.samples))
+		for row in track.window_rows(*parse_region(args.region)):
+			print(row)
+		sys.exit(0)
 
-os.system("mv *_CNVs.filtered.txt results/")
+	main(args)
 
 
 
 
 
 
-# Log for generation of reference map 
+# Log for generation of reference map, replaced by --build_panel
 """
 cat *_BULK_CNVs.txt > ALL_Controls_CNVs.bed
 cat *_BLOOD_CNVs.txt >> ALL_Controls_CNVs.bed
@@ -2,49 +2,100 @@
 #fix freebayes header
 import os
 import glob
+import shutil
+import subprocess
+import tempfile
+import multiprocessing as mp
 from optparse import OptionParser
 # -------------------------------------------------
 parser = OptionParser()
 parser.add_option("--vcfdir",	dest="vcfdir",		help="Path to directory containing VCF files",		default=False)
+parser.add_option("--outdir",	dest="outdir",		help="Path to directory to write fixed VCF files to",	default="fixed")
+parser.add_option("--t",	dest="nr_cpus",		help="Number of VCF files to fix simultaneously",	default=4)
+parser.add_option("--compress",	dest="compress",	help="Write bgzipped and tabix indexed VCF files",	default=False, action="store_true")
+parser.add_option("--bgzip",	dest="bgzip",		help="Path to bgzip binary",				default="bgzip")
+parser.add_option("--tabix",	dest="tabix",		help="Path to tabix binary",				default="tabix")
 (options, args) = parser.parse_args()
 # -------------------------------------------------
 
 SAMPLEHEADER="#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO	FORMAT	%s	%s\n"
+COPY_BLOCK_SIZE=16*1024*1024
 
 # -------------------------------------------------
 
-# CHECK AND GENERATE GZ AND TBI
+# REWRITE THE HEADER, COPY THE BODY IN BLOCKS
 def fix_header(vcffile):
-	freader = open(vcffile, 'r')
-	fwriter = open(vcffile.replace(".vcf","_fixed.vcf"), 'w')
-
-	samples = []
-	header = False
-	for line in freader:
-		if line.startswith("##"):
-			fwriter.write(line)
-			if line.startswith("##commandline="):
-				##commandline="/home/cog/pprins/run6/bin/freebayes -f /hpc/cog_bioinf/GENOMES/human_GATK_GRCh37/GRCh37_gatk.fasta -C 3 -t /hpc/cog_bioinf/ENRICH/kinome_design_SS_V2_110811.bed --pooled-discrete --genotype-qualities --min-coverage 5 --no-indels --no-mnps --no-complex /home/cog/pprins/run6/data/freebayes/merged_MBC019R_F3_20130528_rmdup_kinome_design_SS_V2_110811.bam /home/cog/pprins/run6/data/freebayes/merged_MBC019T_F3_20130528_rmdup_kinome_design_SS_V2_110811.bam""
-				items = line.strip().split(" ")[-2:]
-				#print items
-				samples = [k.split("_")[1] for k in items]
-				#print samples
-		elif not header:
-			fwriter.write(SAMPLEHEADER%(samples[0], samples[1]))
-			header=True
-		else:
-			fwriter.write(line)
-
-	freader.close()
-	fwriter.close()
+	outfile = os.path.join(options.outdir, os.path.basename(vcffile).replace(".vcf","_fixed.vcf"))
+	if options.compress:
+		outfile += ".gz"
+
+	freader = open(vcffile, 'rb')
+	# write to a temporary file in the output folder, renamed when complete
+	tmpfd, tmpfile = tempfile.mkstemp(dir=options.outdir, prefix=".tmp_")
+	fwriter = os.fdopen(tmpfd, 'wb')
+
+	bgzipper = None
+	try:
+		out = fwriter
+		if options.compress:
+			bgzipper = subprocess.Popen([options.bgzip, "-c"], stdin=subprocess.PIPE, stdout=fwriter)
+			out = bgzipper.stdin
+
+		samples = []
+		while True:
+			line = freader.readline()
+			if not line:
+				break
+			if line.startswith("##"):
+				out.write(line)
+				if line.startswith("##commandline="):
+					##commandline="/home/cog/pprins/run6/bin/freebayes -f /hpc/cog_bioinf/GENOMES/human_GATK_GRCh37/GRCh37_gatk.fasta -C 3 -t /hpc/cog_bioinf/ENRICH/kinome_design_SS_V2_110811.bed --pooled-discrete --genotype-qualities --min-coverage 5 --no-indels --no-mnps --no-complex /home/cog/pprins/run6/data/freebayes/merged_MBC019R_F3_20130528_rmdup_kinome_design_SS_V2_110811.bam /home/cog/pprins/run6/data/freebayes/merged_MBC019T_F3_20130528_rmdup_kinome_design_SS_V2_110811.bam""
+					items = line.strip().split(" ")[-2:]
+					#print items
+					samples = [k.split("_")[1] for k in items]
+					#print samples
+			else:
+				out.write(SAMPLEHEADER%(samples[0], samples[1]))
+				break
+
+		# rest of the file is copied unchanged
+		shutil.copyfileobj(freader, out, COPY_BLOCK_SIZE)
+
+		if bgzipper:
+			out.close()
+			if bgzipper.wait() != 0:
+				raise IOError("bgzip failed on %s"%(vcffile))
+		fwriter.close()
+		os.chmod(tmpfile, 0644)
+		os.rename(tmpfile, outfile)
+	except:
+		# no partial output is left behind, the error is passed on to the main process
+		if bgzipper and bgzipper.poll() is None:
+			bgzipper.kill()
+			bgzipper.wait()
+		fwriter.close()
+		if os.path.exists(tmpfile):
+			os.remove(tmpfile)
+		raise
+	finally:
+		freader.close()
+
+	if options.compress:
+		# the error is passed on to the main process, like a failing rewrite
+		if subprocess.call([options.tabix, "-f", "-p", "vcf", outfile]) != 0:
+			raise IOError("tabix could not index %s"%(outfile))
+	return(outfile)
 
 # -------------------------------------------------
 
-file_list = glob.glob(os.path.join(options.vcfdir, "*.vcf"))
-for vcf_file in file_list:
-	fix_header(vcf_file)
+if not os.path.exists(options.outdir):
+	os.makedirs(options.outdir)
 
-os.system("mkdir fixed")
-os.system("mv *_fixed.vcf fixed")
+file_list = glob.glob(os.path.join(options.vcfdir, "*.vcf"))
+pool = mp.Pool(int(options.nr_cpus))
+for fixed in pool.imap_unordered(fix_header, file_list):
+	print(fixed)
+pool.close()
+pool.join()
 
 # -------------------------------------------------
@@ -3,6 +3,9 @@ import json
 import os.path
 import csv
 import argparse
+import sqlite3
+import time
+from multiprocessing.pool import ThreadPool
 
 import seaborn as sns
 import struct
@@ -27,7 +30,13 @@ colors = {"nodata":"#ffffff","pos":"#1f78b4","neg":"#a6cee3","test":"#b2df8a", "
 parser = argparse.ArgumentParser(description='Convert and MAP IDs across species to one KEGG map')
 parser.add_argument('-i', '--input',   type=str, help='input json data file')
 parser.add_argument('-o', '--outdir',  type=str, help='output directory')
-parser.add_argument('-p', '--pathway', type=str, help='pathway to map to')
+parser.add_argument('-p', '--pathway', type=str, help='pathway(s) to map to, comma separated, or "all" for all human pathways')
+parser.add_argument('-l', '--pathway_list', type=str, help='file with one pathway per line to map to')
+parser.add_argument('-c', '--cache',   type=str, help='sqlite file to cache Ensembl/KEGG responses in, shared across runs (default: OUTDIR/ensembl_cache.sqlite)')
+parser.add_argument('--offline',       type=str, help='tab delimited ortholog table (species, symbol, id, ortholog_species, ortholog_id) to use instead of the Ensembl REST API')
+parser.add_argument('--kegg_table',    type=str, help='tab delimited KEGG table (pathway, kegg_id, entry) to use instead of the KEGG REST API')
+parser.add_argument('--missing_days',  type=float, default=7, help='days to remember IDs that Ensembl/KEGG did not find, 0 to always ask again (default: 7)')
+parser.add_argument('-t', '--threads', type=int, default=4, help='maximum number of simultaneous REST requests')
 
 args = parser.parse_args()
 print("-"*60)
@@ -37,50 +46,235 @@ print("-"*60)
 # ------------------------------------------------------------------------
 # ------------------------------------------------------------------------
 # RESTfull functions
-def generic_json_request_handler(server, ext):
-    r = requests.get(server+ext, headers={ "Content-Type" : "application/json"})
-    if not r.ok:
-        r.raise_for_status()
-        sys.exit()
-
-    return(r.json())
+ENSEMBL_SERVER = "https://rest.ensembl.org"
+KEGG_SERVER = "http://togows.org"
+KEGG_LIST_SERVER = "http://rest.kegg.jp"
+ENSEMBL_POST_MAX = 1000 # maximum number of IDs per Ensembl POST request
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+class OrthologResolver:
+    """Resolves symbols, orthologues and KEGG genes in batches, through a cache shared across runs.
+    With an offline ortholog/KEGG table no REST requests are done at all, and the table is used instead of the cache."""
+
+    def __init__(self, cachefile=None, offline=None, keggtable=None, threads=4, retries=5, backoff=1.0, missing_days=7):
+        self.threads = threads
+        self.retries = retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=threads)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # KEY-VALUE cache of REST responses, IDs that were not found are kept with a timestamp and asked again after missing_days
+        self.cache = sqlite3.connect(cachefile if cachefile else ":memory:")
+        self.cache.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT)")
+        self.cache.execute("CREATE TABLE IF NOT EXISTS missing (key TEXT PRIMARY KEY, stored REAL)")
+        self.missing_age = missing_days*24*3600
+
+        self.offline = None
+        if offline:
+            self.offline = self.read_ortholog_table(offline)
+        self.keggtable = None
+        if keggtable:
+            self.keggtable = self.read_kegg_table(keggtable)
+
+    # --------------------------------------------------------------------
+    # local stand-ins for the REST API
+    def read_ortholog_table(self, tablefile):
+        table = {"symbols":{}, "homologies":{}}
+        with open(tablefile, 'r') as infile:
+            for row in csv.DictReader(infile, delimiter='\t'):
+                table["symbols"].setdefault(row["species"], {})[row["symbol"]] = {"id":row["id"], "display_name":row["symbol"], "species":row["species"]}
+                homologies = table["homologies"].setdefault(row["id"], [])
+                if row["ortholog_id"]:
+                    homologies.append({"id":row["ortholog_id"], "species":row["ortholog_species"], "type":"ortholog"})
+        return(table)
+
+    def read_kegg_table(self, tablefile):
+        table = {}
+        with open(tablefile, 'r') as infile:
+            for row in csv.DictReader(infile, delimiter='\t'):
+                table.setdefault(row["pathway"], {})[row["kegg_id"]] = row["entry"]
+        return(table)
+
+    # --------------------------------------------------------------------
+    # cache handling, only done from the main thread
+    def cache_get(self, keys):
+        found = {}
+        expired = time.time() - self.missing_age
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i+500]
+            query = "SELECT key, value FROM responses WHERE key IN (%s)"%(",".join("?"*len(chunk)))
+            for key, value in self.cache.execute(query, chunk):
+                found[key] = json.loads(value)
+            query = "SELECT key FROM missing WHERE stored > ? AND key IN (%s)"%(",".join("?"*len(chunk)))
+            for (key,) in self.cache.execute(query, [expired]+chunk):
+                found.setdefault(key, None)
+        return(found)
+
+    def cache_put(self, items):
+        self.cache.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?)", [(key, json.dumps(value)) for key, value in items.items() if value is not None])
+        if self.missing_age > 0:
+            now = time.time()
+            self.cache.executemany("INSERT OR REPLACE INTO missing VALUES (?, ?)", [(key, now) for key, value in items.items() if value is None])
+        self.cache.commit()
+
+    def cached(self, keys, fetch, local=False):
+        # fetch is called once with all keys that are not yet in the cache and returns {key:value}
+        # local (offline table) lookups are cheap and never mixed with the REST responses in the cache
+        keys = list(dict.fromkeys(keys))
+        found = {} if local else self.cache_get(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            fetched = fetch(missing)
+            for key in missing:
+                fetched.setdefault(key, None)
+            if not local:
+                self.cache_put(fetched)
+            found.update(fetched)
+        return(found)
+
+    # --------------------------------------------------------------------
+    # REST requests with retry/backoff
+    def request(self, method, url, decode=True, **kwargs):
+        for attempt in range(0, self.retries+1):
+            try:
+                r = self.session.request(method, url, timeout=60, **kwargs)
+            except requests.exceptions.ConnectionError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff*(2**attempt))
+                continue
+
+            if r.status_code in RETRY_STATUS and attempt < self.retries:
+                wait = self.backoff*(2**attempt)
+                if "Retry-After" in r.headers:
+                    wait = max(wait, float(r.headers["Retry-After"]))
+                time.sleep(wait)
+                continue
+
+            # Ensembl returns 400 for unknown IDs/symbols
+            if r.status_code in [400, 404]:
+                return(None)
+            r.raise_for_status()
+            if not decode:
+                return(r.text)
+            return(r.json())
+
+    def parallel_get(self, urls):
+        pool = ThreadPool(min(self.threads, len(urls)))
+        results = pool.map(lambda url: self.request("GET", url, headers={"Content-Type":"application/json"}), urls)
+        pool.close()
+        pool.join()
+        return(results)
+
+    # --------------------------------------------------------------------
+    def find_symbols(self, symbols, species):
+        keys = ["symbol:%s:%s"%(species, symbol) for symbol in symbols]
+
+        def fetch(missing):
+            misssymbols = [key.split(":", 2)[2] for key in missing]
+            if self.offline is not None:
+                found = self.offline["symbols"].get(species, {})
+                return({"symbol:%s:%s"%(species, symbol):found.get(symbol) for symbol in misssymbols})
+
+            fetched = {}
+            chunks = [misssymbols[i:i+ENSEMBL_POST_MAX] for i in range(0, len(misssymbols), ENSEMBL_POST_MAX)]
+            pool = ThreadPool(min(self.threads, len(chunks)))
+            headers = {"Content-Type":"application/json", "Accept":"application/json"}
+            decoded = pool.map(lambda chunk: self.request("POST", ENSEMBL_SERVER+"/lookup/symbol/"+species, headers=headers, data=json.dumps({"symbols":chunk})), chunks)
+            pool.close()
+            pool.join()
+            for result in decoded:
+                for symbol in (result or {}):
+                    fetched["symbol:%s:%s"%(species, symbol)] = result[symbol]
+            return(fetched)
+
+        found = self.cached(keys, fetch, self.offline is not None)
+        return({symbol:found[key] for symbol, key in zip(symbols, keys) if found[key] is not None})
+
+    def get_ens_orthologues(self, ensids):
+        keys = ["homology:%s"%(ensid) for ensid in ensids]
+
+        def fetch(missing):
+            missids = [key.split(":", 1)[1] for key in missing]
+            if self.offline is not None:
+                return({"homology:%s"%(ensid):{"id":ensid, "homologies":self.offline["homologies"][ensid]} for ensid in missids if ensid in self.offline["homologies"]})
+
+            urls = [ENSEMBL_SERVER+"/homology/id/"+ensid+"?format=condensed;type=orthologues" for ensid in missids]
+            results = self.parallel_get(urls)
+            return({"homology:%s"%(ensid):result['data'][0] for ensid, result in zip(missids, results) if result and result['data']})
+
+        found = self.cached(keys, fetch, self.offline is not None)
+        return({ensid:found[key] for ensid, key in zip(ensids, keys) if found[key] is not None})
+
+    def get_sym_orthologues(self, symbols, species):
+        keys = ["symhomology:%s:%s"%(species, symbol) for symbol in symbols]
+
+        def fetch(missing):
+            misssymbols = [key.split(":", 2)[2] for key in missing]
+            if self.offline is not None:
+                fetched = {}
+                for symbol in misssymbols:
+                    mapping = self.offline["symbols"].get(species, {}).get(symbol)
+                    if mapping is not None:
+                        fetched["symhomology:%s:%s"%(species, symbol)] = {"id":mapping["id"], "homologies":self.offline["homologies"].get(mapping["id"], [])}
+                return(fetched)
+
+            urls = [ENSEMBL_SERVER+"/homology/symbol/"+species+"/"+symbol+"?format=condensed;type=orthologues" for symbol in misssymbols]
+            results = self.parallel_get(urls)
+            return({"symhomology:%s:%s"%(species, symbol):result['data'][0] for symbol, result in zip(misssymbols, results) if result and result['data']})
+
+        found = self.cached(keys, fetch, self.offline is not None)
+        return({symbol:found[key] for symbol, key in zip(symbols, keys) if found[key] is not None})
+
+    def get_kegg_genes(self, pathways):
+        keys = ["kegg:%s"%(pathway) for pathway in pathways]
+
+        def fetch(missing):
+            misspathways = [key.split(":", 1)[1] for key in missing]
+            if self.keggtable is not None:
+                return({"kegg:%s"%(pathway):self.keggtable.get(pathway) for pathway in misspathways})
+            urls = [KEGG_SERVER+"/entry/kegg-pathway/"+pathway+"/genes.json" for pathway in misspathways]
+            results = self.parallel_get(urls)
+            return({"kegg:%s"%(pathway):result[0] for pathway, result in zip(misspathways, results) if result})
+
+        found = self.cached(keys, fetch, self.keggtable is not None)
+        for pathway, key in zip(pathways, keys):
+            if found[key] is None:
+                sys.exit("[ERROR] no genes found for pathway %s"%(pathway))
+        return({pathway:found[key] for pathway, key in zip(pathways, keys)})
+
+    def get_kegg_pathways(self, species):
+        # ALL pathways of a species, e.g. hsa00010 for homo_sapiens
+        key = "keggpathways:%s"%(keggmap[species])
+
+        def fetch(missing):
+            if self.keggtable is not None:
+                return({key:sorted(pathway for pathway in self.keggtable if pathway.startswith(keggmap[species]))})
+            result = self.request("GET", KEGG_LIST_SERVER+"/list/pathway/"+keggmap[species], decode=False)
+            if not result:
+                return({})
+            return({key:[line.split("\t")[0].replace("path:", "") for line in result.strip().split("\n")]})
+
+        return(self.cached([key], fetch, self.keggtable is not None)[key] or [])
 
+# ------------------------------------------------------------------------
+# single ID functions, all requests go through the shared resolver
 def get_kegg_genes(pathway):
     #if args.debug:
     #    print("Parsing pathway: "+pathway)
-    server="http://togows.org"
-    ext="/entry/kegg-pathway/"+pathway+"/genes.json"
-    return(generic_json_request_handler(server, ext)[0])
+    return(RESOLVER.get_kegg_genes([pathway])[pathway])
 
 def get_ens_orthologues(ensid):
-    server = "https://rest.ensembl.org"
-    ext = "/homology/id/"+ensid+"?format=condensed;type=orthologues"
-    return(generic_json_request_handler(server, ext)['data'][0])
-
-def map_ens_to_species(ensid, targettaxon):
-    server = "https://rest.ensembl.org"
-    ext = "/homology/id/"+ensid+"?format=condensed;type=orthologues;target_taxon="+targettaxon
-    return(generic_json_request_handler(server, ext)['data'][0])
+    return(RESOLVER.get_ens_orthologues([ensid]).get(ensid))
 
 def get_sym_orthologues(symbol, species):
-    server="https://rest.ensembl.org"
-    ext="/homology/symbol/"+species+"/"+symbol+"?format=condensed;type=orthologues"
-    return(generic_json_request_handler(server, ext)['data'][0])
+    return(RESOLVER.get_sym_orthologues([symbol], species).get(symbol))
 
 def find_symbols(symbols, species):
-    server = "https://rest.ensembl.org"
-    ext = "/lookup/symbol/"+species
-    headers={ "Content-Type" : "application/json", "Accept" : "application/json"}
-
-    # requires slightly more formatting of the list
-    r = requests.post(server+ext, headers=headers, data='{ "symbols" : ["'+'", "'.join(symbols)+'" ] }')
-    #print('{ "symbols" : ["'+'", "'.join(symbols)+'" ] }')
-    if not r.ok:
-      r.raise_for_status()
-      sys.exit()
-
-    decoded = r.json()
-    return(decoded)
+    return(RESOLVER.find_symbols(list(symbols), species))
 # ------------------------------------------------------------------------
 # ------------------------------------------------------------------------
 def parse_kegg_genes(species, jsondata):
@@ -90,16 +284,19 @@ def parse_kegg_genes(species, jsondata):
         decoded[hgcn] = {}
         decoded[hgcn]["KEGG"]=keggmap[species]+":"+kid
 
-    mappings = find_symbols(decoded.keys(), species)
+    # ALL lookups are done in batches
+    mappings = RESOLVER.find_symbols(list(decoded.keys()), species)
+    orthologues = RESOLVER.get_ens_orthologues([mappings[gene]['id'] for gene in mappings])
     for gene in mappings:
         decoded[gene]["mapping"] = mappings[gene]
-        decoded[gene]["orthologues"] = get_ens_orthologues(mappings[gene]['id'])
+        if mappings[gene]['id'] in orthologues:
+            decoded[gene]["orthologues"] = orthologues[mappings[gene]['id']]
 
-    for hgcn in decoded:
-        # NOT found through lookup let's try something else
-        if hgcn not in mappings:
-            decoded[hgcn]["orthologues"] = get_sym_orthologues(hgcn, species)
-            decoded[hgcn]['id'] = decoded[hgcn]["orthologues"]['id']
+    # NOT found through lookup let's try something else
+    symorthologues = RESOLVER.get_sym_orthologues([hgcn for hgcn in decoded if hgcn not in mappings], species)
+    for hgcn in symorthologues:
+        decoded[hgcn]["orthologues"] = symorthologues[hgcn]
+        decoded[hgcn]['id'] = decoded[hgcn]["orthologues"]['id']
 
     # REPORT incomplete genes
     for i in decoded:
@@ -108,17 +305,72 @@ def parse_kegg_genes(species, jsondata):
 
     return(decoded)
 # ------------------------------------------------------------------------
-def fill_kegg_colors(genedata, fulldata, colors):
-    # INIT colors
-    keggcolors = {fulldata[i]["KEGG"]:{} for i in fulldata}
+def compact_gene(genedata):
+    # ONLY the fields needed for coloring are kept in the shared gene store
+    compact = {"KEGG":genedata["KEGG"]}
+    if 'orthologues' in genedata:
+        compact["orthologues"] = {"homologies":[{"id":homology["id"]} for homology in genedata["orthologues"]["homologies"]]}
+    return(compact)
+# ------------------------------------------------------------------------
+def load_gene_store(species, pathways, storefile):
+    # SHARED store of all pathway genes, each gene is resolved once for all pathways
+    store = {"pathways":{}, "genes":{}}
+    if os.path.isfile(storefile):
+        with open(storefile, 'r') as data_file:
+            store = json.load(data_file)
+
+    newpathways = [pathway for pathway in pathways if pathway not in store["pathways"]]
+    if newpathways:
+        keggdata = RESOLVER.get_kegg_genes(newpathways)
+        # DEDUPLICATE genes across pathways
+        newgenes = {}
+        for pathway in newpathways:
+            store["pathways"][pathway] = []
+            for kid in keggdata[pathway]:
+                hgcn = keggdata[pathway][kid].split(";")[0]
+                store["pathways"][pathway].append(hgcn)
+                if hgcn not in store["genes"]:
+                    newgenes[kid] = keggdata[pathway][kid]
+
+        print("[INFO] Resolving %i new genes for %i pathways"%(len(newgenes), len(newpathways)))
+        decoded = parse_kegg_genes(species, newgenes)
+        for hgcn in decoded:
+            store["genes"][hgcn] = compact_gene(decoded[hgcn])
+
+        with open(storefile, 'w') as outfile:
+            json.dump(store, outfile, separators=(',', ':'))
+
+    return({pathway:{hgcn:store["genes"][hgcn] for hgcn in store["pathways"][pathway] if hgcn in store["genes"]} for pathway in pathways})
+# ------------------------------------------------------------------------
+def build_kegg_index(fulldata):
+    # INVERTED index from gene symbol and orthologue Ensembl ID to the KEGG IDs of a pathway
+    symbolindex = {hgcn:fulldata[hgcn]["KEGG"] for hgcn in fulldata}
+    orthoindex = {}
+    for hgcn in fulldata:
+        # SKIP IDs without ortholog information
+        if not 'orthologues' in fulldata[hgcn]:
+            continue
+        for homology in fulldata[hgcn]["orthologues"]["homologies"]:
+            orthoindex.setdefault(homology["id"], set()).add(fulldata[hgcn]["KEGG"])
+    return(symbolindex, orthoindex)
+# ------------------------------------------------------------------------
+def fill_kegg_colors(genedata, pathwaydata, colors):
+    # pathwaydata: {pathway:fulldata}, all pathways are colored in one pass over the conditions
+    indices = {pathway:build_kegg_index(pathwaydata[pathway]) for pathway in pathwaydata}
 
+    # INIT colors
+    allcolors = {}
+    for pathway in pathwaydata:
+        fulldata = pathwaydata[pathway]
+        allcolors[pathway] = {fulldata[i]["KEGG"]:{} for i in fulldata}
 
     for species in genedata:
         for condition in genedata[species]:
             # print(species+"_"+condition)
             # STORE DEFAULT VALUE
-            for keggid in keggcolors:
-                keggcolors[keggid][species+"_"+condition] = colors["nodata"]
+            for pathway in allcolors:
+                for keggid in allcolors[pathway]:
+                    allcolors[pathway][keggid][species+"_"+condition] = colors["nodata"]
 
             # Retrieve ID mapping data
             ofile = args.outdir+condition+"_mappings.json"
@@ -135,21 +387,19 @@ def fill_kegg_colors(genedata, fulldata, colors):
             print("[INFO] Finished %s"%(species+"_"+condition))
 
             # CHECK FOR GENE MATCHES
-            for agene in mappingdata:
-                # IF FULL SYMBOL MATCH
-                if agene in fulldata:
-                    keggcolors[fulldata[agene]["KEGG"]][species+"_"+condition] = colors[condition]
-                    continue
-
-                for i in fulldata:
-                    if not 'orthologues' in fulldata[i]:
-                        # SKIP IDs without ortholog information
+            for pathway in indices:
+                symbolindex, orthoindex = indices[pathway]
+                keggcolors = allcolors[pathway]
+                for agene in mappingdata:
+                    # IF FULL SYMBOL MATCH
+                    if agene in symbolindex:
+                        keggcolors[symbolindex[agene]][species+"_"+condition] = colors[condition]
                         continue
 
-                    if mappingdata[agene]['id'] in [fulldata[i]["orthologues"]["homologies"][j]["id"] for j in range(0,len( fulldata[i]["orthologues"]["homologies"]))]:
-                        keggcolors[fulldata[i]["KEGG"]][species+"_"+condition] = colors[condition]
+                    for keggid in orthoindex.get(mappingdata[agene]['id'], []):
+                        keggcolors[keggid][species+"_"+condition] = colors[condition]
 
-    return(keggcolors)
+    return(allcolors)
 # ------------------------------------------------------------------------
 def write_kegg_colors(keggcolors, outputfile):
 
@@ -177,26 +427,56 @@ def write_kegg_colors(keggcolors, outputfile):
 # ------------------------------------------------------------------------
 # ------------------------------------------------------------------------
 
-fulldata = {}
-pathwayfile = args.pathway+"_mappings.json"
+RESOLVER = OrthologResolver(args.cache if args.cache else os.path.join(args.outdir, "ensembl_cache.sqlite"), args.offline, args.kegg_table, args.threads, missing_days=args.missing_days)
+
+def load_pathway(pathway):
+    pathwaydir = os.path.join(os.sep, args.outdir, pathway)
+    pathwayfile = os.path.join(pathwaydir, pathway+"_mappings.json")
+
+    if not os.path.isfile(pathwayfile):
+        # parse all info for genes in pathway
+        fulldata = parse_kegg_genes("homo_sapiens", get_kegg_genes(pathway))
+        # store in file
+        if not os.path.isdir(pathwaydir):
+            os.makedirs(pathwaydir)
+        with open(pathwayfile, 'w') as outfile:
+            json.dump(fulldata, outfile)
+
+    else:
+        # load data from pre-generated file
+        with open(pathwayfile, 'r') as data_file:
+            fulldata = json.load(data_file)
 
-if not os.path.isfile(os.path.join(os.sep, args.outdir, args.pathway, pathwayfile)):
-    # parse all info for genes in pathway
-    fulldata = parse_kegg_genes("homo_sapiens", get_kegg_genes(args.pathway))
-    # store in file
-    with open(os.path.join(os.sep, args.outdir, args.pathway, pathwayfile), 'w') as outfile:
-        json.dump(fulldata, outfile)
+    return(fulldata)
+
+# ------------------------------------------------------------------------
+
+if args.pathway_list:
+    with open(args.pathway_list, 'r') as data_file:
+        pathways = [line.strip() for line in data_file if line.strip() and not line.startswith("#")]
+elif args.pathway == "all":
+    pathways = RESOLVER.get_kegg_pathways("homo_sapiens")
+else:
+    pathways = args.pathway.split(",")
 
+if len(pathways) == 1:
+    pathwaydata = {pathways[0]:load_pathway(pathways[0])}
 else:
-    # load data from pre-generated file
-    with open(os.path.join(os.sep, args.outdir, args.pathway, pathwayfile), 'r') as data_file:
-        fulldata = json.load(data_file)
+    # BATCH mode, genes shared between pathways are resolved once
+    pathwaydata = load_gene_store("homo_sapiens", pathways, os.path.join(args.outdir, "homo_sapiens_kegg_genes.json"))
 
 # ------------------------------------------------------------------------
 
 with open(args.input, 'r') as data_file:
     genedata = json.load(data_file)
-    keggcolors = fill_kegg_colors(genedata, fulldata, colors)
-    write_kegg_colors(keggcolors, os.path.join(os.sep, args.outdir, args.pathway, args.pathway+"_all_conditions_colors.txt"))
+    allcolors = fill_kegg_colors(genedata, pathwaydata, colors)
+    for pathway in allcolors:
+        if not allcolors[pathway]:
+            print('[WARN]'+'no genes found for pathway: %s'%(pathway))
+            continue
+        pathwaydir = os.path.join(os.sep, args.outdir, pathway)
+        if not os.path.isdir(pathwaydir):
+            os.makedirs(pathwaydir)
+        write_kegg_colors(allcolors[pathway], os.path.join(pathwaydir, pathway+"_all_conditions_colors.txt"))
 
 # ------------------------------------------------------------------------
@@ -8,6 +8,9 @@ import numpy as np
 import json
 import requests
 import pickle
+from time import time
+
+from Run_monitor import RunMonitor
 
 #GENE FORMAT
 ##chr    start    stop    name
@@ -34,6 +37,9 @@ parser.add_option("--me",       dest="mineff",     help="Minimum variant effect
 
 parser.add_option("--debug",    dest="debug",      help="Flag for debug logging",                  default=False)
 parser.add_option("--format",   dest="format",     help="VCF output format [GATK/FREEB/..]",       default="GATK")
+parser.add_option("--report",   dest="report_file", help="Path of JSON run report to write",        default=False)
+parser.add_option("--profile",  dest="profile_file", help="Path of profile to write, pyinstrument for .html/.txt when installed, cProfile statistics otherwise", default=False)
+parser.add_option("--progress", dest="progress",   help="Seconds between progress lines on stderr (0 = off)", default=30, type="float")
 (options, args) = parser.parse_args()
 # -------------------------------------------------
 
@@ -78,6 +84,8 @@ toselect = [k for k,v in vocabulary.items() if v >= float(options.mineff)]
 debug = options.debug
 DEPTH_KEY=""
 VAF_KEY=""
+# Per record events are counted instead of logged, see the run report (--report)
+monitor = None
 # -------------------------------------------------
 def check_arguments():
     global DEPTH_KEY
@@ -144,6 +152,7 @@ def find_effects(vcf_record, sample_gt):
 
         # Skip if annotation ALT allele does not match sample ALT allele
         if str(items[0]) != str(sample_gt):
+            monitor.count("ann_genotype_mismatch")
             if debug: print("SKIPPING DUE TO MISMATCHING GENOTYPE\t|{}|\t|{}|".format(items[0], sample_gt))
             continue
 
@@ -156,6 +165,7 @@ def find_effects(vcf_record, sample_gt):
                  CANONICAL_TRANSCRIPTS[gene] = get_canonical(gene)
             if debug: print("~~~\t"+items[6]+" "+gene+" "+CANONICAL_TRANSCRIPTS[gene])
             if items[6] != CANONICAL_TRANSCRIPTS[gene]:
+                monitor.count("ann_not_canonical")
                 continue
 
         allele = items[0]
@@ -163,7 +173,8 @@ def find_effects(vcf_record, sample_gt):
         for effect in effects:
             if debug: print(effect)
             if effect not in vocabulary:
-                # A NEW MUTATION EFFECT WAS FOUND
+                # A NEW MUTATION EFFECT WAS FOUND, counted per effect
+                monitor.count("new_effect:"+effect)
                 if debug:
                     print("NEW Mutation effect identified:")
                     print(pred)
@@ -219,19 +230,91 @@ def check_depth(sample_vcf):
             return(False)
     return(True)
 
-def check_vaf(sample_vcf):
+def sample_vaf(sample_vcf):
     #single depth field
     if isinstance(sample_vcf[DEPTH_KEY], int):
-        # CHECK VAF
-        if (sum(sample_vcf[VAF_KEY][1:])*1.0/sample_vcf[DEPTH_KEY]) < float(options.minvaf):
-            return(False)
+        return(sum(sample_vcf[VAF_KEY][1:])*1.0/sample_vcf[DEPTH_KEY])
     #multi depth field
-    else:
-        # CHECK VAF
-        if (sum(sample_vcf[VAF_KEY][1:])*1.0/sum(sample_vcf[DEPTH_KEY])) < float(options.minvaf):
-            return(False)
+    return(sum(sample_vcf[VAF_KEY][1:])*1.0/sum(sample_vcf[DEPTH_KEY]))
+
+def check_vaf(sample_vcf):
+    # CHECK VAF
+    if sample_vaf(sample_vcf) < float(options.minvaf):
+        return(False)
     return(True)
 
+# FILTER a VCF record for all samples, the effects and records of passing samples are appended
+# Returns 1 if the record is annotated for the gene, 0 otherwise
+def filter_record(vcf_record, thisgene, samplenames, effects, records):
+    monitor.count("records")
+    if debug: print("@@@\t {}".format(vcf_record.INFO))
+
+    if not "ANN" in vcf_record.INFO:
+        monitor.count("skipped_no_ann")
+        if debug: print("@@@\t skipping record {} due to missing ANN field".format(vcf_record))
+        return(0)
+
+    gencheck = [thisgene["SYMBOL"] in a for a in vcf_record.INFO["ANN"]]
+    if sum(gencheck) <= 0:
+        monitor.count("skipped_other_gene")
+        if debug: print("@@@\t skipping record {} due to missing GENE SYMBOL {}".format(vcf_record, thisgene["SYMBOL"]))
+        return(0)
+
+    # For each sample
+    for samplename in samplenames:
+        #CHECK IF SAMPLE GENOTYPE AVAILABLE
+        sgenot = None
+        try:
+            sgenot = vcf_record.genotype(samplename)
+        except AttributeError as e:
+            monitor.count("no_genotype")
+            continue
+
+        # FILTER NON-QC RECORDS, the first failing check is counted and the QC log is only made in debug mode
+        PASS = False
+        if debug: log = "++ {}\t{}\t{}\t{}".format(thisgene, samplename, vcf_record, sgenot['GT'])
+        # CHEK IF AD FIELD PRESENT
+        if not check_ad(sgenot):
+            monitor.count("failed_ad")
+        else:
+            if debug: log += "\tAD:PASS\tDEPTH:{}".format(sgenot[DEPTH_KEY])
+            # CHECK TOTAL COVERAGE OF IDENTIFIED ALLELLES
+            if not check_depth(sgenot):
+                monitor.count("failed_depth")
+            else:
+                if debug: log += ":PASS\tVAF:{}".format(sample_vaf(sgenot))
+                # add clean if sufficient depth is measured
+                effects[samplename].append("clean")
+                records[samplename].append(None)
+
+                # CHECK VARIANT ALLELE FREQUENCY
+                if not check_vaf(sgenot):
+                    monitor.count("failed_vaf")
+                else:
+                    if debug: log += ":PASS\tPOP:{}".format([vcf_record.INFO[rf] for rf in FREQ_FIELDS if rf in vcf_record.INFO])
+                    # CHECK POPULATION FREQUENCY
+                    if max(find_popfreq(vcf_record)) > float(options.popfreq):
+                        monitor.count("failed_popfreq")
+                    else:
+                        if debug: log += ":PASS\tMLEAF:{}".format(vcf_record.INFO["MLEAF"])
+                        # CHECK OCCURENCE IN TOTAL POOL
+                        if max(vcf_record.INFO["MLEAF"]) > float(options.cohfreq):
+                            monitor.count("failed_cohfreq")
+                        else:
+                            if debug: log += ":PASS"
+                            monitor.count("passed")
+                            PASS = True
+
+        if debug: print(log)
+        if PASS:
+            # PARSE '0/1' into ALT[0] or '0/2' into ALT[1]
+            sample_call = sgenot['GT'].replace("|","").split("/")
+            sample_gt = vcf_record.ALT[int(sample_call[-1])-1]
+
+            effects[samplename].append(find_effects(vcf_record, sample_gt))
+            records[samplename].append(vcf_record)
+    return(1)
+
 # -------------------------------------------------
 # RESTfull functions
 def generic_json_request_handler(server, ext):
@@ -275,13 +358,20 @@ def get_canonical(ensembleid):
 def main():
     global DEPTH_KEY
     global VAF_KEY
+    global monitor
+
+    monitor = RunMonitor("Make_Somatic_Mutation_Overview", interval=options.progress, report_file=options.report_file, profile_file=options.profile_file)
 
     file_list = glob.glob(os.path.join(options.vcfdir, "*.vcf"))
-    for vcf_file in file_list:
-        zip_and_index(vcf_file)
+    # ALSO use VCF files that are only available bgzipped (e.g. FixFreebayesHeader.py --compress)
+    file_list += [gz[:-3] for gz in glob.glob(os.path.join(options.vcfdir, "*.vcf.gz")) if gz[:-3] not in file_list]
+    with monitor.stage("index"):
+        for vcf_file in file_list:
+            zip_and_index(vcf_file)
 
 
     genelist=[]
+    start = time()
 
     # We only want to run this once per genelist, faster and kinder
     if not os.path.isfile(options.genelist+".pkl"):
@@ -302,6 +392,9 @@ def main():
         with open(options.genelist+".pkl", 'rb') as handle:
             genelist = pickle.load(handle)
 
+    monitor.add_time("genelist", time() - start)
+    # progress per gene and VCF file
+    monitor.total = len(genelist) * len(file_list)
     if debug: print("GENES {}".format(genelist))
 
     # DF to keep the mutation effcts per gene
@@ -339,6 +432,7 @@ def main():
 
         # FOR EACH GENE OF INTREST
         for thisgene in genelist:
+            gene_start = time()
             nr_of_positions = 0
             if len(thisgene)<=0:
                 continue
@@ -349,8 +443,10 @@ def main():
                 vcf_records = vcfread.fetch(thisgene["Chr"], int(thisgene["Start"])-20, int(thisgene["Stop"])+20)
             except ValueError as e:
                 if debug: print("-- {}\tNO RECORDS FOUND".format(thisgene))
+                monitor.count("genes_not_indexed")
                 for samplename in df:
                     df[samplename][thisgene["SYMBOL"]] = "None"
+                monitor.record()
                 continue
 
             # Prep containers
@@ -360,71 +456,14 @@ def main():
                 effects[samplename] = []
                 records[samplename] = []
 
-            # For each variant position within gene
+            # For each variant position within gene, fetching and parsing the records is the lookup stage
+            filter_time = 0.0
             for vcf_record in vcf_records:
-                if debug: print("@@@\t {}".format(vcf_record.INFO))
-
-                if not "ANN" in vcf_record.INFO:
-                    if debug: print("@@@\t skipping record {} due to missing ANN field".format(vcf_record))
-                    continue
-
-
-                gencheck = [thisgene["SYMBOL"] in a for a in vcf_record.INFO["ANN"]]
-                if sum(gencheck) <= 0:
-                    if debug: print("@@@\t skipping record {} due to missing GENE SYMBOL {}".format(vcf_record, thisgene["SYMBOL"]))
-                    continue
-
-                nr_of_positions += 1
-                # For each sample
-                for samplename in df:
-                    #CHECK IF SAMPLE GENOTYPE AVAILABLE
-                    sgenot = None
-                    try:
-                        sgenot = vcf_record.genotype(samplename)
-                        #if debug: print("-- {}\t{}\t{}\tGT FOUND".format(thisgene, samplename, sgenot))
-                    except AttributeError as e:
-                        #if debug: print("-- {}\t{}\tNO GT FOUND".format(thisgene, samplename))
-                        continue
-
-                    # FILTER NON-QC RECORDS
-                    PASS = False
-                    log = "++ {}\t{}\t{}\t{}".format(thisgene, samplename, vcf_record, vcf_record.genotype(samplename)['GT'])
-                    # CHEK IF AD FIELD PRESENT
-                    if check_ad(sgenot):
-                        log += "\tAD:PASS"
-                        log += "\tDEPTH:{}".format(vcf_record.genotype(samplename)[DEPTH_KEY])
-                        # CHECK TOTAL COVERAGE OF IDENTIFIED ALLELLES
-                        if check_depth(sgenot):
-                            log += ":PASS"
-                            log += "\tVAF:{}".format(sum(vcf_record.genotype(samplename)[VAF_KEY][1:])*1.0/sum(vcf_record.genotype(samplename)[DEPTH_KEY]))
-
-                            # add clean if sufficient depth is measured
-                            effects[samplename].append("clean")
-                            records[samplename].append(None)
-
-                            # CHECK VARIANT ALLELE FREQUENCY
-                            if check_vaf(sgenot):
-                                log +=":PASS"
-                                log +="\tPOP:{}".format([vcf_record.INFO[rf] for rf in FREQ_FIELDS if rf in vcf_record.INFO])
-                                # CHECK POPULATION FREQUENCY
-                                if max(find_popfreq(vcf_record)) <= float(options.popfreq):
-                                    log += ":PASS"
-                                    log += "\tMLEAF:{}".format(vcf_record.INFO["MLEAF"])
-                                    # CHECK OCCURENCE IN TOTAL POOL
-                                    if max(vcf_record.INFO["MLEAF"]) <= float(options.cohfreq):
-                                        log +=":PASS"
-                                        PASS = True
-
-                    if debug: print(log)
-                    if PASS:
-                        # PARSE '0/1' into ALT[0] or '0/2' into ALT[1]
-                        sample_call = sgenot['GT'].replace("|","").split("/")
-                        sample_gt = vcf_record.ALT[int(sample_call[-1])-1]
-                        #if debug: print("-- {}\t{}\tPARSED GT\t{}\t{}\t{}".format(thisgene, samplename, sgenot, sample_call, sample_gt))
-
-                        effects[samplename].append(find_effects(vcf_record, sample_gt))
-                        #print("SAMPLE: {} \t\t EFF: {}".format(samplename,effects[samplename]))
-                        records[samplename].append(vcf_record)
+                start = time()
+                nr_of_positions += filter_record(vcf_record, thisgene, df, effects, records)
+                filter_time += time() - start
+            monitor.add_time("filter", filter_time)
+            monitor.add_time("lookup", time() - gene_start - filter_time)
 
             #exit(0)
             # ON GENE+SAMPLE LEVEL determine the number of mutations and the maximum mutation effect
@@ -459,9 +498,11 @@ def main():
                             df[samplename][thisgene["SYMBOL"]] = "None"
 
                 if debug: print("** {}\t{}\t{}\t{}\t{}".format(thisgene, samplename, df[samplename][thisgene["SYMBOL"]], cdf[samplename][thisgene["SYMBOL"]], ",".join(effects[samplename])))
+            monitor.record()
 
 
     # Printing the mutation overview table
+    start = time()
     outfile = open(options.outdir+"/"+"MutationOverview.txt",'w')
     # Print header with gene names
     if debug: print(df)
@@ -522,6 +563,9 @@ def main():
             outfile.write("\t".join([gene, samplename, proteffect, mapping[rdf[samplename][gene]["EFF"]], str(thisrec.CHROM), str(thisrec.POS), str(thisrec.POS+len(sample_gt)), thisrec.REF, str(sample_gt), str(vaf)])+"\n")
     if debug: print("##############################")
     outfile.close()
+    monitor.add_time("write", time() - start)
+
+    monitor.finish(settings=vars(options))
 
 
 
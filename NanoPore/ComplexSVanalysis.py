@@ -2,7 +2,9 @@
 
 # GENERAL
 import os
-from itertools import dropwhile, islice
+import sys
+import multiprocessing as mp
+from itertools import groupby
 from math import log
 
 # BAM and BED handling
@@ -17,74 +19,46 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from matplotlib.patches import BoxStyle
 from matplotlib.collections import PatchCollection
+from matplotlib.backends.backend_pdf import PdfPages
 
 from optparse import OptionParser
 
-# ------------------------------------------------------------------------------------------------------------------------
-
-class LASTregion:
-	"""LAST region class"""
-
-	def __init__(self, array):
-		self.loc = array[1]
-		self.pos = int(array[2])
-		self.length = int(array[3])
-		self.strand = array[4]
-		self.totlen = int(array[5])
-		self.seq = array[6]
-
-	def __repr__(self):
-		return "%s:%i-%i %s" %(self.loc, self.pos, self.pos+self.length, self.strand)
-
-	def __str__(self):
-		return "%s:%i-%i %s" %(self.loc, self.pos, self.pos+self.length, self.strand)
-
-	def get_loc(self):
-		if self.loc == 'X':
-			return 23
-		elif self.loc == 'Y':
-			return 24
-		else:
-			return int(self.loc)
-
-class LASTmapping:
-	"""LAST mapping class"""
-	
-	def __init__(self, score, ref, aln):
-		self.score = score
-		self.ref = LASTregion(ref)
-		self.aln = LASTregion(aln)
-
-	def __eq__(self, other):
-		return self.score == other.score
-
-	def __lt__(self, other):
-		return self.score < other.score
-
-	def __len__(self):
-		return self.aln.totlen
-
-	def __repr__(self):
-		return "%i %s -> %s" %(self.score, self.aln, self.ref)
-	
-	def __str__(self):
-		return "%i %s -> %s" %(self.score, self.aln, self.ref)
+# Region fetching, shared with the other BAM tools in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from BAM_regions import plan_regions, map_regions
 
+# MAF parsing
+from MAF_reader import load_read_index, read_record, read_tables, iter_runs, iter_reads, chain_alignments
 
 # ------------------------------------------------------------------------------------------------------------------------
 
 parser = OptionParser()
 parser.add_option("--bam",   dest="bam_file",	 help="Path of BAM file to parse",		default=False)
 parser.add_option("--last",  dest="last_file",	 help="Path of MAF file to parse",		default=False)
-parser.add_option("--qual",  dest="qual_score",  help="Minimum quality for alignments",		default=300)
+parser.add_option("--qual",  dest="qual_score",  help="Minimum quality for alignments",		default=300, type="int")
 parser.add_option("--reg",   dest="region_file", help="Regions of interest BED file",		default=False)
-parser.add_option("--nral",  dest="nr_align",	 help="Number of alignments to display",	default=20)
+parser.add_option("--nral",  dest="nr_align",	 help="Number of alignments to display",	default=20, type="int")
+parser.add_option("--plot",  dest="plot_mode",	 help="One PDF per read (read), a multipage PDF per region (pdf) or a tiled PNG per region (png)", default="read", choices=["read", "pdf", "png"])
+parser.add_option("--max_reads", dest="max_reads", help="Maximum number of reads plotted per region, reads with most alignments first (0 = all)", default=0, type="int")
+parser.add_option("--threads", dest="nr_cpus",	 help="Number of processes used to fetch regions and parse the MAF file", default=1, type="int")
+parser.add_option("--merge", dest="merge_distance", help="Regions at most this far apart are fetched together", default=1000, type="int")
+parser.add_option("--vcf",   dest="vcf_file",	 help="Call breakpoints from the chained alignments of all reads and write them to this VCF file, no BAM or regions needed", default=False)
+parser.add_option("--grouped", dest="grouped",	 help="Flag to indicate alignments are grouped by read in the MAF file, reads are chained while streaming", default=False, action="store_true")
+parser.add_option("--tol",   dest="tolerance",	 help="Maximum distance between breakpoint positions that are clustered", default=50, type="int")
+parser.add_option("--min_reads", dest="min_reads", help="Minimum number of reads supporting a breakpoint", default=2, type="int")
+parser.add_option("--min_size", dest="min_size", help="Minimum size of deletions and insertions between chained alignments", default=50, type="int")
 (options, args) = parser.parse_args()
 
 # ------------------------------------------------------------------------------------------------------------------------
 
 def check_arguments(options):
 	#print("Checking arguments")
+	if options.vcf_file:
+		if not os.path.exists(options.last_file):
+			print("Invalid MAF file %s"%(options.last_file))
+			return False
+		return True
+
 	if not os.path.exists(options.bam_file):
 		print("Invalid BAM file %s"%(options.bam_file))
 		return False
@@ -100,25 +74,48 @@ def check_arguments(options):
 	return True
 
 
-def gather_sv_data(options, collection):
-	# Read regions of interest BED file
-	regions = BedTool(options.region_file)
-
-	# Read BAM file
-	bamfile = AlignmentFile(options.bam_file, "rb")
-
-	# Intersect regions
-	for reg in regions:
-		for read in bamfile.fetch(reg.chrom, reg.start, reg.end):
-			#print read
-			if read.query_name.endswith("2d"):
-				collection[read.query_name] = []
-			if read.query_name.startswith("ctg"):
-				collection[read.query_name] = []
-				#print read.reference_id, read.reference_start, read.reference_end
-				#print read.query_name, read.query_alignment_start, read.query_alignment_end
+def fetch_region_reads(bamfile, chrom, start, end):
+	# Candidate reads with their reference span
+	reads = []
+	for read in bamfile.fetch(chrom, start, end):
+		#print read
+		if read.query_name.endswith("2d") or read.query_name.startswith("ctg"):
+			read_end = read.reference_end
+			if read_end is None:
+				read_end = read.reference_start + 1
+			reads.append((read.query_name, read.reference_start, read_end))
+			#print read.reference_id, read.reference_start, read.reference_end
+			#print read.query_name, read.query_alignment_start, read.query_alignment_end
+	return reads
 
-	bamfile.close()
+def gather_sv_data(options, collection):
+	# Read regions of interest BED file, identical regions are fetched once
+	regions = []
+	seen = set()
+	for reg in BedTool(options.region_file):
+		if (reg.chrom, reg.start, reg.end) not in seen:
+			seen.add((reg.chrom, reg.start, reg.end))
+			regions.append((reg.chrom, reg.start, reg.end))
+
+	# Overlapping and nearby regions are fetched together, in parallel
+	planned, members = plan_regions(regions, options.merge_distance)
+	results = map_regions(fetch_region_reads, options.bam_file, planned, options.nr_cpus)
+
+	# Split the fetched reads over the original regions, reads spanning several regions are kept once
+	reads_per_region = [set() for region in regions]
+	for reads, indices in zip(results, members):
+		for name, read_start, read_end in reads:
+			for i in indices:
+				chrom, start, end = regions[i]
+				if read_start < end and read_end > start:
+					reads_per_region[i].add(name)
+					collection[name] = []
+
+	region_reads = []
+	for (chrom, start, end), reads in zip(regions, reads_per_region):
+		region_reads.append(("%s_%i_%i"%(chrom, start, end), reads))
+
+	return region_reads
 
 
 def isHeaderLine(line):
@@ -127,103 +124,262 @@ def isHeaderLine(line):
 
 
 def gather_alt_mappings(options, collection):
-	# Parse LAST file
-	with open(options.last_file,'r') as f:
-		for line in dropwhile(isHeaderLine, f):
-			if isHeaderLine(line):
-				continue
-			if len(line) <= 5:
-				continue
-
-			lines_gen = islice(f, 4)
+	# Only the alignment blocks of the selected reads are read, using the read index of the LAST file
+	index = load_read_index(options.last_file, options.nr_cpus)
+	offsets = []
+	for read in collection:
+		offsets.extend(index.get(read, []))
 
-			score = int(line.strip().split("=")[1])
-			ref = next(lines_gen).strip().split()
-			aln = next(lines_gen).strip().split()
-			empty = next(lines_gen)
+	with open(options.last_file, 'rb') as f:
+		for offset in sorted(offsets):
+			record = read_record(f, offset)
+			if record.score >= options.qual_score:
+				collection[record.aln.loc].append(record)
 
-			strand = 1
-			if aln[4] == '-':
-				strand = -1
+				#print "%i %s:%s-%s  -> %s:%s-%s" %(record.score, record.aln.loc, record.aln.pos, record.aln.length, record.ref.loc, record.ref.pos, record.ref.length)
 
-			if (aln[1] in collection and score >= options.qual_score):
-				collection[aln[1]].append(LASTmapping(score, ref, aln))
 
-				#print "%i %s:%s-%s  -> %s:%s-%s" %(score, aln[1], aln[2], aln[3], ref[1], ref[2], ref[3])
+COLOR_LIST = plt.cm.Set1(np.linspace(0, 1, 25))
 
+def draw_read(ax, read, alignments, nr_align, title=False):
+	sortaln = sorted(alignments, reverse=True)[:nr_align]
 
-def plot_alt_mappings(options, collection):
-	#GenomeDiagram.FeatureSet()
-	color_list = plt.cm.Set1(np.linspace(0, 1, 25))
-	chroms = [str(x) for x in range(1,25)]
-	chroms[22] = "X"
-	chroms[23] = "Y"
-	#print len(color_list)
+	# SET plot limits
+	ax.set_xlim(0, sortaln[0].aln.totlen)
+	ax.set_ylim(-10, 10)
 
+	# All alignments of a read are drawn as one collection, the legend has one entry per chromosome
+	patches = []
+	colors = []
 	handles = []
-	for j in range(0, 24):
-		handles.append(mpatches.Patch(color=color_list[j], label=chroms[j]))
-
-	for read in collection:
-		print read
-
-		fig = plt.figure()
-		ax = fig.add_subplot(111)
-
-		sortaln = sorted(collection[read], reverse=True)
-
-		if len(sortaln) == 0:
-			continue
-
-		# SET plot limits
-		ax.set_xlim(0, sortaln[0].aln.totlen)
-		ax.set_ylim(-10, 10)
-
-		nr_reads = min(options.nr_align, len(sortaln))
-		for i in range(0, nr_reads):
-			if i <= 10:
-				print(sortaln[i])
-			col = color_list[sortaln[i].ref.get_loc()]
-			width = sortaln[i].aln.length
-
-			score = log(sortaln[i].score)
-			direction = "RArrow"
-			xpos = sortaln[i].aln.pos
-
-			if sortaln[i].aln.strand == '-':
-				score = score * -1
-				direction = "LArrow"
-				xpos = sortaln[i].aln.totlen-sortaln[i].aln.pos-width
-			
-			xy = (xpos, score-0.1)
-			patch = mpatches.FancyBboxPatch(xy, width, 0.2, BoxStyle(direction), facecolor=col, edgecolor='black', alpha=0.7, label=sortaln[i].ref.loc)
-			ax.add_patch(patch)
-
-		# Mark-up of plot
-		ax.set_yticks(range(-10, 10, 1))
-		ax.grid(True)
-		ax.set_xlabel('Location within read')
-		ax.set_ylabel('Log(score)')
-
-		# Shrink plot to accomodate legend
-		box = ax.get_position()
-		ax.set_position([box.x0, box.y0, box.width * 0.9, box.height])
-
-		# Add color legend
-		ax.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0., ncol=1, prop={'size':8})
-		#handles=handles,
-
-		# SAVE file
-		fig.savefig(read+'.pdf')
+	for aln in sortaln:
+		col = COLOR_LIST[aln.ref.get_loc()]
+		width = aln.aln.length
+
+		score = log(aln.score)
+		direction = "RArrow"
+		xpos = aln.aln.pos
+
+		if aln.aln.strand == '-':
+			score = score * -1
+			direction = "LArrow"
+			xpos = aln.aln.totlen-aln.aln.pos-width
+
+		xy = (xpos, score-0.1)
+		patches.append(mpatches.FancyBboxPatch(xy, width, 0.2, BoxStyle(direction)))
+		colors.append(col)
+		if aln.ref.loc not in [handle.get_label() for handle in handles]:
+			handles.append(mpatches.Patch(color=col, label=aln.ref.loc))
+
+	ax.add_collection(PatchCollection(patches, facecolors=colors, edgecolors='black', alpha=0.7))
+
+	# Mark-up of plot
+	ax.set_yticks(range(-10, 10, 1))
+	ax.grid(True)
+	ax.set_xlabel('Location within read')
+	ax.set_ylabel('Log(score)')
+	if title:
+		ax.set_title(read, fontsize=8)
+
+	# Shrink plot to accomodate legend
+	box = ax.get_position()
+	ax.set_position([box.x0, box.y0, box.width * 0.9, box.height])
+
+	# Add color legend
+	ax.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0., ncol=1, prop={'size':8})
+
+def render_read(args):
+	read, alignments, nr_align = args
+	fig = plt.figure()
+	ax = fig.add_subplot(111)
+	draw_read(ax, read, alignments, nr_align)
+
+	# SAVE file
+	fig.savefig(read+'.pdf')
+	plt.close(fig)
+	return read
+
+def render_region(args):
+	name, reads, nr_align, plot_mode = args
+	if plot_mode == "pdf":
+		# One page per read
+		with PdfPages(name+'.pdf') as pdf:
+			for read, alignments in reads:
+				fig = plt.figure()
+				ax = fig.add_subplot(111)
+				draw_read(ax, read, alignments, nr_align, True)
+				pdf.savefig(fig)
+				plt.close(fig)
+	else:
+		# All reads tiled in one image
+		ncols = min(4, len(reads))
+		nrows = (len(reads) + ncols - 1) // ncols
+		fig = plt.figure(figsize=(6.4*ncols, 4.8*nrows))
+		for k, (read, alignments) in enumerate(reads):
+			ax = fig.add_subplot(nrows, ncols, k+1)
+			draw_read(ax, read, alignments, nr_align, True)
+		fig.savefig(name+'.png')
 		plt.close(fig)
+	return name
+
+def select_region_reads(options, collection, reads):
+	# Reads with alignments, most alignments first, capped at max_reads
+	reads = sorted([read for read in reads if len(collection[read]) > 0], key=lambda x: (-len(collection[x]), x))
+	if options.max_reads > 0:
+		reads = reads[:options.max_reads]
+	return reads
+
+def plot_alt_mappings(options, collection, region_reads):
+	jobs = []
+	if options.plot_mode == "read":
+		selected = set()
+		for name, reads in region_reads:
+			selected.update(select_region_reads(options, collection, reads))
+		render = render_read
+		jobs = [(read, collection[read], options.nr_align) for read in sorted(selected)]
+	else:
+		render = render_region
+		for name, reads in region_reads:
+			reads = select_region_reads(options, collection, reads)
+			if len(reads) > 0:
+				jobs.append((name, [(read, collection[read]) for read in reads], options.nr_align, options.plot_mode))
+
+	# Figures are rendered in parallel with the Agg backend
+	if options.nr_cpus > 1:
+		pool = mp.Pool(processes=options.nr_cpus)
+		for name in pool.imap_unordered(render, jobs):
+			print name
+		pool.close()
+		pool.join()
+	else:
+		for job in jobs:
+			print render(job)
+
+def chrom_key(chrom):
+	# Numbered chromosomes first, in numerical order
+	if chrom.isdigit():
+		return (0, int(chrom), "")
+	return (1, 0, chrom)
+
+def read_chains(options):
+	# yields (read, chained alignments) for every read with more than one alignment
+	tables = read_tables(options.last_file, options.nr_cpus, options.qual_score)
+	if options.grouped:
+		runs = iter_runs(tables)
+	else:
+		runs = iter_reads(tables)
+	for read, alignments in runs:
+		if len(alignments) > 1:
+			yield read, chain_alignments(alignments)
+
+def extract_junctions(read, chain, options):
+	# Junctions between consecutive alignments in the read, as (chrom1, pos1, chrom2, pos2, ct, insertion, read).
+	# Positions are the 1-based outermost aligned reference bases at the junction, ct is the Delly connection type.
+	junctions = []
+	starts, ends = chain.query_span()
+	for i in range(len(chain) - 1):
+		first = chain.rows[i]
+		second = chain.rows[i+1]
+		if first["strand"] > 0:
+			pos1, end1 = first["ref_pos"] + first["ref_len"], "3"
+		else:
+			pos1, end1 = first["ref_pos"] + 1, "5"
+		if second["strand"] > 0:
+			pos2, end2 = second["ref_pos"] + 1, "5"
+		else:
+			pos2, end2 = second["ref_pos"] + second["ref_len"], "3"
+		chrom1 = chain.chrom_name(i)
+		chrom2 = chain.chrom_name(i+1)
+		insertion = int(starts[i+1] - ends[i])
+
+		# The same junction read from the other strand
+		if (chrom_key(chrom2), pos2) < (chrom_key(chrom1), pos1):
+			chrom1, pos1, end1, chrom2, pos2, end2 = chrom2, pos2, end2, chrom1, pos1, end1
+
+		# Alignments split by a small indel are not a breakpoint
+		ct = "%sto%s"%(end1, end2)
+		if chrom1 == chrom2 and ct == "3to5" and abs(pos2 - pos1 - 1 - insertion) < options.min_size:
+			continue
+		junctions.append((chrom1, int(pos1), chrom2, int(pos2), ct, insertion, read))
+	return junctions
+
+def sweep(items, position, tolerance):
+	# Splits items sorted on position wherever consecutive positions are more than tolerance apart
+	cluster = []
+	for item in items:
+		if len(cluster) > 0 and position(item) - position(cluster[-1]) > tolerance:
+			yield cluster
+			cluster = []
+		cluster.append(item)
+	if len(cluster) > 0:
+		yield cluster
+
+def cluster_junctions(junctions, tolerance):
+	# Junctions with the same chromosomes and connection type are swept on pos1, then within a window on pos2
+	junctions.sort(key=lambda x: (chrom_key(x[0]), chrom_key(x[2]), x[4], x[1]))
+	for key, group in groupby(junctions, key=lambda x: (x[0], x[2], x[4])):
+		for window in sweep(group, lambda x: x[1], tolerance):
+			window.sort(key=lambda x: x[3])
+			for cluster in sweep(window, lambda x: x[3], tolerance):
+				yield key, cluster
+
+def sv_type(chrom1, chrom2, ct):
+	if chrom1 != chrom2:
+		return "TRA"
+	if ct == "3to5":
+		return "DEL"
+	if ct == "5to3":
+		return "DUP"
+	return "INV"
+
+def write_breakpoints(options):
+	junctions = []
+	for read, chain in read_chains(options):
+		junctions.extend(extract_junctions(read, chain, options))
+	print "%i junctions"%(len(junctions))
+
+	calls = []
+	for (chrom1, chrom2, ct), cluster in cluster_junctions(junctions, options.tolerance):
+		reads = set([junction[6] for junction in cluster])
+		if len(reads) < options.min_reads:
+			continue
+		pos1 = np.array([junction[1] for junction in cluster])
+		pos2 = np.array([junction[3] for junction in cluster])
+		calls.append((chrom1, int(np.median(pos1)), chrom2, int(np.median(pos2)), ct, len(reads), pos1, pos2))
+	calls.sort(key=lambda x: (chrom_key(x[0]), x[1], chrom_key(x[2]), x[3]))
+
+	vcf = open(options.vcf_file, 'w')
+	vcf.write("##fileformat=VCFv4.2\n")
+	vcf.write("##source=ComplexSVanalysis.py\n")
+	vcf.write("##INFO=<ID=SVTYPE,Number=1,Type=String,Description=\"Type of structural variant\">\n")
+	vcf.write("##INFO=<ID=CHR2,Number=1,Type=String,Description=\"Chromosome of the second breakpoint\">\n")
+	vcf.write("##INFO=<ID=END,Number=1,Type=Integer,Description=\"Position of the second breakpoint\">\n")
+	vcf.write("##INFO=<ID=SVLEN,Number=1,Type=Integer,Description=\"Distance between the breakpoints\">\n")
+	vcf.write("##INFO=<ID=CT,Number=1,Type=String,Description=\"Paired-end signature induced connection type\">\n")
+	vcf.write("##INFO=<ID=CIPOS,Number=2,Type=Integer,Description=\"Range of clustered first breakpoint positions\">\n")
+	vcf.write("##INFO=<ID=CIEND,Number=2,Type=Integer,Description=\"Range of clustered second breakpoint positions\">\n")
+	vcf.write("##INFO=<ID=SR,Number=1,Type=Integer,Description=\"Number of reads with split alignments supporting the breakpoint\">\n")
+	vcf.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+	for nr, (chrom1, pos1, chrom2, pos2, ct, support, positions1, positions2) in enumerate(calls):
+		svtype = sv_type(chrom1, chrom2, ct)
+		info = "SVTYPE=%s;CHR2=%s;END=%i"%(svtype, chrom2, pos2)
+		if chrom1 == chrom2:
+			info += ";SVLEN=%i"%(pos2 - pos1)
+		info += ";CT=%s;CIPOS=%i,%i;CIEND=%i,%i;SR=%i"%(ct, positions1.min() - pos1, positions1.max() - pos1, positions2.min() - pos2, positions2.max() - pos2, support)
+		vcf.write("%s\t%i\t%s%08i\tN\t<%s>\t.\tPASS\t%s\n"%(chrom1, pos1, svtype, nr, svtype, info))
+	vcf.close()
+	print "%i breakpoints"%(len(calls))
 
 # ------------------------------------------------------------------------------------------------------------------------
 
 if check_arguments(options):
-	collection = {}
-	gather_sv_data(options, collection)
-	gather_alt_mappings(options, collection)
-	plot_alt_mappings(options, collection)
+	if options.vcf_file:
+		write_breakpoints(options)
+	else:
+		collection = {}
+		region_reads = gather_sv_data(options, collection)
+		gather_alt_mappings(options, collection)
+		plot_alt_mappings(options, collection, region_reads)
 
 print("DONE")
 
@@ -2,10 +2,12 @@
 
 # GENERAL
 import os
-from itertools import dropwhile, islice
 from math import log
 from optparse import OptionParser
 
+# MAF parsing
+from MAF_reader import read_tables, iter_runs, iter_reads, best_per_read, read_block, chain_alignments, GAP_PEN, OVL_PEN, MAX_OVL
+
 # ------------------------------------------------------------------------------------------------------------------------
 
 class MAFregion:
@@ -69,7 +71,7 @@ class MAFmapping:
 		if self.qual != "":
 			return "a score=%s\n%s\n%s\nq %s %s\n\n"%(self.score, self.ref.to_maf(), self.aln.to_maf(), self.aln.loc, self.qual)
 		else:
-			return "a score=%s\n%s\n%s\n\n"%(self.score, self.ref.to_maf(), self.aln.to_maf(), self.qual)
+			return "a score=%s\n%s\n%s\n\n"%(self.score, self.ref.to_maf(), self.aln.to_maf())
 
 
 # ------------------------------------------------------------------------------------------------------------------------
@@ -79,7 +81,14 @@ parser.add_option("--maf",   dest="maf_file",	 help="Path of input MAF file to p
 parser.add_option("--out",   dest="out_file",	 help="Path of output MAF file to write",	default=False)
 parser.add_option("--qual",  dest="qual_score",  help="Minimum quality for alignments",		default=300)
 parser.add_option("--2d",    dest="twod_only",	 help="Flag to use 2D reads only",			default=False)
-parser.add_option("--bq",    dest="hasb_qual",	 help="Flag to indicate precens of base quality scores", default=True)
+parser.add_option("--bq",    dest="hasb_qual",	 help="Deprecated, base quality lines are detected per alignment", default=True)
+parser.add_option("--grouped", dest="grouped",	 help="Flag to indicate alignments are grouped by read, best alignments are written as soon as the read changes", default=False, action="store_true")
+parser.add_option("--threads", dest="nr_cpus",	 help="Number of processes used to parse the MAF file", default=1, type="int")
+parser.add_option("--chain", dest="chain",	 help="Flag to write the optimal chain of alignments per read instead of the best alignment", default=False, action="store_true")
+parser.add_option("--bed",   dest="bed_file",	 help="Path of output BED file with the chained alignments", default=False)
+parser.add_option("--gap_pen", dest="gap_pen",	 help="Chain penalty per unaligned read base between alignments", default=GAP_PEN, type="float")
+parser.add_option("--ovl_pen", dest="ovl_pen",	 help="Chain penalty per read base aligned twice", default=OVL_PEN, type="float")
+parser.add_option("--max_ovl", dest="max_ovl",	 help="Maximum overlap in read bases between chained alignments", default=MAX_OVL, type="int")
 (options, args) = parser.parse_args()
 
 # ------------------------------------------------------------------------------------------------------------------------
@@ -104,76 +113,40 @@ def check_arguments(options):
 def isHeaderLine(line):
 	return line.startswith("#")
 
+def qc_mask(table, options):
+	# Check if alignments pass QC
+	mask = table.rows["score"] >= options.qual_score
+	# 2D reads always used, 1D reads only when specified
+	if options.twod_only:
+		mask &= table.read_mask(lambda read: "_2D_000_2d" in read)
+	return mask
+
+def read_passing_tables(options):
+	# Alignment tables per part of the MAF file, in file order
+	for table in read_tables(options.maf_file, options.nr_cpus, options.qual_score):
+		yield table[qc_mask(table, options)]
+
+def make_mapping(f, offset):
+	score, ref, aln, qual = read_block(f, int(offset))
+	newmapping = MAFmapping(score, ref, aln)
+	if len(qual) > 0:
+		newmapping.set_qual(qual)
+	return newmapping
+
 def filter_alt_mappings(options):
-	collection = {}
-	# Parse MAF file
-	with open(options.maf_file,'r') as f:
-		for line in dropwhile(isHeaderLine, f):
-			if isHeaderLine(line):
-				continue
-			if len(line) <= 5:
-				continue
-
-			lines_gen = False
-			qual = []
-
-			if options.hasb_qual:
-				lines_gen = islice(f, 5)
-
-			else:
-				lines_gen = islice(f, 4)
-
-			score = int(line.strip().split("=")[1])
-			ref = next(lines_gen).strip().split()
-			aln = next(lines_gen).strip().split()
-			if options.hasb_qual:
-				qual = next(lines_gen).strip().split()
-			empty = next(lines_gen)
-
-
-			# Store strand information +=1  -=-1
-			strand = int(aln[4]+'1')
-				
-			# Check if alignment passes QC
-			qcpass = False
-			
-			if (score >= options.qual_score):
-				# 2D reads always used 
-				if "_2D_000_2d" in aln[1]:
-					qcpass = True
-				# 1D reads only when specified
-				elif not options.twod_only:
-					qcpass = True
-			
-			# Store alignments that pass
-			if qcpass:
-				if (aln[1] not in collection):
-		          		collection[aln[1]] = []
-				newmapping = MAFmapping(score, ref, aln)
-				if options.hasb_qual:
-					newmapping.set_qual(qual)
-				collection[aln[1]].append(newmapping)
-				
-	return collection
-
-
-#def find_optimal_path(options, collection):
-	# for each sequenced read
-#	for read in collection:
-		# go through mapping options
-#		for mapping in collection[read]:
-
-	# KEEP TRACK OF UNMAPPED REGIONS
-	# ITERATE UNTIL X% MAPPED OR NO MORE ADDITIONS POSSIBLE
-	#
-	# RANGE ==
-	# 	mapping.aln.pos - mapping.aln.pos+mapping.aln.length
+	# File offsets of the best passing alignment per read, in file order
+	return best_per_read(read_passing_tables(options)).rows["offset"]
 
-	
+def find_optimal_path(options, alignments):
+	return chain_alignments(alignments, options.gap_pen, options.ovl_pen, options.max_ovl)
 
-def write_alt_mappings(options, collection):
-	outf = open(options.out_file, 'w')
+def gather_read_alignments(options):
+	# yields (read, alignments) for every read with passing alignments
+	if options.grouped:
+		return iter_runs(read_passing_tables(options))
+	return iter_reads(read_passing_tables(options))
 
+def write_header(options, outf):
 	# Get header from original file and write to new MAF file
 	inf = open(options.maf_file,'r')
 	for line in inf:
@@ -182,25 +155,62 @@ def write_alt_mappings(options, collection):
 		else:
 			break
 	inf.close()
+
+def write_alt_mappings(options, offsets):
+	outf = open(options.out_file, 'w')
+	write_header(options, outf)
 	
-	# Go through reads and write Mapping info
-	for read in collection:
-		optimal = collection[read][0]
+	# Go back to the best mapping of every read, in file order
+	with open(options.maf_file,'rb') as f:
+		for offset in offsets:
+			optimal = make_mapping(f, offset)
+			#outf_optimal.write(optimal.ref.to_bed()+"\t"+optimal.aln.loc+"\n")
+			outf.write(optimal.to_maf())
 
-		for mapping in collection[read]:
-			if mapping.score >= optimal.score:
-				optimal=mapping
+	outf.close()
+
+def write_grouped_mappings(options):
+	# Alignments of a read are consecutive, the best one is written when the next read starts
+	outf = open(options.out_file, 'w')
+	write_header(options, outf)
 
-		#outf_optimal.write(optimal.ref.to_bed()+"\t"+optimal.aln.loc+"\n")
-		outf.write(optimal.to_maf())
+	with open(options.maf_file,'rb') as f:
+		for read, alignments in iter_runs(read_passing_tables(options)):
+			outf.write(make_mapping(f, alignments.rows["offset"][alignments.best()]).to_maf())
+	outf.close()
+
+def write_chained_mappings(options):
+	outf = open(options.out_file, 'w')
+	write_header(options, outf)
+	outf_bed = False
+	if options.bed_file:
+		outf_bed = open(options.bed_file, 'w')
+
+	# Chained alignments are written in read order
+	with open(options.maf_file,'rb') as f:
+		for read, alignments in gather_read_alignments(options):
+			chain = find_optimal_path(options, alignments)
+			starts, ends = chain.query_span()
+			for i, row in enumerate(chain.rows):
+				outf.write(make_mapping(f, row["offset"]).to_maf())
+				if outf_bed:
+					strand = "+" if row["ref_strand"] > 0 else "-"
+					outf_bed.write("%s\t%i\t%i\t%s\t%s\t%i\t%i\t%i\n"%(chain.chrom_name(i), row["ref_pos"], row["ref_pos"]+row["ref_len"], strand, read, starts[i], ends[i], row["score"]))
 
 	outf.close()
+	if outf_bed:
+		outf_bed.close()
 	
 # ------------------------------------------------------------------------------------------------------------------------
 
 if check_arguments(options):
-	filtered_reads = filter_alt_mappings(options)
-	write_alt_mappings(options, filtered_reads)
+	if options.chain:
+		write_chained_mappings(options)
+	elif options.grouped:
+		write_grouped_mappings(options)
+	else:
+		filtered_reads = filter_alt_mappings(options)
+		write_alt_mappings(options, filtered_reads)
 
 print("DONE")
 
@@ -0,0 +1,495 @@
+#!/opt/local/bin/python2.7
+
+# GENERAL
+import os
+import json
+from bisect import bisect_right
+import multiprocessing as mp
+
+# TABLES
+import numpy as np
+
+# ------------------------------------------------------------------------------------------------------------------------
+
+BLOCK_START = "a score="
+CHUNK_SIZE = 64 * 1024 * 1024
+
+class MAFspan(object):
+	"""MAF aligned sequence coordinates, without the sequence itself"""
+	__slots__ = ("loc", "pos", "length", "strand", "totlen")
+
+	def __init__(self, array):
+		self.loc = array[1]
+		self.pos = int(array[2])
+		self.length = int(array[3])
+		self.strand = array[4]
+		self.totlen = int(array[5])
+
+	def __getstate__(self):
+		return (self.loc, self.pos, self.length, self.strand, self.totlen)
+
+	def __setstate__(self, state):
+		self.loc, self.pos, self.length, self.strand, self.totlen = state
+
+	def __repr__(self):
+		return "%s:%i-%i %s" %(self.loc, self.pos, self.pos+self.length, self.strand)
+
+	def __str__(self):
+		return "%s:%i-%i %s" %(self.loc, self.pos, self.pos+self.length, self.strand)
+
+	def to_bed(self):
+		return "%s\t%i\t%i\t%s" %(self.loc, self.pos, self.pos+self.length, self.strand)
+
+	def get_loc(self):
+		if self.loc == 'X':
+			return 23
+		elif self.loc == 'Y':
+			return 24
+		else:
+			return int(self.loc)
+
+class MAFrecord(object):
+	"""Compact MAF alignment block, sequences are read lazily from the block offset"""
+	__slots__ = ("score", "ref", "aln", "offset", "has_qual")
+
+	def __init__(self, score, ref, aln, offset, has_qual):
+		self.score = score
+		self.ref = MAFspan(ref)
+		self.aln = MAFspan(aln)
+		self.offset = offset
+		self.has_qual = has_qual
+
+	def __getstate__(self):
+		return (self.score, self.ref, self.aln, self.offset, self.has_qual)
+
+	def __setstate__(self, state):
+		self.score, self.ref, self.aln, self.offset, self.has_qual = state
+
+	def __eq__(self, other):
+		return self.score == other.score
+
+	def __lt__(self, other):
+		return self.score < other.score
+
+	def __len__(self):
+		return self.aln.totlen
+
+	def __repr__(self):
+		return "%i %s -> %s" %(self.score, self.aln, self.ref)
+
+	def __str__(self):
+		return "%i %s -> %s" %(self.score, self.aln, self.ref)
+
+	def read_block(self, f):
+		# Full 's' and 'q' lines of this block from an open MAF file
+		return read_block(f, self.offset)
+
+# ------------------------------------------------------------------------------------------------------------------------
+
+def parse_score(line):
+	# 'a score=123' optionally followed by other fields (EG2=, E=, mismap=)
+	return int(line.split()[1].split("=")[1])
+
+def read_block(f, offset):
+	# Returns score, ref and aln 's' line fields and the 'q' line fields of the aligned read (empty if absent)
+	f.seek(offset)
+	score = parse_score(f.readline())
+	slines = []
+	qual = []
+	while True:
+		line = f.readline()
+		if len(line.strip()) == 0 or line.startswith("a"):
+			break
+		if line.startswith("s"):
+			slines.append(line.strip().split())
+		elif line.startswith("q"):
+			qual = line.strip().split()
+	return score, slines[0], slines[1], qual
+
+def find_block_boundary(f, offset):
+	# First 'a score=' line at or after offset
+	if offset == 0:
+		return 0
+	f.seek(offset - 1)
+	# Skip the rest of the line that contains offset
+	pos = offset - 1 + len(f.readline())
+	while True:
+		line = f.readline()
+		if not line or line.startswith(BLOCK_START):
+			return pos
+		pos += len(line)
+
+def split_maf_file(maf_file, nr_parts):
+	# Byte ranges that start at alignment block boundaries
+	size = os.path.getsize(maf_file)
+	nr_parts = max(1, nr_parts, size // CHUNK_SIZE)
+	bounds = [0]
+	with open(maf_file, 'rb') as f:
+		for i in range(1, nr_parts):
+			bounds.append(find_block_boundary(f, size * i // nr_parts))
+	bounds.append(size)
+	bounds = sorted(set(bounds))
+	return zip(bounds[:-1], bounds[1:])
+
+def iter_blocks(f, start, end):
+	# yields (score, ref fields, aln fields, offset, has_qual) for every block starting in [start, end)
+	f.seek(start)
+	pos = start
+	block = None
+	while pos < end or block is not None:
+		line = f.readline()
+		if not line:
+			break
+		offset = pos
+		pos += len(line)
+		if line.startswith("#"):
+			continue
+		if line.startswith(BLOCK_START):
+			if offset >= end:
+				break
+			block = [parse_score(line), [], False, offset]
+		elif block is None:
+			continue
+		elif line.startswith("s"):
+			block[1].append(line.split(None, 6))
+		elif line.startswith("q"):
+			block[2] = True
+		elif len(line.strip()) == 0:
+			yield block[0], block[1][0], block[1][1], block[3], block[2]
+			block = None
+	if block is not None and len(block[1]) == 2:
+		yield block[0], block[1][0], block[1][1], block[3], block[2]
+
+def iter_range(f, start, end):
+	# yields a MAFrecord for every block starting in [start, end)
+	for score, ref, aln, offset, has_qual in iter_blocks(f, start, end):
+		yield MAFrecord(score, ref, aln, offset, has_qual)
+
+# Read names to keep, set once per worker
+_reads = None
+
+def init_worker(reads):
+	global _reads
+	_reads = reads
+
+def table_range(args):
+	maf_file, start, end, min_score = args
+	rows = []
+	reads = {}
+	chroms = {}
+	with open(maf_file, 'rb') as f:
+		for score, ref, aln, offset, has_qual in iter_blocks(f, start, end):
+			if score < min_score:
+				continue
+			if _reads is not None and aln[1] not in _reads:
+				continue
+			read = reads.setdefault(aln[1], len(reads))
+			chrom = chroms.setdefault(ref[1], len(chroms))
+			rows.append((read, chrom, STRANDS[aln[4]], STRANDS[ref[4]], int(ref[2]), int(ref[3]), int(aln[2]), int(aln[3]), int(aln[5]), score, offset))
+	return AlignmentTable(np.array(rows, dtype=ALIGNMENT_DTYPE), names_by_code(reads), names_by_code(chroms))
+
+def map_ranges(worker, maf_file, nr_cpus, min_score, reads):
+	# Runs worker over block aligned byte ranges, results are yielded in file order
+	if reads is not None:
+		reads = set(reads)
+	ranges = split_maf_file(maf_file, nr_cpus * 4)
+	jobs = [(maf_file, start, end, min_score) for start, end in ranges]
+	if nr_cpus <= 1:
+		init_worker(reads)
+		for job in jobs:
+			yield worker(job)
+		init_worker(None)
+		return
+	pool = mp.Pool(processes=nr_cpus, initializer=init_worker, initargs=(reads,))
+	results = pool.imap(worker, jobs)
+	pool.close()
+	try:
+		for result in results:
+			yield result
+	finally:
+		# terminate() can hang on results that are still being sent, let the remaining ranges finish
+		pool.join()
+
+def read_tables(maf_file, nr_cpus=1, min_score=0, reads=None):
+	# yields an AlignmentTable per byte range, in file order
+	return map_ranges(table_range, maf_file, nr_cpus, min_score, reads)
+
+def load_table(maf_file, nr_cpus=1, min_score=0, reads=None):
+	return AlignmentTable.concatenate(list(read_tables(maf_file, nr_cpus, min_score, reads)))
+
+# ------------------------------------------------------------------------------------------------------------------------
+
+STRANDS = {"+":1, "-":-1}
+
+# 40 bytes per alignment, sequences stay in the MAF file at offset
+ALIGNMENT_DTYPE = np.dtype([
+	("read", np.int32), ("chrom", np.int16), ("strand", np.int8), ("ref_strand", np.int8),
+	("ref_pos", np.int32), ("ref_len", np.int32), ("pos", np.int32), ("len", np.int32), ("totlen", np.int32),
+	("score", np.int32), ("offset", np.int64)])
+
+def names_by_code(codes):
+	names = [None] * len(codes)
+	for name, code in codes.items():
+		names[code] = name
+	return names
+
+class AlignmentTable(object):
+	"""Alignments as a numpy structured array, read and chrom columns are codes into the reads and chroms lists"""
+
+	def __init__(self, rows, reads, chroms):
+		self.rows = rows
+		self.reads = reads
+		self.chroms = chroms
+
+	def __len__(self):
+		return len(self.rows)
+
+	def __getitem__(self, index):
+		# index is a slice, boolean mask or index array, the result is always a table
+		return AlignmentTable(self.rows[index], self.reads, self.chroms)
+
+	@classmethod
+	def concatenate(cls, tables):
+		# Tables are recoded to shared read and chrom lists, codes follow the order of first appearance
+		reads = {}
+		chroms = {}
+		parts = []
+		for table in tables:
+			rows = table.rows.copy()
+			read_codes = np.array([reads.setdefault(name, len(reads)) for name in table.reads], dtype=np.int32)
+			chrom_codes = np.array([chroms.setdefault(name, len(chroms)) for name in table.chroms], dtype=np.int16)
+			if len(rows) > 0:
+				rows["read"] = read_codes[rows["read"]]
+				rows["chrom"] = chrom_codes[rows["chrom"]]
+			parts.append(rows)
+		if len(parts) == 0:
+			parts.append(np.zeros(0, dtype=ALIGNMENT_DTYPE))
+		return cls(np.concatenate(parts), names_by_code(reads), names_by_code(chroms))
+
+	def read_name(self, i):
+		return self.reads[self.rows["read"][i]]
+
+	def chrom_name(self, i):
+		return self.chroms[self.rows["chrom"][i]]
+
+	def read_mask(self, select):
+		# Boolean mask of alignments whose read name passes select, select is called once per read
+		if len(self.reads) == 0:
+			return np.zeros(len(self.rows), dtype=bool)
+		passes = np.array([select(name) for name in self.reads], dtype=bool)
+		return passes[self.rows["read"]]
+
+	def query_span(self):
+		# Aligned part of the read in forward read coordinates
+		start = np.where(self.rows["strand"] < 0, self.rows["totlen"] - self.rows["pos"] - self.rows["len"], self.rows["pos"])
+		return start, start + self.rows["len"]
+
+	def best(self):
+		# Index of the highest scoring alignment, the last one wins ties
+		return np.lexsort((self.rows["offset"], self.rows["score"]))[-1]
+
+	def best_per_read(self):
+		# Indices of the best alignment of every read, in file order
+		order = np.lexsort((self.rows["offset"], self.rows["score"], self.rows["read"]))
+		codes = self.rows["read"][order]
+		last = np.append(codes[1:] != codes[:-1], True)
+		best = order[last]
+		return best[np.argsort(self.rows["offset"][best])]
+
+	def runs(self):
+		# yields (read, table) for every run of consecutive alignments of the same read
+		codes = self.rows["read"]
+		bounds = np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1, [len(codes)]))
+		for start, end in zip(bounds[:-1], bounds[1:]):
+			if end > start:
+				yield self.reads[codes[start]], self[start:end]
+
+	def by_read(self):
+		# yields (read, table) per read, alignments in file order
+		return self[np.lexsort((self.rows["offset"], self.rows["read"]))].runs()
+
+def iter_runs(tables):
+	# Runs of alignments of the same read, joined across table boundaries
+	pending = None
+	for table in tables:
+		for read, run in table.runs():
+			if pending is not None:
+				if pending[0] == read:
+					pending = (read, AlignmentTable.concatenate([pending[1], run]))
+					continue
+				yield pending
+			pending = (read, run)
+	if pending is not None:
+		yield pending
+
+def iter_reads(tables):
+	# (read, table) per read over all tables, reads in order of first appearance and alignments in file order.
+	# Tables are split per read as they come in, only reads found in more than one table are joined.
+	parts = {}
+	order = []
+	for table in tables:
+		for read, run in table.by_read():
+			if read not in parts:
+				parts[read] = []
+				order.append(read)
+			parts[read].append(run)
+	for read in order:
+		runs = parts.pop(read)
+		yield read, runs[0] if len(runs) == 1 else AlignmentTable.concatenate(runs)
+
+def best_per_read(tables):
+	# Best alignment of every read over all tables, in file order. Only the winners of each table are kept,
+	# so memory grows with the number of reads and not with the number of alignments.
+	best = AlignmentTable.concatenate([])
+	for table in tables:
+		best = AlignmentTable.concatenate([best, table[table.best_per_read()]])
+		best = best[best.best_per_read()]
+	return best
+
+# ------------------------------------------------------------------------------------------------------------------------
+
+def index_range(args):
+	maf_file, start, end = args
+	entries = []
+	with open(maf_file, 'rb') as f:
+		for record in iter_range(f, start, end):
+			entries.append((record.aln.loc, record.offset))
+	return entries
+
+def build_read_index(maf_file, nr_cpus=1):
+	# Read name -> byte offsets of its alignment blocks
+	index = {}
+	jobs = [(maf_file, start, end) for start, end in split_maf_file(maf_file, nr_cpus * 4)]
+	if nr_cpus <= 1:
+		results = (index_range(job) for job in jobs)
+	else:
+		pool = mp.Pool(processes=nr_cpus)
+		results = pool.map(index_range, jobs)
+		pool.close()
+		pool.join()
+	for entries in results:
+		for read, offset in entries:
+			if read not in index:
+				index[read] = []
+			index[read].append(offset)
+	return index
+
+def load_read_index(maf_file, nr_cpus=1):
+	# The index is stored next to the MAF file and rebuilt when the MAF file changes
+	index_file = maf_file + ".readidx.json"
+	stat = os.stat(maf_file)
+	if os.path.exists(index_file):
+		with open(index_file, 'r') as f:
+			stored = json.load(f)
+		if stored["size"] == stat.st_size and stored["mtime"] == int(stat.st_mtime):
+			return stored["reads"]
+	index = build_read_index(maf_file, nr_cpus)
+	with open(index_file, 'w') as f:
+		json.dump({"size":stat.st_size, "mtime":int(stat.st_mtime), "reads":index}, f)
+	return index
+
+def read_record(f, offset):
+	# MAFrecord of the block starting at offset
+	for record in iter_range(f, offset, offset + 1):
+		return record
+
+# ------------------------------------------------------------------------------------------------------------------------
+
+# Default chaining penalties
+GAP_PEN = 0.01
+OVL_PEN = 1.0
+MAX_OVL = 100
+
+NO_CHAIN = (float("-inf"), -1)
+
+class MaxTree:
+	"""Segment tree with point updates and range maximum queries"""
+
+	def __init__(self, size):
+		self.size = 1
+		while self.size < size:
+			self.size *= 2
+		self.tree = [NO_CHAIN] * (2 * self.size)
+
+	def update(self, i, value):
+		i += self.size
+		self.tree[i] = value
+		i //= 2
+		while i >= 1:
+			self.tree[i] = max(self.tree[2*i], self.tree[2*i+1])
+			i //= 2
+
+	def query(self, lo, hi):
+		# Maximum over [lo, hi)
+		result = NO_CHAIN
+		lo += self.size
+		hi += self.size
+		while lo < hi:
+			if lo & 1:
+				result = max(result, self.tree[lo])
+				lo += 1
+			if hi & 1:
+				hi -= 1
+				result = max(result, self.tree[hi])
+			lo //= 2
+			hi //= 2
+		return result
+
+def chain_alignments(alignments, gap_pen=GAP_PEN, ovl_pen=OVL_PEN, max_ovl=MAX_OVL):
+	# Weighted interval scheduling over the read: alignments are visited by start position, the best chain ending
+	# in an alignment extends the best chain of an alignment that starts before it and either ends before it
+	# (minus a gap penalty) or overlaps it by at most max_ovl bases and less than half its length (minus an
+	# overlap penalty). Both are range maximum queries over the end positions, in O(n log n).
+	starts, ends = alignments.query_span()
+	starts = starts.tolist()
+	ends = ends.tolist()
+	scores = alignments.rows["score"].tolist()
+	by_end = sorted(range(len(alignments)), key=lambda k: (ends[k], starts[k]))
+	rank = [0] * len(by_end)
+	for r, k in enumerate(by_end):
+		rank[k] = r
+	sorted_ends = [ends[k] for k in by_end]
+	best = [0.0] * len(by_end)
+	prev = [-1] * len(by_end)
+
+	# best + gap_pen*end, for predecessors without overlap
+	gapped = MaxTree(len(by_end))
+	# best - ovl_pen*end, for overlapping predecessors
+	overlapping = MaxTree(len(by_end))
+	# Alignments with the same start are added to the trees together, so they never extend each other
+	pending = []
+
+	for j in sorted(range(len(by_end)), key=lambda k: (starts[k], ends[k])):
+		start, end = starts[j], ends[j]
+		if pending and starts[pending[0]] < start:
+			for i in pending:
+				gapped.update(rank[i], (best[i] + gap_pen*ends[i], i))
+				overlapping.update(rank[i], (best[i] - ovl_pen*ends[i], i))
+			pending = []
+		score = scores[j]
+		best[j] = score
+
+		last = bisect_right(sorted_ends, start)
+		if last > 0:
+			value, i = gapped.query(0, last)
+			if i >= 0 and value - gap_pen*start + score > best[j]:
+				best[j] = value - gap_pen*start + score
+				prev[j] = i
+
+		# The predecessor starts before this alignment, so the overlap is its end minus this start
+		stop = bisect_right(sorted_ends, min(start + max_ovl, (start + end - 1) // 2))
+		if stop > last:
+			value, i = overlapping.query(last, stop)
+			if i >= 0 and value + ovl_pen*start + score > best[j]:
+				best[j] = value + ovl_pen*start + score
+				prev[j] = i
+		pending.append(j)
+
+	# Trace back from the best scoring chain end
+	j = max(by_end, key=lambda x: best[x])
+	chain = []
+	while j >= 0:
+		chain.append(j)
+		j = prev[j]
+	chain.reverse()
+	return alignments[chain]
@@ -0,0 +1,52 @@
+#!/opt/local/bin/python2.7
+
+# GENERAL
+import unittest
+
+# TABLES
+import numpy as np
+
+from MAF_reader import AlignmentTable, ALIGNMENT_DTYPE, chain_alignments
+
+# ------------------------------------------------------------------------------------------------------------------------
+
+def make_table(alignments, totlen=2000):
+	# alignments as (read start, read end, score) on the forward strand of one read
+	rows = [(0, 0, 1, 1, 10000*i, end-start, start, end-start, totlen, score, 100*i) for i, (start, end, score) in enumerate(alignments)]
+	return AlignmentTable(np.array(rows, dtype=ALIGNMENT_DTYPE), ["read"], ["1"])
+
+def chained_spans(table):
+	chain = chain_alignments(table)
+	starts, ends = chain.query_span()
+	return zip(starts.tolist(), ends.tolist())
+
+class ChainAlignmentsTest(unittest.TestCase):
+
+	def test_contained_alignment_does_not_chain(self):
+		table = make_table([(100, 1000, 900), (110, 150, 200)])
+		self.assertEqual(chained_spans(table), [(100, 1000)])
+
+	def test_contained_alignment_is_not_a_predecessor(self):
+		# A later alignment may not chain through an alignment that lies within its predecessor
+		table = make_table([(100, 1000, 900), (110, 150, 200), (1000, 1500, 500)])
+		self.assertEqual(chained_spans(table), [(100, 1000), (1000, 1500)])
+
+	def test_same_start_does_not_chain(self):
+		table = make_table([(100, 150, 100), (100, 1000, 900)])
+		self.assertEqual(chained_spans(table), [(100, 1000)])
+
+	def test_gapped_alignments_chain(self):
+		table = make_table([(1000, 1500, 500), (0, 900, 900)])
+		self.assertEqual(chained_spans(table), [(0, 900), (1000, 1500)])
+
+	def test_overlap_is_charged(self):
+		# 50 bases overlap cost 50 with the default penalty
+		table = make_table([(0, 900, 900), (850, 1500, 600)])
+		self.assertEqual(chained_spans(table), [(0, 900), (850, 1500)])
+
+	def test_overlap_above_maximum_does_not_chain(self):
+		table = make_table([(0, 900, 900), (700, 1500, 600)])
+		self.assertEqual(chained_spans(table), [(0, 900)])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,5 +1,12 @@
 #!/usr/bin/python
 import argparse
+import gzip
+import multiprocessing as mp
+import os
+import shutil
+import sys
+
+import numpy as np
 
 
 #HISEQ_HU01:54:C2FA5ACXX:8:2203:19371:16893	99	1	1591985	40	=	1592468	584	Library10
@@ -21,12 +28,13 @@ import argparse
   
 def init():
   parser = argparse.ArgumentParser(prog='Parse_Delly_Calls.py', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-  parser.add_argument('-i', help='Input calls file')
+  parser.add_argument('-i', help='Input calls file, may be gzipped')
   parser.add_argument('-s', help='Sample definitions file')
   parser.add_argument('-o',  default='INFILE.calls.txt', help='Output tab delimited text file')
   parser.add_argument('-f',  default=False, type=bool, help='Flag to toggle filtering [True|False]')
   parser.add_argument('-qc', default=20, type=int, help='Minimum mapping quality [0-100]')
   parser.add_argument('-rp', default=10, type=int, help='Minimum number of supporting read pairs [1-x]')
+  parser.add_argument('-t',  default=1,  type=int, help='Number of processes, uncompressed input is split in byte ranges at record boundaries')
 
   args = parser.parse_args()
 
@@ -69,79 +77,173 @@ def read_sample_names(samples_file):
 
 # ---------------------------------------------------------
 
-def make_header_string(samples):
+def make_header_string(sample_names):
  
   header = "Chromosome\tStart\tStop\tSize\tSupport\tQual\tID"
   
-  sorter = sorted(samples)
-  for sample_name in sorter:
-    header = header + '\t' + sample_name
-  
-  return(header+'\n')
+  return(header+'\t'+'\t'.join(sample_names)+'\n')
   
 # ---------------------------------------------------------
 
-def make_region_string(items, samples):
-  #1	1593149	1659164	66015	2	0	>Deletion_xxx_00000687<  
- 
-  sorter = sorted(samples)
-  line = "{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}".format(*items)
-  for sample_name in sorter:
-    line = line + '\t' + str(samples[sample_name])
+def make_library_index(sample_ids):
+  # sample names are sorted once, every library gets the array index of its sample
+  sample_names = sorted(set(sample_ids.values()))
+  sample_index = dict((sample_name, i) for i, sample_name in enumerate(sample_names))
+  library_index = dict((library, sample_index[sample_ids[library]]) for library in sample_ids)
   
-  return(line+'\n')
+  return(sample_names, library_index)
 
+# ---------------------------------------------------------
 
+def open_calls_file(calls_file):
+  if calls_file.endswith(".gz"):
+    return(gzip.open(calls_file, 'rb'))
+  return(open(calls_file, 'r', 1<<20))
 
 # ---------------------------------------------------------
 
-def run(args):
-  
-  sample_ids = read_sample_names(args.s)
-  
-  
-  samples = {}
-  #reads = []
-  
-  for sample_id in sample_ids:
-    samples[sample_ids[sample_id]] = 0
-  
-  
-  ifile = open(args.i, 'r')
-  ofile = open(args.o, 'w')
-  
-  ofile.write(make_header_string(samples))
+def parse_calls(ifile, library_index, nr_samples, args):
+  # generator of (summary items, support counts per sample), the counts array is reused for every region
+  counts = np.zeros(nr_samples, dtype=np.int64)
+  unknown = set()
   
   for line in ifile:
-    items = line.strip().split('\t')
-    
-    if line.startswith("HISEQ"):
-      #reads.append(items)
-      samples[sample_ids[items[-1]]] += 1
-      continue
-      
     if line.startswith("----"):
       continue
     
+    items = line.rstrip('\n').split('\t')
     if len(items) <= 1:
       continue
-  
+    
+    # read line, the last column is the library, any read name prefix is allowed
+    #HISEQ_HU01:54:C2FA5ACXX:8:2203:19371:16893	99	1	1591985	40	=	1592468	584	Library10
+    if len(items) > 7:
+      library = items[-1]
+      if library in library_index:
+        counts[library_index[library]] += 1
+      elif library not in unknown:
+        unknown.add(library)
+        sys.stderr.write("WARNING:\tlibrary "+library+" not in sample definitions file\n")
+      continue
+    
     #summary line
-    if args.f:
-      #int(items[4]) >= args.rp and
-      if int(items[5]) >= args.qc:	# Summary must match QC
-	if max(samples.values()) >= args.qc:				# At least one sample should match RP
-	  ofile.write(make_region_string(items, samples))
-    else:
-      ofile.write(make_region_string(items, samples))
-    #reads=[]
+    #1	1593149	1659164	66015	2	0	>Deletion_xxx_00000687<
+    if filter_region(items, counts, args):
+      yield(items, counts)
     
-    for sample_name in samples:
-      samples[sample_name] = 0
+    counts[:] = 0
+
+# ---------------------------------------------------------
+
+def filter_region(items, counts, args):
+  if not args.f:
+    return(True)
   
+  #int(items[4]) >= args.rp and
+  if int(items[5]) < args.qc:		# Summary must match QC
+    return(False)
   
-  ofile.close()
+  return(counts.max() >= args.rp)	# At least one sample should match RP
+
+# ---------------------------------------------------------
+
+def write_regions(ofile, regions):
+  for items, counts in regions:
+    ofile.write('\t'.join(items[:7])+'\t'+'\t'.join(map(str, counts.tolist()))+'\n')
+
+# ---------------------------------------------------------
+
+def find_record_boundary(ifile, offset):
+  # first position after a summary line at or after offset, records end with a ---- line followed by the summary line
+  ifile.seek(offset)
+  if offset > 0:
+    ifile.readline()
+  
+  while True:
+    line = ifile.readline()
+    if not line:
+      return(ifile.tell())
+    if line.startswith("----"):
+      ifile.readline()
+      return(ifile.tell())
+
+# ---------------------------------------------------------
+
+def split_calls_file(calls_file, nr_chunks):
+  size = os.path.getsize(calls_file)
+  boundaries = [0]
+  
+  ifile = open(calls_file, 'r')
+  for i in range(1, nr_chunks):
+    boundary = find_record_boundary(ifile, max(boundaries[-1], size*i/nr_chunks))
+    if boundary >= size:
+      break
+    if boundary > boundaries[-1]:
+      boundaries.append(boundary)
+  ifile.close()
+  
+  boundaries.append(size)
+  return(zip(boundaries[:-1], boundaries[1:]))
+
+# ---------------------------------------------------------
+
+def read_range(calls_file, start, end):
+  ifile = open(calls_file, 'r', 1<<20)
+  ifile.seek(start)
+  pos = start
+  while pos < end:
+    line = ifile.readline()
+    if not line:
+      break
+    pos += len(line)
+    yield line
   ifile.close()
+
+# ---------------------------------------------------------
+
+def parse_range(arguments):
+  # runs in a worker process, the filtered regions of one byte range are written to a part file
+  args, library_index, nr_samples, start, end, part_file = arguments
+  
+  ofile = open(part_file, 'w', 1<<20)
+  write_regions(ofile, parse_calls(read_range(args.i, start, end), library_index, nr_samples, args))
+  ofile.close()
+  
+  return(part_file)
+
+# ---------------------------------------------------------
+
+def run_parallel(args, library_index, nr_samples, ofile):
+  ranges = split_calls_file(args.i, args.t*4)
+  jobs = [(args, library_index, nr_samples, start, end, "%s.part%05i"%(args.o, i)) for i, (start, end) in enumerate(ranges)]
+  
+  pool = mp.Pool(args.t)
+  # parts are concatenated in input order
+  for part_file in pool.imap(parse_range, jobs):
+    with open(part_file, 'r') as pfile:
+      shutil.copyfileobj(pfile, ofile, 1<<20)
+    os.remove(part_file)
+  pool.close()
+  pool.join()
+
+# ---------------------------------------------------------
+
+def run(args):
+  
+  sample_ids = read_sample_names(args.s)
+  sample_names, library_index = make_library_index(sample_ids)
+  
+  ofile = open(args.o, 'w', 1<<20)
+  ofile.write(make_header_string(sample_names))
+  
+  if args.t > 1 and not args.i.endswith(".gz"):
+    run_parallel(args, library_index, len(sample_names), ofile)
+  else:
+    ifile = open_calls_file(args.i)
+    write_regions(ofile, parse_calls(ifile, library_index, len(sample_names), args))
+    ifile.close()
+  
+  ofile.close()
       
 # ---------------------------------------------------------
 
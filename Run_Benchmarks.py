@@ -0,0 +1,749 @@
+#!/usr/bin/python2.7
+# Runs the scripts in this repository on deterministic synthetic inputs at several scales and
+# writes wall time, CPU time, peak RSS and records/sec of every run to a JSON results file
+
+import os
+import sys
+import json
+import time
+import array
+import pickle
+import random
+import shutil
+import signal
+import tempfile
+import platform
+import argparse
+import subprocess
+from distutils.spawn import find_executable
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHROMS = [str(i) for i in range(1, 23)] + ["X"]
+CHROM_LENGTH = 100000000
+BASES = "ACGT"
+
+# ---------------------------------------------------------
+# Helpers shared by the generators
+
+def spread(n):
+	# (chromosome, index on the chromosome) of n items divided evenly over the chromosomes, in sorted order
+	for c, chrom in enumerate(CHROMS):
+		for k in range(n * (c + 1) // len(CHROMS) - n * c // len(CHROMS)):
+			yield chrom, k
+
+def weighted_choice(rng, items):
+	# items are tuples with the weight as last element
+	r = rng.random() * sum(item[-1] for item in items)
+	for item in items:
+		r -= item[-1]
+		if r < 0:
+			return item
+	return items[-1]
+
+def other_base(rng, base):
+	return rng.choice([b for b in BASES if b != base])
+
+def chrom_sort_key(line):
+	items = line.split('\t', 2)
+	return (CHROMS.index(items[0]), int(items[1]))
+
+def bgzip_and_index(path, options, columns=None):
+	# bgzip the file in place and tabix index it, VCF preset unless the sequence/start/end columns are given
+	subprocess.check_call([options.bgzip, "-f", path])
+	command = [options.tabix, "-f"]
+	if columns:
+		command += ["-s", str(columns[0]), "-b", str(columns[1]), "-e", str(columns[2])]
+	else:
+		command += ["-p", "vcf"]
+	subprocess.check_call(command + [path+".gz"])
+	return path+".gz"
+
+# ---------------------------------------------------------
+# Structural variants, Delly and Manta VCFs
+
+DELLY_HEADER = """##fileformat=VCFv4.1
+##FILTER=<ID=LowQual,Description="PE/SR support below 3 or mapping quality below 20.">
+##INFO=<ID=CIEND,Number=2,Type=Integer,Description="PE confidence interval around END">
+##INFO=<ID=CIPOS,Number=2,Type=Integer,Description="PE confidence interval around POS">
+##INFO=<ID=CHR2,Number=1,Type=String,Description="Chromosome for END coordinate in case of a translocation">
+##INFO=<ID=END,Number=1,Type=Integer,Description="End position of the structural variant">
+##INFO=<ID=PE,Number=1,Type=Integer,Description="Paired-end support of the structural variant">
+##INFO=<ID=MAPQ,Number=1,Type=Integer,Description="Median mapping quality of paired-ends">
+##INFO=<ID=SVTYPE,Number=1,Type=String,Description="Type of structural variant">
+##INFO=<ID=SVMETHOD,Number=1,Type=String,Description="Type of approach used to detect SV">
+##INFO=<ID=INSLEN,Number=1,Type=Integer,Description="Predicted length of the insertion">
+##INFO=<ID=IMPRECISE,Number=0,Type=Flag,Description="Imprecise structural variation">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype Quality">
+##FORMAT=<ID=DV,Number=1,Type=Integer,Description="# high-quality variant pairs">
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO	FORMAT	TUMOR	NORMAL
+"""
+
+MANTA_HEADER = """##fileformat=VCFv4.1
+##source=GenerateSVCandidates 1.1.0
+##cmdline=/opt/manta_1.1.0/bin/configManta.py --normalBam NORMAL.bam --tumorBam TUMOR.bam
+##INFO=<ID=IMPRECISE,Number=0,Type=Flag,Description="Imprecise structural variation">
+##INFO=<ID=SVTYPE,Number=1,Type=String,Description="Type of structural variant">
+##INFO=<ID=SVLEN,Number=.,Type=Integer,Description="Difference in length between REF and ALT alleles">
+##INFO=<ID=END,Number=1,Type=Integer,Description="End position of the variant described in this record">
+##INFO=<ID=CIPOS,Number=2,Type=Integer,Description="Confidence interval around POS">
+##INFO=<ID=CIEND,Number=2,Type=Integer,Description="Confidence interval around END">
+##INFO=<ID=MATEID,Number=.,Type=String,Description="ID of mate breakend">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=PR,Number=.,Type=Integer,Description="Spanning paired-read support for the ref and alt alleles in the order listed">
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO	FORMAT	NORMAL	TUMOR
+"""
+
+SV_TYPES = [("DEL", 0.4), ("DUP", 0.15), ("INV", 0.15), ("INS", 0.1), ("TRA", 0.2)]
+MANTA_ALTS = {"DEL":"<DEL>", "DUP":"<DUP:TANDEM>", "INV":"<INV>", "INS":"<INS>"}
+
+def sv_events(n, rng):
+	# n events at least 800 bp apart in the first half of the chromosomes, called by Delly, Manta or both.
+	# Translocation partners are placed on their own grid in the second half, and translocations are never
+	# called by both, so only the events meant to be merged share a confidence interval.
+	events = []
+	partners = dict((chrom, 0) for chrom in CHROMS)
+	for chrom, k in spread(n):
+		pos = 10000 + k * 1000 + rng.randint(0, 200)
+		svtype = weighted_choice(rng, SV_TYPES)[0]
+		chrom2 = chrom
+		if svtype == "TRA":
+			chrom2 = rng.choice(CHROMS)
+			partners[chrom2] += 1
+			end = CHROM_LENGTH // 2 + partners[chrom2] * 1000 + rng.randint(0, 200)
+			size = 0
+		elif svtype == "INS":
+			size = rng.randint(20, 500)
+			end = pos
+		else:
+			size = int(10 ** rng.uniform(2, 6))
+			end = pos + size
+		r = rng.random()
+		callers = "delly" if r < 0.35 else "manta" if r < 0.7 or svtype == "TRA" else "both"
+		events.append((chrom, pos, svtype, chrom2, end, size, rng.randint(10, 100), callers))
+	return events
+
+def delly_line(i, event, rng):
+	chrom, pos, svtype, chrom2, end, size, ci, callers = event
+	info = "IMPRECISE;SVTYPE=%s;SVMETHOD=EMBL.DELLYv0.7.7;CHR2=%s;END=%i;INSLEN=%i;PE=%i;MAPQ=60;CIPOS=-%i,%i;CIEND=-%i,%i" %(svtype, chrom2, end, size if svtype == "INS" else 0, rng.randint(3, 40), ci, ci, ci, ci)
+	return "%s\t%i\t%s%08i\tN\t<%s>\t.\tPASS\t%s\tGT:GQ:DV\t0/1:99:%i\t0/0:99:0\n" %(chrom, pos, svtype, i, svtype, info, rng.randint(3, 40))
+
+def manta_lines(i, event, rng):
+	chrom, pos, svtype, chrom2, end, size, ci, callers = event
+	sample = "GT:PR\t0/0:%i,0\t0/1:%i,%i" %(rng.randint(20, 60), rng.randint(10, 40), rng.randint(3, 30))
+	if callers == "both":
+		# the same event as called by Delly, with slightly different breakpoints
+		shift = rng.randint(-10, 10)
+		pos += shift
+		end += shift
+	if svtype == "TRA":
+		ids = ("MantaBND:%i:0:1:0:0:0:0" %(i), "MantaBND:%i:0:1:0:0:0:1" %(i))
+		return [
+			"%s\t%i\t%s\tN\tN[%s:%i[\t.\tPASS\tIMPRECISE;SVTYPE=BND;MATEID=%s;CIPOS=-%i,%i\t%s\n" %(chrom, pos, ids[0], chrom2, end, ids[1], ci, ci, sample),
+			"%s\t%i\t%s\tN\t]%s:%i]N\t.\tPASS\tIMPRECISE;SVTYPE=BND;MATEID=%s;CIPOS=-%i,%i\t%s\n" %(chrom2, end, ids[1], chrom, pos, ids[0], ci, ci, sample)]
+	svlen = -size if svtype == "DEL" else size
+	info = "IMPRECISE;SVTYPE=%s;SVLEN=%i;END=%i;CIPOS=-%i,%i;CIEND=-%i,%i" %(svtype, svlen, end, ci, ci, ci, ci)
+	return ["%s\t%i\tManta%s:%i:0:0:0:0:0\tN\t%s\t.\tPASS\t%s\t%s\n" %(chrom, pos, svtype, i, MANTA_ALTS[svtype], info, sample)]
+
+def write_sv_vcfs(delly_file, manta_file, n, rng):
+	# returns the number of Delly and Manta records
+	delly = []
+	manta = []
+	for i, event in enumerate(sv_events(n, rng)):
+		if event[-1] != "manta":
+			delly.append(delly_line(i, event, rng))
+		if event[-1] != "delly":
+			manta.extend(manta_lines(i, event, rng))
+	manta.sort(key=chrom_sort_key)
+
+	for filename, header, lines in [(delly_file, DELLY_HEADER, delly), (manta_file, MANTA_HEADER, manta)]:
+		with open(filename, 'w') as outfile:
+			outfile.write(header)
+			outfile.writelines(lines)
+	return len(delly), len(manta)
+
+# ---------------------------------------------------------
+# Delly read pair calls, as parsed by Parse_Delly_Calls.py
+
+NR_LIBRARIES = 12
+NR_SAMPLES = 4
+
+def write_delly_calls(calls_file, samples_file, n, rng):
+	with open(samples_file, 'w') as outfile:
+		outfile.write("Library\tSample\n")
+		for i in range(NR_LIBRARIES):
+			outfile.write("Library%i\tSample%i\n" %(i+1, i % NR_SAMPLES + 1))
+
+	with open(calls_file, 'w') as outfile:
+		for i, (chrom, k) in enumerate(spread(n)):
+			start = 100000 + k * 2000 + rng.randint(0, 500)
+			stop = start + rng.randint(300, 50000)
+			mapq = rng.choice([0, 20, 40, 60])
+			nr_reads = rng.randint(2, 8)
+			for j in range(nr_reads):
+				pos = start - rng.randint(0, 300)
+				mate = stop + rng.randint(0, 300)
+				outfile.write("HISEQ_HU01:54:C2FA5ACXX:%i:%i:%i:%i\t%i\t%s\t%i\t%i\t=\t%i\t%i\tLibrary%i\n" %(rng.randint(1, 8), rng.randint(1101, 2316), rng.randint(1000, 20000), rng.randint(1000, 100000), rng.choice([97, 99]), chrom, pos, mapq, mate, mate - pos, rng.randint(1, NR_LIBRARIES)))
+			outfile.write("---------------------------------------------\n")
+			outfile.write("%s\t%i\t%i\t%i\t%i\t%i\t>Deletion_xxx_%08i<\n\n" %(chrom, start, stop, stop - start, nr_reads, mapq, i))
+	return n
+
+# ---------------------------------------------------------
+# Annotated SNV VCFs and CADD score files
+
+SNV_HEADER = """##fileformat=VCFv4.1
+##INFO=<ID=AC,Number=A,Type=Integer,Description="Allele count in genotypes, for each ALT allele">
+##INFO=<ID=AF,Number=A,Type=Float,Description="Allele Frequency, for each ALT allele">
+##INFO=<ID=AN,Number=1,Type=Integer,Description="Total number of alleles in called genotypes">
+##INFO=<ID=DP,Number=1,Type=Integer,Description="Approximate read depth">
+##INFO=<ID=MLEAF,Number=A,Type=Float,Description="Maximum likelihood expectation (MLE) for the allele frequency">
+##INFO=<ID=GoNLv5_AF,Number=A,Type=Float,Description="Allele frequency in GoNL release 5">
+##INFO=<ID=ANN,Number=.,Type=String,Description="Functional annotations: 'Allele | Annotation | Annotation_Impact | Gene_Name | Gene_ID | Feature_Type | Feature_ID | Transcript_BioType | Rank | HGVS.c | HGVS.p | cDNA.pos / cDNA.length | CDS.pos / CDS.length | AA.pos / AA.length | Distance | ERRORS / WARNINGS / INFO' ">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=AD,Number=.,Type=Integer,Description="Allelic depths for the ref and alt alleles in the order listed">
+##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Approximate read depth">
+##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype Quality">
+"""
+
+SNV_EFFECTS = [("missense_variant", "MODERATE", 0.35), ("synonymous_variant", "LOW", 0.25), ("intron_variant", "MODIFIER", 0.2), ("splice_region_variant", "LOW", 0.1), ("stop_gained", "HIGH", 0.1)]
+INDEL_EFFECTS = [("frameshift_variant", "HIGH", 0.5), ("inframe_deletion", "MODERATE", 0.25), ("disruptive_inframe_insertion", "MODERATE", 0.25)]
+SNV_SAMPLES = ["S%i" %(i+1) for i in range(4)]
+VARIANTS_PER_GENE = 50
+COHORT_SIZE = 20
+VARIANT_SPACING = 200
+
+def snv_genes(n):
+	# one gene per VARIANTS_PER_GENE variants, in the format of the Ensembl lookups of Make_Somatic_Mutation_Overview.py
+	genes = []
+	for g, (chrom, k) in enumerate(spread(max(1, n // VARIANTS_PER_GENE))):
+		start = 1000000 + k * 2 * VARIANTS_PER_GENE * VARIANT_SPACING
+		genes.append({"Chr":chrom, "Start":start, "Stop":start + VARIANTS_PER_GENE * VARIANT_SPACING, "SYMBOL":"GENE%05i" %(g), "ENSEMBLID":"ENSG%011i" %(g)})
+	return genes
+
+def annotation(allele, effect, impact, gene, transcript, hgvs_c, hgvs_p):
+	return "|".join([allele, effect, impact, gene["SYMBOL"], gene["ENSEMBLID"], "transcript", transcript, "protein_coding", "1/10", hgvs_c, hgvs_p, "", "", "", "", ""])
+
+def write_snv_vcf(vcf_file, genes, n, rng):
+	# n variants divided over the genes, 10% indels, returns (chrom, pos, ref, alt) of every variant
+	variants = []
+	outfile = open(vcf_file, 'w')
+	outfile.write(SNV_HEADER)
+	outfile.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t"+"\t".join(SNV_SAMPLES)+"\n")
+	for g, gene in enumerate(genes):
+		for j in range(n * (g + 1) // len(genes) - n * g // len(genes)):
+			pos = gene["Start"] + j * VARIANT_SPACING + rng.randint(1, VARIANT_SPACING // 2)
+			ref = rng.choice(BASES)
+			if rng.random() < 0.1:
+				if rng.random() < 0.5:
+					alt = ref + rng.choice(BASES)
+				else:
+					alt = ref
+					ref = ref + rng.choice(BASES)
+				effect, impact = weighted_choice(rng, INDEL_EFFECTS)[:2]
+			else:
+				alt = other_base(rng, ref)
+				effect, impact = weighted_choice(rng, SNV_EFFECTS)[:2]
+
+			calls = []
+			ac = 0
+			depth = 0
+			for sample in SNV_SAMPLES:
+				dp = rng.randint(5, 60)
+				if rng.random() < 0.3:
+					ad = int(dp * rng.uniform(0.1, 0.6))
+					calls.append("0/1:%i,%i:%i:99" %(dp - ad, ad, dp))
+					ac += 1
+				else:
+					calls.append("0/0:%i,0:%i:99" %(dp, dp))
+				depth += dp
+
+			ann = [annotation(alt, effect, impact, gene, "ENST%011i" %(2*g), "c.%i%s>%s" %(3*j+1, ref, alt), "p.Xaa%iYaa" %(j+1)),
+			       annotation(alt, "intron_variant", "MODIFIER", gene, "ENST%011i" %(2*g+1), "c.%i-12%s>%s" %(3*j+1, ref, alt), "")]
+			# MLEAF as if called in a cohort of COHORT_SIZE samples, so the cohort frequency filter passes most variants
+			info = "AC=%i;AF=%.3f;AN=%i;DP=%i;MLEAF=%.3f;GoNLv5_AF=%.4f;ANN=%s" %(ac, ac / (2.0*len(SNV_SAMPLES)), 2*len(SNV_SAMPLES), depth, (ac + rng.randint(0, 4)) / (2.0*COHORT_SIZE), rng.random() * 0.1, ",".join(ann))
+			outfile.write("%s\t%i\t.\t%s\t%s\t%i\tPASS\t%s\tGT:AD:DP:GQ\t%s\n" %(gene["Chr"], pos, ref, alt, rng.randint(30, 5000), info, "\t".join(calls)))
+			variants.append((gene["Chr"], pos, ref, alt))
+	outfile.close()
+	return variants
+
+def write_cadd_files(snv_file, indel_file, variants, rng):
+	# CADD scores of all substitutions at and next to the SNVs and of the indels plus one other indel at their position
+	header = "## CADD v1.3 (c) University of Washington and Hudson-Alpha Institute for Biotechnology 2013-2015. All rights reserved.\n#Chrom\tPos\tRef\tAlt\tRawScore\tPHRED\n"
+	snvs = open(snv_file, 'w')
+	indels = open(indel_file, 'w')
+	snvs.write(header)
+	indels.write(header)
+	for chrom, pos, ref, alt in variants:
+		if len(ref) == 1 and len(alt) == 1:
+			for p in [pos-1, pos, pos+1]:
+				base = ref if p == pos else rng.choice(BASES)
+				for other in BASES:
+					if other != base:
+						snvs.write("%s\t%i\t%s\t%s\t%.6f\t%.3f\n" %(chrom, p, base, other, rng.uniform(-3, 5), rng.uniform(0, 40)))
+		else:
+			for other in sorted([alt, ref[0] + "TT" if len(alt) == 1 else ref[0]]):
+				indels.write("%s\t%i\t%s\t%s\t%.6f\t%.3f\n" %(chrom, pos, ref, other, rng.uniform(-3, 5), rng.uniform(0, 40)))
+	snvs.close()
+	indels.close()
+
+# ---------------------------------------------------------
+# Freebayes VCFs with the sample names in the commandline header
+
+FREEBAYES_HEADER = """##fileformat=VCFv4.1
+##source=freeBayes v0.9.9
+##commandline="freebayes -f GRCh37_gatk.fasta -C 3 --pooled-discrete --genotype-qualities --min-coverage 5 /data/freebayes/merged_%sR_F3_rmdup.bam /data/freebayes/merged_%sT_F3_rmdup.bam"
+##INFO=<ID=DP,Number=1,Type=Integer,Description="Total read depth at the locus">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read Depth">
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO	FORMAT	unknown	unknown
+"""
+NR_FREEBAYES_FILES = 4
+
+def write_freebayes_vcfs(vcfdir, n, rng):
+	for f in range(NR_FREEBAYES_FILES):
+		sample = "MBC%03i" %(f+1)
+		with open(os.path.join(vcfdir, "merged_%s_freebayes.vcf" %(sample)), 'w') as outfile:
+			outfile.write(FREEBAYES_HEADER %(sample, sample))
+			for chrom, k in spread(n * (f + 1) // NR_FREEBAYES_FILES - n * f // NR_FREEBAYES_FILES):
+				ref = rng.choice(BASES)
+				dp = rng.randint(5, 80)
+				outfile.write("%s\t%i\t.\t%s\t%s\t%.2f\t.\tDP=%i\tGT:DP\t0/1:%i\t0/0:%i\n" %(chrom, 10000 + k * 500 + rng.randint(0, 400), ref, other_base(rng, ref), rng.uniform(10, 2000), 2*dp, dp, dp))
+	return n
+
+# ---------------------------------------------------------
+# FREEC CNV and ratio files of sample groups with a BULK control
+
+RATIO_WINDOW = 10000
+FREEC_GROUPS = ["P1", "P2"]
+FREEC_CONDITIONS = ["BULK", "CLONE1", "CLONE2"]
+
+def cnv_segments(nr_segments, windows_per_chrom, rng):
+	segments = []
+	for i in range(nr_segments):
+		chrom = rng.choice([chrom for chrom in CHROMS if windows_per_chrom.get(chrom, 0) > 0])
+		start = rng.randint(0, windows_per_chrom[chrom] - 1) * RATIO_WINDOW
+		cn = rng.choice([0, 1, 3, 4])
+		segments.append((chrom, start, start + rng.randint(6, 200) * RATIO_WINDOW, cn, "gain" if cn > 2 else "loss"))
+	return segments
+
+def write_freec_files(rundir, n, rng):
+	# n ratio rows divided over the files, controls share half of their CNVs with the panel and the derivatives
+	# share the CNVs of their control. Returns the sample sheet, the panel and the number of records
+	rows = max(1, n // (len(FREEC_GROUPS) * len(FREEC_CONDITIONS)))
+	windows = list(spread(rows))
+	windows_per_chrom = {}
+	for chrom, k in windows:
+		windows_per_chrom[chrom] = k + 1
+	nr_segments = max(2, rows // 200)
+
+	sample_sheet = os.path.join(rundir, "samples.txt")
+	panel = os.path.join(rundir, "panel.bed")
+	sheet = open(sample_sheet, 'w')
+	sheet.write("sample\tcondition\tcnv_file\tratio_file\n")
+	recurrent = []
+	records = 0
+	for group in FREEC_GROUPS:
+		control_segments = cnv_segments(nr_segments, windows_per_chrom, rng)
+		recurrent.extend(control_segments[:nr_segments // 2])
+		for condition in FREEC_CONDITIONS:
+			segments = list(control_segments)
+			if condition not in ["BULK", "BLOOD"]:
+				segments += cnv_segments(nr_segments, windows_per_chrom, rng)
+			segments.sort(key=lambda segment: (CHROMS.index(segment[0]), segment[1]))
+
+			cnv_file = os.path.join(rundir, "%s_%s_CNVs.txt" %(group, condition))
+			ratio_file = os.path.join(rundir, "%s_%s_ratio.txt" %(group, condition))
+			with open(cnv_file, 'w') as outfile:
+				for segment in segments:
+					outfile.write("%s\t%i\t%i\t%i\t%s\n" %segment)
+
+			ratios = {}
+			for chrom, start, end, cn, status in segments:
+				for pos in range(start, end, RATIO_WINDOW):
+					ratios[(chrom, pos)] = cn
+			with open(ratio_file, 'w') as outfile:
+				outfile.write("Chromosome\tStart\tRatio\tMedianRatio\tCopyNumber\n")
+				for chrom, k in windows:
+					cn = ratios.get((chrom, k * RATIO_WINDOW), 2)
+					outfile.write("%s\t%i\t%.3f\t%.3f\t%i\n" %(chrom, k * RATIO_WINDOW, cn / 2.0 + rng.gauss(0, 0.05), cn / 2.0, cn))
+			sheet.write("%s\t%s\t%s\t%s\n" %(group, condition, cnv_file, ratio_file))
+			records += len(segments) + len(windows)
+	sheet.close()
+
+	recurrent.sort(key=lambda segment: (CHROMS.index(segment[0]), segment[1]))
+	with open(panel, 'w') as outfile:
+		for chrom, start, end, cn, status in recurrent:
+			outfile.write("%s\t%i\t%i\t2\n" %(chrom, start, end))
+	return sample_sheet, panel, records
+
+# ---------------------------------------------------------
+# LAST alignments of nanopore reads in MAF format
+
+MAF_HEADER = "# LAST version 963\n#\n# a=21 b=9 A=20 B=3 e=60 d=300 x=59 y=17 z=59 D=1e+06 E=5.26e+07\n#\n"
+
+def write_maf(maf_file, n, rng):
+	# n alignments of reads that span one of n/20 junctions, 2 or 3 alignments per read grouped by read.
+	# Returns the number of alignments written
+	pool = "".join(rng.choice(BASES) for i in range(1 << 16))
+	junctions = []
+	for i in range(max(1, n // 20)):
+		junctions.append((rng.choice(CHROMS), rng.randint(10000, CHROM_LENGTH - 10000), rng.choice(CHROMS), rng.randint(10000, CHROM_LENGTH - 10000), rng.choice("+-")))
+
+	outfile = open(maf_file, 'w')
+	outfile.write(MAF_HEADER)
+	written = 0
+	read = 0
+	while written < n:
+		chrom1, pos1, chrom2, pos2, strand2 = junctions[rng.randrange(len(junctions))]
+		len1 = rng.randint(100, 500)
+		len2 = rng.randint(100, 500)
+		jitter = rng.randint(-5, 5)
+		readlen = len1 + len2 + rng.randint(0, 50)
+		# (ref chrom, ref start, query start on the read, length, read strand)
+		alignments = [(chrom1, pos1 - len1 + jitter, 0, len1, "+"), (chrom2, pos2 + jitter, readlen - len2, len2, strand2)]
+		if rng.random() < 0.3:
+			# lower scoring repeat copy of the first part of the read
+			alignments.append((rng.choice(CHROMS), rng.randint(10000, CHROM_LENGTH - 10000), 0, len1, "+"))
+
+		name = "read%08i" %(read)
+		for r, (chrom, start, qstart, length, strand) in enumerate(alignments):
+			if strand == "-":
+				qstart = readlen - qstart - length
+			offset = rng.randint(0, len(pool) - length)
+			seq = pool[offset:offset+length]
+			score = int(length * (rng.uniform(0.5, 1.0) if r == 2 else rng.uniform(1.5, 2.5)))
+			outfile.write("a score=%i EG2=%.2g E=%.2g\ns %s %i %i + %i %s\ns %s %i %i %s %i %s\n\n" %(score, rng.uniform(1e-30, 1e-10), rng.uniform(1e-40, 1e-20), chrom, start, length, CHROM_LENGTH, seq, name, qstart, length, strand, readlen, seq))
+		written += len(alignments)
+		read += 1
+	outfile.close()
+	return written
+
+# ---------------------------------------------------------
+# Small coordinate sorted BAM files with telomeric reads
+
+READ_LENGTH = 100
+NR_BAM_FILES = 2
+
+def write_bams(bamdir, n, rng):
+	# n reads divided over the BAM files, 2% contain a telomeric repeat. Needs pysam in this interpreter
+	import pysam
+	header = {"HD":{"VN":"1.0", "SO":"coordinate"}, "SQ":[{"SN":chrom, "LN":CHROM_LENGTH} for chrom in CHROMS]}
+	qualities = array.array('B', [30] * READ_LENGTH)
+	for f in range(NR_BAM_FILES):
+		bam_file = os.path.join(bamdir, "S%i_dedup.bam" %(f+1))
+		outfile = pysam.AlignmentFile(bam_file, "wb", header=header)
+		for i, (chrom, k) in enumerate(spread(n * (f + 1) // NR_BAM_FILES - n * f // NR_BAM_FILES)):
+			if rng.random() < 0.02:
+				repeat = rng.choice(["TTAGGG", "CCCTAA"]) * rng.randint(10, 16)
+				seq = (repeat + "".join(rng.choice(BASES) for j in range(READ_LENGTH)))[:READ_LENGTH]
+			else:
+				seq = "".join(rng.choice(BASES) for j in range(READ_LENGTH))
+			segment = pysam.AlignedSegment()
+			segment.query_name = "read%08i" %(i)
+			segment.query_sequence = seq
+			segment.flag = 0
+			segment.reference_id = CHROMS.index(chrom)
+			segment.reference_start = 10000 + k * 150
+			segment.mapping_quality = 60
+			segment.cigartuples = [(0, READ_LENGTH)]
+			segment.query_qualities = qualities
+			outfile.write(segment)
+		outfile.close()
+		pysam.index(bam_file)
+	return n
+
+# ---------------------------------------------------------
+# Benchmarks, setup(rundir, n, rng, options) writes the inputs and returns the script arguments and the number of input records
+
+def setup_merge_manta_delly(rundir, n, rng, options):
+	nr_delly, nr_manta = write_sv_vcfs(os.path.join(rundir, "delly.vcf"), os.path.join(rundir, "manta.vcf"), n, rng)
+	return ["-d", "delly.vcf", "-m", "manta.vcf", "-o", "merged.vcf"], nr_delly + nr_manta
+
+def setup_merge_manta_delly_overlap(rundir, n, rng, options):
+	arguments, records = setup_merge_manta_delly(rundir, n, rng, options)
+	return ["--filterOverlap"] + arguments, records
+
+def setup_categorize_sv(rundir, n, rng, options):
+	nr_delly, nr_manta = write_sv_vcfs(os.path.join(rundir, "delly.vcf"), os.path.join(rundir, "manta.vcf"), n, rng)
+	return ["-p", os.path.join(rundir, "*.vcf"), "-t", str(options.threads), "-o", "categories.txt"], nr_delly + nr_manta
+
+def setup_add_metadata(rundir, n, rng, options):
+	nr_delly, nr_manta = write_sv_vcfs(os.path.join(rundir, "delly.vcf"), os.path.join(rundir, "manta.vcf"), n, rng)
+	return ["-v", "manta.vcf", "-o", "manta_metadata.vcf"], nr_manta
+
+def setup_parse_delly_calls(rundir, n, rng, options):
+	records = write_delly_calls(os.path.join(rundir, "calls.txt"), os.path.join(rundir, "samples.txt"), n, rng)
+	return ["-i", "calls.txt", "-s", "samples.txt", "-o", "calls.parsed.txt", "-t", str(options.threads)], records
+
+def setup_annotate_cadd(rundir, n, rng, options):
+	variants = write_snv_vcf(os.path.join(rundir, "variants.vcf"), snv_genes(n), n, rng)
+	write_cadd_files(os.path.join(rundir, "cadd_snvs.tsv"), os.path.join(rundir, "cadd_indels.tsv"), variants, rng)
+	for filename in ["cadd_snvs.tsv", "cadd_indels.tsv"]:
+		bgzip_and_index(os.path.join(rundir, filename), options, columns=(1, 2, 2))
+	# the result listener runs in the pool, so it needs at least two processes
+	return ["--vcf", "variants.vcf", "--snv", "cadd_snvs.tsv.gz", "--indel", "cadd_indels.tsv.gz", "--t", str(max(2, options.threads)), "--out", "annotated.vcf"], len(variants)
+
+def setup_somatic_overview(rundir, n, rng, options):
+	vcfdir = os.path.join(rundir, "vcfs")
+	os.makedirs(vcfdir)
+	genes = snv_genes(n)
+	variants = write_snv_vcf(os.path.join(vcfdir, "cohort.vcf"), genes, n, rng)
+	with open(os.path.join(rundir, "genes.bed"), 'w') as outfile:
+		for gene in genes:
+			outfile.write("%s\t%i\t%i\t%s\n" %(gene["Chr"], gene["Start"], gene["Stop"], gene["SYMBOL"]))
+	# the cached Ensembl lookups, so the run does not depend on the REST API
+	with open(os.path.join(rundir, "genes.bed.pkl"), 'wb') as outfile:
+		pickle.dump(genes, outfile)
+	return ["--vcfdir", vcfdir, "--genelist", "genes.bed", "--outdir", "overview", "--t", str(options.threads), "--bgzip", options.bgzip, "--tabix", options.tabix], len(variants)
+
+def setup_fix_freebayes_header(rundir, n, rng, options):
+	vcfdir = os.path.join(rundir, "vcfs")
+	os.makedirs(vcfdir)
+	records = write_freebayes_vcfs(vcfdir, n, rng)
+	return ["--vcfdir", vcfdir, "--outdir", "fixed", "--t", str(options.threads)], records
+
+def setup_freec(rundir, n, rng, options):
+	sample_sheet, panel, records = write_freec_files(rundir, n, rng)
+	return ["--sample_sheet", sample_sheet, "--panel", panel, "--track", "track", "--outdir", "results", "--ratios_out", "ratios.txt", "--threads", str(options.threads)], records
+
+def setup_filter_maf(rundir, n, rng, options):
+	records = write_maf(os.path.join(rundir, "alignments.maf"), n, rng)
+	return ["--maf", "alignments.maf", "--out", "filtered.maf", "--threads", str(options.threads)], records
+
+def setup_chain_maf(rundir, n, rng, options):
+	records = write_maf(os.path.join(rundir, "alignments.maf"), n, rng)
+	return ["--maf", "alignments.maf", "--out", "chained.maf", "--chain", "--bed", "chained.bed", "--grouped", "--threads", str(options.threads)], records
+
+def setup_complex_sv_vcf(rundir, n, rng, options):
+	records = write_maf(os.path.join(rundir, "alignments.maf"), n, rng)
+	return ["--last", "alignments.maf", "--vcf", "breakpoints.vcf", "--threads", str(options.threads)], records
+
+def setup_count_telomeric(rundir, n, rng, options):
+	bamdir = os.path.join(rundir, "bams")
+	os.makedirs(bamdir)
+	os.makedirs(os.path.join(rundir, "telomeres"))
+	records = write_bams(bamdir, n, rng)
+	return ["--bamdir", bamdir, "--outdir", os.path.join(rundir, "telomeres"), "--s", str(NR_BAM_FILES), "--t", str(options.threads), "--sambamba", options.sambamba], records
+
+# name, script, python modules, executable options, setup
+BENCHMARKS = [
+	("merge_manta_delly",	"mergeMantaDelly.py",			["vcf"],					[],			setup_merge_manta_delly),
+	("merge_overlap_filter","mergeMantaDelly.py",			["vcf"],					[],			setup_merge_manta_delly_overlap),
+	("categorize_sv",	"categorizeSV.py",			["vcf", "numpy", "pandas"],			[],			setup_categorize_sv),
+	("add_metadata",	"add_metadata_to_delly_manta_vcf.py",	[],						[],			setup_add_metadata),
+	("parse_delly_calls",	"Parse_Delly_Calls.py",			["numpy"],					[],			setup_parse_delly_calls),
+	("annotate_cadd",	"Annotate_CADD_Scores_In_VCF.py",	["vcf", "tabix"],				["bgzip", "tabix"],	setup_annotate_cadd),
+	("somatic_overview",	"Make_Somatic_Mutation_Overview.py",	["vcf", "pysam", "numpy", "requests"],		["bgzip", "tabix"],	setup_somatic_overview),
+	("fix_freebayes_header","FixFreebayesHeader.py",		[],						[],			setup_fix_freebayes_header),
+	("freec_filter",	"FilterAndPlot_FREECcalls.py",		["numpy"],					[],			setup_freec),
+	("filter_maf",		"NanoPore/Filter_MAF_file.py",		["numpy"],					[],			setup_filter_maf),
+	("chain_maf",		"NanoPore/Filter_MAF_file.py",		["numpy"],					[],			setup_chain_maf),
+	("complex_sv_vcf",	"NanoPore/ComplexSVanalysis.py",	["numpy", "pysam", "pybedtools", "matplotlib"],	[],			setup_complex_sv_vcf),
+	("count_telomeric",	"Count_Telomeric_Sequence_Reads.py",	["pysam"],					["sambamba"],		setup_count_telomeric),
+]
+
+# ---------------------------------------------------------
+
+_modules = {}
+
+def has_module(python, module):
+	# checked in the interpreter that runs the scripts, which need not be this one
+	if module not in _modules:
+		with open(os.devnull, 'w') as devnull:
+			_modules[module] = subprocess.call([python, "-c", "import "+module], stdout=devnull, stderr=devnull) == 0
+	return _modules[module]
+
+def missing_requirement(modules, executables, options):
+	for module in modules:
+		if not has_module(options.python, module):
+			return "python module %s not available" %(module)
+	for executable in executables:
+		if not find_executable(getattr(options, executable)):
+			return "executable %s not found" %(getattr(options, executable))
+	return None
+
+def run_script(command, rundir, timeout):
+	# returns wall time, resource usage of the script and its waited for children, exit status and whether it timed out.
+	# The script runs in its own process group so worker processes are killed with it on a timeout
+	log = open(os.path.join(rundir, "run.log"), 'w')
+	start = time.time()
+	process = subprocess.Popen(command, cwd=rundir, stdout=log, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+	timed_out = False
+	while True:
+		pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+		if pid != 0:
+			break
+		if timeout and time.time() - start > timeout and not timed_out:
+			timed_out = True
+			os.killpg(process.pid, signal.SIGKILL)
+		time.sleep(0.01)
+	wall = time.time() - start
+	log.close()
+	process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+	return wall, usage, process.returncode, timed_out
+
+def log_tail(rundir, lines=5):
+	with open(os.path.join(rundir, "run.log"), 'r') as infile:
+		return "".join(infile.readlines()[-lines:]).strip()
+
+def run_benchmark(benchmark, scale, repeat, options):
+	name, script, modules, executables, setup = benchmark
+	result = {"benchmark":name, "script":script, "scale":scale, "repeat":repeat}
+	rundir = os.path.join(options.workdir, "%s_%i_%i" %(name, scale, repeat))
+	if os.path.exists(rundir):
+		shutil.rmtree(rundir)
+	os.makedirs(rundir)
+
+	# the inputs only depend on the seed and the scale, so versions and repeats see identical data
+	rng = random.Random(options.seed * 1000003 + scale)
+	try:
+		arguments, records = setup(rundir, scale, rng, options)
+	except ImportError as e:
+		result.update({"status":"skipped", "reason":"generator needs a python module: %s" %(e)})
+		shutil.rmtree(rundir)
+		return result
+	result["records"] = records
+	result["input_bytes"] = sum(os.path.getsize(os.path.join(path, filename)) for path, dirs, filenames in os.walk(rundir) for filename in filenames)
+
+	command = [options.python, os.path.join(REPO_DIR, script)] + arguments
+	wall, usage, returncode, timed_out = run_script(command, rundir, options.timeout)
+	result.update({
+		"command":" ".join(command[1:]),
+		"wall_time":round(wall, 4),
+		"user_time":round(usage.ru_utime, 4),
+		"system_time":round(usage.ru_stime, 4),
+		# ru_maxrss is in kB on Linux, of the largest of the script and its waited for worker processes
+		"max_rss_kb":usage.ru_maxrss,
+		"records_per_sec":round(records / wall, 2) if wall > 0 else None,
+		"returncode":returncode})
+	if timed_out:
+		result.update({"status":"timeout", "reason":"killed after %i seconds" %(options.timeout), "records_per_sec":None})
+	elif returncode != 0:
+		result.update({"status":"failed", "reason":log_tail(rundir), "records_per_sec":None})
+	else:
+		result["status"] = "ok"
+
+	if not options.keep:
+		shutil.rmtree(rundir)
+	return result
+
+# ---------------------------------------------------------
+
+def best_rates(results):
+	# highest records/sec per (benchmark, scale) over the repeats
+	rates = {}
+	for result in results:
+		if result["status"] == "ok":
+			key = (result["benchmark"], result["scale"])
+			rates[key] = max(rates.get(key, 0), result["records_per_sec"])
+	return rates
+
+def print_result(result):
+	if result["status"] in ["ok", "failed", "timeout"]:
+		print("%-22s %9i %3i %-8s %10.3f %10.1f %12.1f" %(result["benchmark"], result["scale"], result["repeat"], result["status"], result["wall_time"], result["max_rss_kb"] / 1024.0, result["records_per_sec"] or 0))
+	else:
+		print("%-22s %9i %3i %-8s %s" %(result["benchmark"], result["scale"], result["repeat"], result["status"], result["reason"]))
+	sys.stdout.flush()
+
+def print_comparison(results, compare_file):
+	with open(compare_file, 'r') as infile:
+		previous = json.load(infile)
+	old = best_rates(previous["results"])
+	new = best_rates(results)
+	print("")
+	print("Compared to %s (%s)" %(compare_file, previous.get("git_commit") or "unknown commit"))
+	print("%-22s %9s %12s %12s %8s" %("benchmark", "scale", "old rec/s", "new rec/s", "change"))
+	for key in sorted(set(old) & set(new)):
+		print("%-22s %9i %12.1f %12.1f %+7.1f%%" %(key[0], key[1], old[key], new[key], (new[key] / old[key] - 1) * 100.0))
+
+def git_commit():
+	try:
+		with open(os.devnull, 'w') as devnull:
+			return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=devnull).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def main(options):
+	selected = BENCHMARKS
+	if options.benchmarks:
+		names = options.benchmarks.split(",")
+		unknown = [name for name in names if name not in [benchmark[0] for benchmark in BENCHMARKS]]
+		if unknown:
+			print("Unknown benchmark(s) %s, use --list to see the available benchmarks" %(", ".join(unknown)))
+			return 1
+		selected = [benchmark for benchmark in BENCHMARKS if benchmark[0] in names]
+	scales = [int(scale) for scale in options.scales.split(",")]
+
+	cleanup = False
+	if not options.workdir:
+		options.workdir = tempfile.mkdtemp(prefix="benchmarks_")
+		cleanup = not options.keep
+	elif not os.path.exists(options.workdir):
+		os.makedirs(options.workdir)
+	options.workdir = os.path.abspath(options.workdir)
+
+	print("%-22s %9s %3s %-8s %10s %10s %12s" %("benchmark", "scale", "rep", "status", "wall (s)", "RSS (MB)", "records/s"))
+	results = []
+	for benchmark in selected:
+		reason = missing_requirement(benchmark[2], benchmark[3], options)
+		for scale in scales:
+			if reason:
+				# one entry per scale, so result files of different hosts line up
+				result = {"benchmark":benchmark[0], "script":benchmark[1], "scale":scale, "repeat":0, "status":"skipped", "reason":reason}
+				results.append(result)
+				print_result(result)
+				continue
+			for repeat in range(options.repeat):
+				result = run_benchmark(benchmark, scale, repeat, options)
+				results.append(result)
+				print_result(result)
+
+	if cleanup:
+		shutil.rmtree(options.workdir)
+
+	python_version = subprocess.check_output([options.python, "-c", "import sys; print(sys.version.split()[0])"]).strip()
+	report = {
+		"created":time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"git_commit":git_commit(),
+		"host":platform.node(),
+		"platform":platform.platform(),
+		"python":options.python,
+		"python_version":python_version,
+		"seed":options.seed,
+		"threads":options.threads,
+		"results":results}
+	with open(options.out, 'w') as outfile:
+		json.dump(report, outfile, indent=1, sort_keys=True)
+	print("")
+	print("Results written to %s" %(options.out))
+
+	if options.compare:
+		print_comparison(results, options.compare)
+	return 0
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = 'Benchmark the scripts in this repository on deterministic synthetic data', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+	parser.add_argument('--scales', help = "comma separated numbers of input records to run every benchmark with", default = "1000,10000,100000")
+	parser.add_argument('--benchmarks', help = "comma separated benchmarks to run instead of all, see --list")
+	parser.add_argument('--list', help = "list the benchmarks and exit", action = "store_true")
+	parser.add_argument('--repeat', help = "number of runs per benchmark and scale", type = int, default = 1)
+	parser.add_argument('--threads', help = "number of processes passed to scripts that support it", type = int, default = 2)
+	parser.add_argument('--seed', help = "seed of the synthetic data generators", type = int, default = 1)
+	parser.add_argument('--timeout', help = "seconds before a run is killed, 0 for no limit", type = int, default = 3600)
+	parser.add_argument('--out', help = "JSON file to write the results to", default = "benchmark_results.json")
+	parser.add_argument('--compare', help = "JSON results file of an earlier run to compare records/sec with")
+	parser.add_argument('--workdir', help = "directory for the generated inputs and outputs, a temporary directory by default")
+	parser.add_argument('--keep', help = "keep the generated inputs and outputs of every run", action = "store_true")
+	parser.add_argument('--python', help = "python interpreter to run the scripts with", default = sys.executable)
+	parser.add_argument('--bgzip', help = "path to bgzip binary", default = "bgzip")
+	parser.add_argument('--tabix', help = "path to tabix binary", default = "tabix")
+	parser.add_argument('--sambamba', help = "path to sambamba binary", default = "sambamba")
+	options = parser.parse_args()
+
+	if options.list:
+		for name, script, modules, executables, setup in BENCHMARKS:
+			print("%-22s %s" %(name, script))
+		sys.exit(0)
+
+	sys.exit(main(options))
@@ -0,0 +1,156 @@
+#!/usr/bin/python2.7
+
+# GENERAL
+import os
+import sys
+import json
+import time
+import platform
+import resource
+
+# -------------------------------------------------
+
+# The clock is only read once per this many records
+CHECK_EVERY = 256
+
+def format_duration(seconds):
+	seconds = int(seconds)
+	return "%i:%02i:%02i" %(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+# -------------------------------------------------
+
+class Stage(object):
+	"""Context manager that adds its wall time to a stage timer of a RunMonitor"""
+	__slots__ = ("monitor", "name", "start")
+
+	def __init__(self, monitor, name):
+		self.monitor = monitor
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, *exc):
+		self.monitor.add_time(self.name, time.time() - self.start)
+		return False
+
+class RunMonitor(object):
+	"""Counters and timers per stage of a script run, progress with records/sec and ETA on stderr,
+	an optional profile of the main process and a JSON run report.
+	Counters and timers of worker processes are added with merge(), timers are then summed over the workers."""
+
+	def __init__(self, name, total=None, interval=30.0, report_file=None, profile_file=None, stream=sys.stderr):
+		self.name = name
+		self.total = total
+		self.interval = interval
+		self.report_file = report_file
+		self.stream = stream
+		self.counters = {}
+		self.timers = {}
+		self.records = 0
+		self.next_check = CHECK_EVERY
+		self.start = time.time()
+		self.next_progress = self.start + interval
+		self.profiler = start_profiler(profile_file) if profile_file else None
+
+	def count(self, counter, n=1):
+		self.counters[counter] = self.counters.get(counter, 0) + n
+
+	def add_time(self, stage, seconds):
+		self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+
+	def stage(self, name):
+		return Stage(self, name)
+
+	def merge(self, counters=None, timers=None):
+		for counter, n in (counters or {}).items():
+			self.count(counter, n)
+		for stage, seconds in (timers or {}).items():
+			self.add_time(stage, seconds)
+
+	def record(self, n=1):
+		# called per finished record, progress is written at most once per interval
+		self.records += n
+		if self.records < self.next_check and self.records != self.total:
+			return
+		self.next_check = self.records + CHECK_EVERY
+		now = time.time()
+		if self.interval > 0 and now >= self.next_progress:
+			self.progress(now)
+			self.next_progress = now + self.interval
+
+	def rate(self, now=None):
+		elapsed = (now or time.time()) - self.start
+		return self.records / elapsed if elapsed > 0 else 0.0
+
+	def progress(self, now=None):
+		now = now or time.time()
+		rate = self.rate(now)
+		message = "[%s] %s %i" %(self.name, format_duration(now - self.start), self.records)
+		if self.total:
+			message += "/%i (%.1f%%)" %(self.total, 100.0 * self.records / self.total)
+		message += " records, %.1f records/sec" %(rate)
+		if self.total and rate > 0:
+			message += ", ETA %s" %(format_duration(max(0, self.total - self.records) / rate))
+		self.stream.write(message+"\n")
+		self.stream.flush()
+
+	def finish(self, **extra):
+		# stops the profiler, writes the run report if requested and returns it, extra items are added to the report
+		if self.profiler:
+			stop_profiler(*self.profiler)
+			self.profiler = None
+		now = time.time()
+		own = resource.getrusage(resource.RUSAGE_SELF)
+		children = resource.getrusage(resource.RUSAGE_CHILDREN)
+		report = {
+			"script":self.name,
+			"command":sys.argv,
+			"host":platform.node(),
+			"pid":os.getpid(),
+			"started":time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.start)),
+			"wall_time":round(now - self.start, 4),
+			"user_time":round(own.ru_utime + children.ru_utime, 4),
+			"system_time":round(own.ru_stime + children.ru_stime, 4),
+			# kB on Linux, of the largest of this process and its finished children
+			"max_rss_kb":max(own.ru_maxrss, children.ru_maxrss),
+			"records":self.records,
+			"records_per_sec":round(self.rate(now), 2),
+			"counters":self.counters,
+			"timers":dict((stage, round(seconds, 4)) for stage, seconds in self.timers.items())}
+		report.update(extra)
+
+		self.stream.write("[%s] %i records in %.2f seconds, %.1f records/sec\n" %(self.name, self.records, report["wall_time"], report["records_per_sec"]))
+		if self.report_file:
+			with open(self.report_file, 'w') as outfile:
+				json.dump(report, outfile, indent=1, sort_keys=True, default=str)
+		return report
+
+# -------------------------------------------------
+
+def start_profiler(profile_file):
+	# pyinstrument for .html and .txt files when it is installed, cProfile statistics (for pstats/snakeviz) otherwise
+	if profile_file.endswith(".html") or profile_file.endswith(".txt"):
+		try:
+			from pyinstrument import Profiler
+			profiler = Profiler()
+			profiler.start()
+			return ("pyinstrument", profiler, profile_file)
+		except ImportError:
+			profile_file += ".prof"
+			sys.stderr.write("WARNING:\tpyinstrument is not installed, writing cProfile statistics to %s\n" %(profile_file))
+
+	import cProfile
+	profiler = cProfile.Profile()
+	profiler.enable()
+	return ("cprofile", profiler, profile_file)
+
+def stop_profiler(kind, profiler, profile_file):
+	if kind == "pyinstrument":
+		profiler.stop()
+		with open(profile_file, 'w') as outfile:
+			outfile.write(profiler.output_html() if profile_file.endswith(".html") else profiler.output_text())
+	else:
+		profiler.disable()
+		profiler.dump_stats(profile_file)
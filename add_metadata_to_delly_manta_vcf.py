@@ -5,59 +5,124 @@ add_metadata_to_delly_manta_vcf.py
 
 ##INFO=<ID=SOMATIC  is automatically added after i) the delly somatic filtering step ii) manta somatic calling
 
+The VCF is streamed: only the header (and the first variant for Delly) is read to find the caller and version.
+
 """
 
+import os
 import sys
 import argparse
+import gzip
 import re
-import vcf
+import subprocess
 
-def add_meta2vcf(vcf_file):
+def open_vcf(vcf_file):
 	try:
-		f = open(vcf_file, 'r')
+		if vcf_file.endswith(".gz"):
+			return gzip.open(vcf_file, 'rb')
+		return open(vcf_file, 'r')
 	except IOError:
 		sys.exit("Error: Can't open vcf file: {0}".format(vcf_file))
-	else:
-		with f:
-			vcf_header = []
-			vcf_chrom = []
-			vcf_variants = []
-			countline = 0
-			version = ""
+
+def read_header(f):
+	##Reads the meta-information lines and the #CHROM line, the caller version is taken from the manta cmdline##
+	vcf_header = []
+	version = ""
+	for line in f:
+		line = line.strip('\n')
+		vcf_header.append(line)
+		if line.startswith('##cmdline'):
+			find_manta = re.findall('(manta_\w+\.\w+\.\w+)', line)
+			if find_manta:
+				version = find_manta[0]
+		elif line.startswith("#CHROM"):
+			break
+	return vcf_header, version
+
+def add_meta2vcf(vcf_file, out_file=None, bgzip="bgzip", tabix="tabix"):
+	f = open_vcf(vcf_file)
+	with f:
+		vcf_header, version = read_header(f)
+
+		## Delly does not write its version in the header, it is taken from the first variant##
+		first_variant = next(f, "")
+		if not version and first_variant:
+			find_delly = re.findall('(EMBL.DELLYv\w+\.\w+.\w+)', first_variant.split('\t')[7])
+			if find_delly:
+				version = find_delly[0]
+		## without a version the variants are written unchanged##
+		svmethod = ";SVMETHOD={0}".format(version) if version else ""
+
+		bgzip_process = None
+		if not out_file:
+			out = sys.stdout
+		elif out_file.endswith(".gz"):
+			out_handle = open(out_file, 'wb')
+			bgzip_process = subprocess.Popen([bgzip, "-c"], stdin=subprocess.PIPE, stdout=out_handle)
+			out = bgzip_process.stdin
+		else:
+			out = open(out_file, 'w', 1<<20)
+
+		try:
+			## print header lines and Add meta-information lines with caller info to vcf
+			out.write("\n".join(vcf_header[:-1])+"\n")
+			out.write("##INFO=<ID=caller={0}\n".format(version))
+			out.write(vcf_header[-1]+"\n")
+
+			## variants are streamed, only Manta variants get the SVMETHOD tag
+			for line in ([first_variant] if first_variant else []):
+				out.write(add_svmethod(line, svmethod))
 			for line in f:
-				countline = countline + 1
-				line = line.strip('\n')
-				if line.startswith('##'):
-					##Print original vcf meta-information lines##
-					vcf_header.append(line)
-					if line.startswith('##cmdline'):
-						find_manta = re.findall('(manta_\w+\.\w+\.\w+)', line)
-						version = find_manta[0]
-					## print header lines and Add meta-information lines with melter info to vcf
-				elif line.startswith("#CHROM"):
-					vcf_chrom.append(line)
-					countline = 0
-				else:
-					variant = line.split('\t')
-					if countline == 1:
-						find_delly = re.findall('(EMBL.DELLYv\w+\.\w+.\w+)', variant[7])
-						if not version:
-							version = find_delly[0]
-					if not "DELLY" in variant[7]:
-						variant[7] = variant[7]+";SVMETHOD={0}".format(find_manta[0])
-					vcf_variants.append("\t".join(variant))
-					
-					
-			print "\n".join(vcf_header)
-			print "##INFO=<ID=caller={0}".format(version)
-			print "\n".join(vcf_chrom)
-			print "\n".join(vcf_variants)
+				out.write(add_svmethod(line, svmethod))
+		except:
+			## no partial bgzipped output is left behind
+			if bgzip_process:
+				if bgzip_process.poll() is None:
+					bgzip_process.kill()
+					bgzip_process.wait()
+				out_handle.close()
+				remove_output(out_file)
+			raise
+
+		if bgzip_process:
+			try:
+				out.close()
+			except IOError:
+				## bgzip stopped reading, its exit status is checked below
+				pass
+			compressed = bgzip_process.wait() == 0
+			out_handle.close()
+			if not compressed:
+				remove_output(out_file)
+				sys.exit("Error: bgzip could not compress {0}".format(out_file))
+			if subprocess.call([tabix, "-f", "-p", "vcf", out_file]) != 0:
+				remove_output(out_file)
+				sys.exit("Error: tabix could not index {0}".format(out_file))
+		elif out_file:
+			out.close()
+
+def remove_output(out_file):
+	for filename in [out_file, out_file+".tbi"]:
+		if os.path.exists(filename):
+			os.remove(filename)
+
+def add_svmethod(line, svmethod):
+	if not svmethod:
+		return line
+	variant = line.rstrip('\n').split('\t', 8)
+	## Delly variants carry their own SVMETHOD in the INFO field##
+	if "DELLY" in variant[7]:
+		return line
+	variant[7] = variant[7]+svmethod
+	return "\t".join(variant)+"\n"
 
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description = 'add metadata to a SV VCF file')
 	required_named = parser.add_argument_group('required named arguments')
-	required_named.add_argument('-v', '--vcf_file', help='path/to/file.vcf', required=True)
+	required_named.add_argument('-v', '--vcf_file', help='path/to/file.vcf, may be bgzipped', required=True)
+	parser.add_argument('-o', '--out_file', help='path/to/output.vcf instead of stdout, .gz gives bgzipped and tabix indexed output')
+	parser.add_argument('--bgzip', help='path to bgzip binary', default='bgzip')
+	parser.add_argument('--tabix', help='path to tabix binary', default='tabix')
 	args = parser.parse_args()
-	add_meta2vcf(args.vcf_file)
-
+	add_meta2vcf(args.vcf_file, args.out_file, args.bgzip, args.tabix)
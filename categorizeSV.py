@@ -4,6 +4,9 @@
 # A table will be made that contains all SVs from each VCF-file, with the SVs sorted on type and length.
 # Each vcf file is put in a different column of the table.
 # In the command line a path should be provided of the vcf files to be processed. 
+# The files can be processed in parallel (--threads), and the table can be written to a tab separated or parquet file (--output).
+# Optionally a length sketch per SV type and caller is stored for each file (--sketch_dir). Sketches of many files can be merged
+# later and queried for other length bins or quantiles without reading the vcf files again (--merge_sketches).
 #
 # Author: Floor Dussel
 ##################################################################
@@ -15,191 +18,338 @@ import pandas as pd
 import glob
 import vcf
 import argparse
+import collections
+import json
+import multiprocessing as mp
 
-def categorize(path):
-	list_vcf_names = []
-	df_all = pd.DataFrame()
-
-	def extractInfoINVDELTRADUP (record):
-		chrom = record.CHROM
-		pos = record.POS
-		end = record.INFO["END"]
-		length_calc = end - pos
-		length_abs = abs(length_calc)
-		length = length_abs + 1
-		output = [chrom, pos, end, length]
-		return output;
-
-	def extractInfoINS (record):
-		chrom = record.CHROM
-		pos = record.POS
-		end = record.INFO["END"]
-		length = 0
+DEFAULT_SV_TYPES = ["DEL", "INS", "INV", "DUP"] #SV types that are counted per length bin
+TRA_BND_TYPES = ["TRA", "BND"] #SV types that are counted together, without length bins
+
+#upper edges of the length bins, a bin contains the SVs with edges[i-1] < length <= edges[i], the last bin is open ended
+DEFAULT_EDGES = [1000, 10000, 100000, 1000000, 10000000]
+DEFAULT_BIN_NAMES = ["1_10kb", "10_100kb", "100kb_1mb", "1mb_10mb", ">10mb"]
+TRA_BND_NAME = "tra/bnd "
+
+KNOWN_CALLERS = ["MANTA", "DELLY", "LUMPY", "GRIDSS"]
+SKETCH_BUCKETS_PER_DECADE = 20 #gives a relative error of at most ~6% on the lengths in a sketch, and bucket bounds at 10**(i/20) so 1kb, 10kb, ... are exact bin edges
+
+def formatLength(length):
+	for unit, size in (("mb", 1000000), ("kb", 1000)):
+		if length >= size and length % size == 0:
+			return "{0}{1}".format(length / size, unit)
+	return "{0}bp".format(length)
+
+def binNames(edges):
+	if list(edges) == DEFAULT_EDGES:
+		return DEFAULT_BIN_NAMES
+	names = ["{0}_{1}".format(formatLength(lower), formatLength(upper)) for lower, upper in zip(edges[:-1], edges[1:])]
+	names.append(">" + formatLength(edges[-1]))
+	return names
+
+def logEdges(minimum, maximum, per_decade=1):
+	#log-scale edges from minimum up to and including maximum, e.g. logEdges(1000, 10000000) gives DEFAULT_EDGES
+	nr_edges = int(round(np.log10(float(maximum) / minimum) * per_decade)) + 1
+	return [int(round(edge)) for edge in np.logspace(np.log10(minimum), np.log10(maximum), nr_edges)]
+
+def rowNames(edges, svtypes):
+	names = []
+	for svtype in svtypes:
+		names.extend(["{0}_{1}".format(svtype.lower(), bin_name) for bin_name in binNames(edges)])
+	names.append(TRA_BND_NAME)
+	return names
+
+def svCodes(svtypes):
+	#SV types that are counted per length bin get codes 0..n-1, TRA and BND share code n
+	codes = dict((svtype, code) for code, svtype in enumerate(svtypes))
+	codes.update(dict((svtype, len(svtypes)) for svtype in TRA_BND_TYPES))
+	return codes
+
+def callerSV(record):
+	#SVMETHOD is set by add_metadata_to_delly_manta_vcf.py and Delly, the IDs contain the caller after mergeMantaDelly.py or for Manta
+	if "SVMETHOD" in record.INFO:
+		method = str(record.INFO["SVMETHOD"]).upper()
+	else:
+		method = str(record.ID).upper()
+	for caller in KNOWN_CALLERS:
+		if caller in method:
+			return caller
+	return "unknown"
+
+class LengthSketch:
+	"""Mergeable histogram of SV lengths per caller and SV type, with log-scale buckets.
+	Bucket b contains the lengths 10**((b-1)/k) < length <= 10**(b/k), with the upper bound inclusive like the length bins of countSVs"""
+
+	def __init__(self, buckets_per_decade=SKETCH_BUCKETS_PER_DECADE):
+		self.buckets_per_decade = buckets_per_decade
+		self.counts = {} #(caller, svtype) -> {bucket: count}, bucket -1 contains the SVs with length 0
+
+	def bucketOf(self, lengths):
+		lengths = np.asarray(lengths, dtype=np.float64)
+		buckets = np.full(len(lengths), -1, dtype=np.int64)
+		nonzero = lengths >= 1
+		buckets[nonzero] = np.ceil(np.log10(lengths[nonzero]) * self.buckets_per_decade).astype(np.int64)
+		return buckets
+
+	def bucketLength(self, bucket):
+		#geometric middle of the bucket
+		if bucket < 0:
+			return 0.0
+		return 10 ** ((bucket - 0.5) / self.buckets_per_decade)
+
+	def addLengths(self, caller, svtype, lengths):
+		if len(lengths) == 0:
+			return
+		buckets = self.bucketOf(lengths)
+		sketch = self.counts.setdefault((caller, svtype), {})
+		unique, counts = np.unique(buckets, return_counts=True)
+		for bucket, count in zip(unique, counts):
+			sketch[int(bucket)] = sketch.get(int(bucket), 0) + int(count)
+
+	def merge(self, other):
+		if other.buckets_per_decade != self.buckets_per_decade:
+			raise ValueError("Cannot merge sketches with {0} and {1} buckets per decade".format(self.buckets_per_decade, other.buckets_per_decade))
+		for key, other_sketch in other.counts.items():
+			sketch = self.counts.setdefault(key, {})
+			for bucket, count in other_sketch.items():
+				sketch[bucket] = sketch.get(bucket, 0) + count
+
+	def keys(self):
+		return sorted(self.counts)
+
+	def selectBuckets(self, caller=None, svtype=None):
+		selected = collections.defaultdict(int)
+		for (sketch_caller, sketch_svtype), sketch in self.counts.items():
+			if caller is not None and sketch_caller != caller:
+				continue
+			if svtype is not None and sketch_svtype != svtype:
+				continue
+			for bucket, count in sketch.items():
+				selected[bucket] += count
+		buckets = np.array(sorted(selected), dtype=np.int64)
+		return buckets, np.array([selected[bucket] for bucket in buckets], dtype=np.int64)
+
+	def total(self, caller=None, svtype=None):
+		buckets, counts = self.selectBuckets(caller, svtype)
+		return int(counts.sum())
+
+	def quantile(self, q, caller=None, svtype=None):
+		buckets, counts = self.selectBuckets(caller, svtype)
+		if len(counts) == 0:
+			return float("nan")
+		cumulative = np.cumsum(counts)
+		index = int(np.searchsorted(cumulative, q * cumulative[-1], side='left'))
+		return self.bucketLength(buckets[min(index, len(buckets) - 1)])
+
+	def binCounts(self, edges, caller=None, svtype=None):
+		#counts per bin, using the same bins as countSVs: bin 0 contains the lengths <= edges[0]
+		#a bucket is counted in the bin of its upper bound, this is exact for edges that are bucket bounds (e.g. DEFAULT_EDGES)
+		#and otherwise the bucket that contains an edge is counted below it
+		buckets, counts = self.selectBuckets(caller, svtype)
+		bins = np.searchsorted(self.bucketOf(edges), buckets, side='left')
+		return np.bincount(bins, weights=counts, minlength=len(edges) + 1).astype(np.int64)
+
+	def write(self, filename):
+		sketches = [{"caller": caller, "svtype": svtype, "counts": dict((str(bucket), count) for bucket, count in sketch.items())} for (caller, svtype), sketch in sorted(self.counts.items())]
+		with open(filename, 'w') as outfile:
+			json.dump({"buckets_per_decade": self.buckets_per_decade, "sketches": sketches}, outfile)
+
+	@classmethod
+	def read(cls, filename):
+		with open(filename, 'r') as infile:
+			data = json.load(infile)
+		sketch = cls(data["buckets_per_decade"])
+		for entry in data["sketches"]:
+			sketch.counts[(entry["caller"], entry["svtype"])] = dict((int(bucket), count) for bucket, count in entry["counts"].items())
+		return sketch
+
+def lengthSV(record):
+	svtype = record.INFO["SVTYPE"]
+	if svtype == "INS":
 		if "INSLEN" in record.INFO:
-			length_get = record.INFO["INSLEN"]
-			length = abs(length_get)
-			#print 'INSLENGTH used as length of insertion'
+			return abs(record.INFO["INSLEN"])
 		elif "SVLEN" in record.INFO:
 			length = record.INFO["SVLEN"]
-			if length != int:
+			if type(length) != int:
 				length = length[0]
-			if length < 0:
-				length = length * -1
-			#print 'SVLEN used as length of insertion'
-		#else:
-			#print 'No insertion length found. Note: insertion is not taken into account in the table'
-
-		output = [chrom, pos, end, length]
-		return output;
-
-	#BNDs are said to have length = 0 and END is said to be the same as POS
-	def extractInfoBND (record):
-		chrom = record.CHROM
-		pos = record.POS
-		end = pos
-		length = 0
-		output = [chrom, pos, end, length]
-		return output;
-
-	def checkLengthSVs(record):
-		if record.INFO["SVTYPE"] == "DEL":
-			del_output = extractInfoINVDELTRADUP(record)
-			length = del_output[3]
-
-			if (length > 1000 and length < 10001): #1000-10001bp, so length of 1-10kb
-				del_outputlist10.append(del_output)
-			elif (length > 10000 and length <100001): #10-100kbp
-				del_outputlist100.append(del_output)
-			elif (length > 100000 and length <1000001): #100kb-1mbp
-				del_outputlist1000.append(del_output)
-			elif (length > 1000000 and length <10000001): #1mbp - 10 mbp
-				del_outputlist10000.append(del_output)
-			elif (length > 10000000): # >10Mb
-				del_outputlist100000.append(del_output)
-
-		if record.INFO["SVTYPE"] == "INS":
-			ins_output = extractInfoINS(record)
-			length = ins_output[3]
-
-			if (length > 1000 and length < 10001): #1000-10001bp, so length of 1-10kb
-				ins_outputlist10.append(ins_output)
-			elif (length > 10000 and length <100001): #10-100kbp
-				ins_outputlist100.append(ins_output)
-			elif (length > 100000 and length <1000001): #100kb-1mbp
-				ins_outputlist1000.append(ins_output)
-			elif (length > 1000000 and length <10000001): #1mbp - 10 mbp
-				ins_outputlist10000.append(ins_output)
-			elif (length > 10000000): # >10Mb
-				ins_outputlist100000.append(ins_output)
-
-		if record.INFO["SVTYPE"] == "INV":
-			inv_output = extractInfoINVDELTRADUP(record)
-			length = inv_output[3]
-			if (length > 1000 and length < 10001): #1000-10001bp, so length of 1-10kb
-				inv_outputlist10.append(inv_output)
-			elif (length > 10000 and length <100001): #10-100kbp
-				inv_outputlist100.append(inv_output)
-			elif (length > 100000 and length <1000001): #100kb-1mbp
-				inv_outputlist1000.append(inv_output)
-			elif (length > 1000000 and length <10000001): #1mbp - 10 mbp
-				inv_outputlist10000.append(inv_output)
-			elif (length > 10000000): # >10Mb
-				inv_outputlist100000.append(inv_output)
-
-		if  record.INFO["SVTYPE"] == "TRA":
-			tra_output = extractInfoINVDELTRADUP(record)
-			tra_bnd_outputlist.append(tra_output)
-
-		if record.INFO["SVTYPE"] == "DUP":
-			dup_output = extractInfoINVDELTRADUP(record)
-			length = dup_output[3]
-
-			if (length > 1000 and length < 10001): #1000-10001bp, so length of 1-10kb
-				dup_outputlist10.append(dup_output)
-			elif (length > 10000 and length <100001): #10-100kbp
-				dup_outputlist100.append(dup_output)
-			elif (length > 100000 and length <1000001): #100kb-1mbp
-				dup_outputlist1000.append(dup_output)
-			elif (length > 1000000 and length <10000001): #1mbp - 10 mbp
-				dup_outputlist10000.append(dup_output)
-			elif (length > 10000000): # >10Mb
-				dup_outputlist100000.append(dup_output)
-
-		if record.INFO["SVTYPE"] == "BND":
-			bnd_output = extractInfoBND(record)
-			tra_bnd_outputlist.append(bnd_output)
-
-	path_vcf = path
-	#path = "/home/cog/fdussel/Documents/*.vcf"
-	for vcf_filename in glob.glob(path_vcf):
-		#vcf= open(vcf_filename)
-		#print vcf_filename
-		vcf_file = None
-		df_vcf = pd.DataFrame()
-		vcf_file_handle = open(vcf_filename, 'r')
-
-		if os.path.getsize(vcf_filename) > 0:
-			vcf_file = vcf.Reader(vcf_file_handle)
-		else:
+			return abs(length)
+		#No insertion length found. Note: insertion is not taken into account in the table
+		return 0
+
+	#BNDs and TRAs are said to have length = 0
+	if svtype in TRA_BND_TYPES or "END" not in record.INFO:
+		return 0
+
+	return abs(record.INFO["END"] - record.POS) + 1
+
+def countSVs(vcf_file, edges, svtypes=DEFAULT_SV_TYPES, sketch=None):
+	#type codes and lengths are collected for all records, and binned at once at the end
+	sv_codes = svCodes(svtypes)
+	tra_bnd_code = len(svtypes)
+	codes = []
+	lengths = []
+	sketch_lengths = collections.defaultdict(list) #(caller, svtype) -> lengths of all SVs, also the ones that are not counted
+	nr_records = 0
+	for record in vcf_file:
+		nr_records += 1
+		code = sv_codes.get(record.INFO["SVTYPE"])
+		if code is None and sketch is None:
+			continue
+		length = lengthSV(record)
+		if sketch is not None:
+			sketch_lengths[(callerSV(record), record.INFO["SVTYPE"])].append(length)
+		if code is None:
 			continue
+		codes.append(code)
+		lengths.append(length)
+
+	if sketch is not None:
+		for (caller, svtype), sv_lengths in sketch_lengths.items():
+			sketch.addLengths(caller, svtype, sv_lengths)
+
+	nr_bins = len(edges) + 1 #bin 0 contains the SVs that are too small to be counted
+	counts = np.zeros((len(svtypes), nr_bins), dtype=np.int64)
+	if codes:
+		codes = np.array(codes, dtype=np.int64)
+		lengths = np.array(lengths, dtype=np.int64)
+
+		binned = codes < tra_bnd_code
+		bins = np.searchsorted(edges, lengths[binned], side='left')
+		counts = np.bincount(codes[binned] * nr_bins + bins, minlength=len(svtypes) * nr_bins).reshape(len(svtypes), nr_bins)
+		nr_tra_bnd = int(np.count_nonzero(~binned))
+	else:
+		nr_tra_bnd = 0
+
+	return np.append(counts[:, 1:].ravel(), nr_tra_bnd), nr_records
+
+def countFile(arguments):
+	#runs in a worker process, only the small array of counts is sent back
+	vcf_filename, edges, svtypes, sketch_dir = arguments
+	if os.path.getsize(vcf_filename) == 0:
+		return None
+
+	sketch = None
+	if sketch_dir:
+		sketch = LengthSketch()
+
+	vcf_file_handle = open(vcf_filename, 'r')
+	vcf_file = vcf.Reader(vcf_file_handle)
+	counts, nr_records = countSVs(vcf_file, edges, svtypes, sketch)
+	vcf_file_handle.close()
+
+	if sketch is not None:
+		sketch.write(os.path.join(sketch_dir, os.path.basename(vcf_filename) + ".sketch.json"))
+
+	# Files without records are not put in the table, files with only other SV types give a column of zeros
+	if nr_records == 0:
+		return None
+	return counts
+
+def tidyTable(df_all, edges, svtypes):
+	#one row per file, SV type and length bin
+	svtype_column = []
+	bin_column = []
+	for svtype in svtypes:
+		for bin_name in binNames(edges):
+			svtype_column.append(svtype)
+			bin_column.append(bin_name)
+	svtype_column.append("/".join(TRA_BND_TYPES))
+	bin_column.append("all")
+
+	rows = pd.DataFrame({"svtype": svtype_column, "size_bin": bin_column}, index = rowNames(edges, svtypes))
+	df_tidy = df_all.join(rows).melt(id_vars = ["svtype", "size_bin"], var_name = "file", value_name = "count")
+	return df_tidy[["file", "svtype", "size_bin", "count"]]
+
+def writeTable(df, output, index=True):
+	if output.endswith(".parquet"):
+		#column names must be strings for parquet
+		df.columns = [str(column) for column in df.columns]
+		df.to_parquet(output, index = index)
+	else:
+		df.to_csv(output, sep = "\t", index = index)
+
+def categorize(path, edges=DEFAULT_EDGES, svtypes=DEFAULT_SV_TYPES, nr_cpus=1, output=None, tidy=False, sketch_dir=None):
+	edges = sorted(edges)
+	vcf_filenames = glob.glob(path)
+	arguments = [(vcf_filename, edges, svtypes, sketch_dir) for vcf_filename in vcf_filenames]
+	if sketch_dir and not os.path.isdir(sketch_dir):
+		os.makedirs(sketch_dir)
+
+	if nr_cpus > 1 and len(vcf_filenames) > 1:
+		pool = mp.Pool(nr_cpus)
+		all_counts = pool.map(countFile, arguments, chunksize = max(1, len(arguments) / (nr_cpus * 4)))
+		pool.close()
+		pool.join()
+	else:
+		all_counts = [countFile(argument) for argument in arguments]
+
+	#the table is made once, after all files are counted
+	list_vcf_names = []
+	list_counts = []
+	for vcf_filename, counts in zip(vcf_filenames, all_counts):
+		if counts is not None:
+			list_vcf_names.append(os.path.basename(vcf_filename))
+			list_counts.append(counts)
+
+	if list_counts:
+		df_all = pd.DataFrame(np.column_stack(list_counts), index = rowNames(edges, svtypes), columns = list_vcf_names).sort_index()
+	else:
+		df_all = pd.DataFrame()
+
+	if tidy and not df_all.empty:
+		df_all = tidyTable(df_all, edges, svtypes)
+
+	if output:
+		writeTable(df_all, output, index = not tidy)
+	else:
+		print df_all
+
+	return df_all
+
+def querySketches(path, edges=DEFAULT_EDGES, quantiles=(0.1, 0.5, 0.9), output=None):
+	#merges the sketches of all files and gives, per caller and SV type, the number of SVs, length quantiles and counts per length bin
+	edges = sorted(edges)
+	merged = LengthSketch()
+	for sketch_filename in glob.glob(path):
+		merged.merge(LengthSketch.read(sketch_filename))
+
+	bin_names = ["<=" + formatLength(edges[0])] + binNames(edges)
+	rows = []
+	for caller, svtype in merged.keys():
+		row = [caller, svtype, merged.total(caller, svtype)]
+		row.extend([merged.quantile(q, caller, svtype) for q in quantiles])
+		row.extend(merged.binCounts(edges, caller, svtype))
+		rows.append(row)
+	columns = ["caller", "svtype", "n"] + ["q{0:g}".format(q) for q in quantiles] + bin_names
+	df_sketch = pd.DataFrame(rows, columns = columns)
+
+	if output:
+		writeTable(df_sketch, output, index = False)
+	else:
+		print df_sketch
 
-		del_outputlist10 = []
-		del_outputlist100 = []
-		del_outputlist1000 = []
-		del_outputlist10000 = []
-		del_outputlist100000 = []
-		ins_outputlist10 = []
-		ins_outputlist100 = []
-		ins_outputlist1000 = []
-		ins_outputlist10000 = []
-		ins_outputlist100000 = []
-		inv_outputlist10 = []
-		inv_outputlist100 = []
-		inv_outputlist1000 = []
-		inv_outputlist10000 = []
-		inv_outputlist100000 = []
-		tra_bnd_outputlist = []
-		dup_outputlist10 = []
-		dup_outputlist100 = []
-		dup_outputlist1000 = []
-		dup_outputlist10000 = []
-		dup_outputlist100000 = []
-
-		all_names = vcf_filename.rsplit('/', 1)
-		name = all_names[1]
-		list_vcf_names.append(name)
-
-		for record in vcf_file:
-			checkLengthSVs(record)
-
-
-			dict_numberSV = {"del_1_10kb" : len(del_outputlist10), "del_10_100kb": len(del_outputlist100), "del_100kb_1mb": len(del_outputlist1000),
-						"del_1mb_10mb" : len(del_outputlist10000), "del_>10mb": len(del_outputlist100000),
-						"ins_1_10kb" : 	len(ins_outputlist10), "ins_10_100kb" : len(ins_outputlist100), "ins_100kb_1mb": len(ins_outputlist1000),
-						"ins_1mb_10mb" : len(ins_outputlist10000), "ins_>10mb" : len(ins_outputlist100000),
-			   			"inv_1_10kb" : len(inv_outputlist10), "inv_10_100kb": len(inv_outputlist100), "inv_100kb_1mb" : len(inv_outputlist1000),
-						"inv_1mb_10mb" : len(inv_outputlist10000), "inv_>10mb" : len(inv_outputlist100000),
-						"tra/bnd ": len(tra_bnd_outputlist),
-						"dup_1_10kb" : len(dup_outputlist10), "dup_10_100kb" : len(dup_outputlist100), "dup_100kb_1mb" : len(dup_outputlist1000),
-						"dup_1mb_10mb" : len(dup_outputlist10000), "dup_>10mb" : len(dup_outputlist100000)}
-
-			df_vcf = pd.DataFrame({name: dict_numberSV}, index = dict_numberSV.keys())
-
-		vcf_file_handle.close()
-
-		# Check whether data frame is empty
-		if not df_vcf.empty:
-			df_all = pd.concat([df_all, df_vcf], axis=1)
-			df_all = df_all.sort_index()
-
-	#print list_vcf_names
-
-	print df_all
+	return df_sketch
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description = 'Categorizing structural variants on type and length')
-	required_named = parser.add_argument_group('Required arguments')
-	required_named.add_argument('-p', '--path', help = "input a path for the vcf-file(s) to be processed", required=True)
+	parser.add_argument('-p', '--path', help = "input a path for the vcf-file(s) to be processed, required unless --merge_sketches is given")
+	parser.add_argument('-b', '--bins', help = "comma separated upper edges of the length bins in bp, or 'log:min:max[:bins_per_decade]' for log-scale edges", default = ",".join(str(edge) for edge in DEFAULT_EDGES))
+	parser.add_argument('-s', '--svtypes', help = "comma separated SV types that are counted per length bin, TRA and BND are always counted together", default = ",".join(DEFAULT_SV_TYPES))
+	parser.add_argument('-t', '--threads', help = "number of vcf-files that are processed simultaneously", type = int, default = 1)
+	parser.add_argument('-o', '--output', help = "write the table to this file instead of printing it, tab separated or parquet when the name ends with .parquet")
+	parser.add_argument('--tidy', help = "give one row per file, SV type and length bin instead of one column per file", action = "store_true")
+	parser.add_argument('--sketch_dir', help = "store a length sketch per SV type and caller of each vcf-file in this directory")
+	parser.add_argument('--merge_sketches', help = "input a path for sketch files to merge and query, instead of processing vcf-files")
+	parser.add_argument('-q', '--quantiles', help = "comma separated length quantiles to give for merged sketches", default = "0.1,0.5,0.9")
 
 	args = parser.parse_args()
-	categorize(args.path)
+	if not args.path and not args.merge_sketches:
+		parser.error("either --path or --merge_sketches is required")
+	if args.bins.startswith("log:"):
+		edges = logEdges(*[int(value) for value in args.bins.split(":")[1:]])
+	else:
+		edges = [int(edge) for edge in args.bins.split(",")]
+	svtypes = [svtype for svtype in args.svtypes.split(",") if svtype not in TRA_BND_TYPES]
+	if args.merge_sketches:
+		querySketches(args.merge_sketches, edges, [float(q) for q in args.quantiles.split(",")], args.output)
+	else:
+		categorize(args.path, edges, svtypes, args.threads, args.output, args.tidy, args.sketch_dir)
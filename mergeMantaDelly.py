@@ -1,9 +1,11 @@
 #!/usr/local/bin/python
+# -*- coding: utf-8 -*-
 
 ##################################################################
-# template.vcf is needed to make a merged file!
 # Merges the vcfs of Manta and Delly, and puts them in an output file that can be given in the command line.
-# A file called template.vcf, containing the vcf-header for the output-file, is needed in the working directory.
+# The vcf-header of the output-file is made by merging the INFO/FORMAT/FILTER definitions of both inputs,
+# so no template.vcf is needed and the script can be run from any directory.
+# When the name of the output-file ends with .gz, the output is sorted on chromosome and position, compressed with bgzip and indexed with tabix.
 # There are two options to merge vcfs from Manta and Delly.
 # 1. Run the script with “–mantaVCF ‘name mantaVCF’ --dellyVCF ‘name dellyVCF’ –outputVCF ‘name outputVCF’”.
 # This will merge the files in the outputVCF stated. It will output all information of the inputfiles.
@@ -21,8 +23,12 @@
 import operator
 import vcf
 import argparse
+import collections
+import subprocess
 import sys
 
+WRITE_BUFFER_SIZE = 10000 #number of records that are collected before they are written to the output-file
+
 def extractInfoDelly(record):
 	new_record = record
 	idDelly = record.ID + "-DELLY"
@@ -303,101 +309,238 @@ def conditionsForComparions(currentLine, previousLine):
 	else:
 		return False
 
-def combineVCFs(delly, manta, output):
-	vcf_reader_template = vcf.Reader(filename='template.vcf')
-	vcf_output_file = open(output, 'w')
-	try:
-		vcf_writer = vcf.Writer(vcf_output_file, vcf_reader_template)
-	except IOError:
-		sys.exit('Error: Cannot open vcf-file: {0}'.format(vcf_output_file))
-	else:
-		try:
-			vcf_delly = open(delly, 'r')
-			vcfD = vcf.Reader(vcf_delly)
-		except IOError:
-			sys.exit('Error: Cannot open vcf-file: {0}'.format(delly))
-
+SINGULAR_METADATA = ["fileformat", "fileDate", "reference"] #meta-information lines that are taken from the first vcf only
+
+#INFO fields that are added or changed by this script, the definitions of CSA and INFODELLY replace the ones of the inputs
+MERGE_INFOS = [('##INFO=<ID=END,Number=1,Type=Integer,Description="End position of the structural variant">', False),
+	('##INFO=<ID=SVLEN,Number=.,Type=Integer,Description="Length of the structural variant">', False),
+	('##INFO=<ID=CSA,Number=1,Type=Integer,Description="Number of callers (Manta and Delly) that called this SV">', True),
+	('##INFO=<ID=INFODELLY,Number=1,Type=Integer,Description="POS of the Delly call that overlaps with this Manta call">', True)]
+
+def formatValue(value, none='.', delim=','):
+	if isinstance(value, list):
+		return delim.join(str(item) if item is not None else none for item in value)
+	return str(value) if value is not None else none
+
+def formatFilter(filters):
+	if filters == []:
+		return "PASS"
+	return formatValue(filters, delim=';')
+
+def formatInfo(info, info_order):
+	#fields in the order of the header, fields that are not in the header last and alphabetically, flags without a value
+	if not info:
+		return "."
+	fields = []
+	for key in sorted(info, key=lambda key: (info_order.get(key, len(info_order)), key)):
+		value = info[key]
+		if isinstance(value, bool):
+			if value:
+				fields.append(key)
 		else:
+			fields.append("{0}={1}".format(key, formatValue(value)))
+	return ";".join(fields)
+
+def formatSample(call):
+	return ":".join(formatValue(value) for value in call.data)
+
+class MergedHeader:
+	"""vcf-header made by merging the meta-information lines of the Delly and Manta vcfs, per key in order of first appearance.
+	INFO/FORMAT/FILTER/ALT/contig lines are merged on their ID, the first definition is kept"""
+
+	def __init__(self, filenames):
+		self.lines = collections.OrderedDict() #key -> meta-information lines
+		self.ids = {} #(key, ID) -> index in self.lines[key]
+		self.samples = []
+
+		for filename in filenames:
 			try:
-				vcf_manta = open(manta, 'r')
-				vcfM = vcf.Reader(vcf_manta)
+				vcf_file = open(filename, 'r')
 			except IOError:
-				sys.exit('Error: Cannot open vcf-file: {0}'.format(manta))
+				sys.exit('Error: Cannot open vcf-file: {0}'.format(filename))
+			for line in vcf_file:
+				if line.startswith("##"):
+					self.addLine(line.rstrip("\n"))
+				else:
+					if line.startswith("#"):
+						for sample in line.rstrip("\n").split("\t")[9:]:
+							if sample not in self.samples:
+								self.samples.append(sample)
+					break
+			vcf_file.close()
+
+		for line, replace in MERGE_INFOS:
+			self.addLine(line, replace)
+
+		self.info_order = dict((info_id, i) for i, info_id in enumerate(self.structuredIDs("INFO")))
+		self.contig_order = dict((contig, i) for i, contig in enumerate(self.structuredIDs("contig")))
+
+	def addLine(self, line, replace=False):
+		key, value = line[2:].split("=", 1)
+		lines = self.lines.setdefault(key, [])
+		if key in SINGULAR_METADATA:
+			if not lines:
+				lines.append(line)
+		elif value.startswith("<ID="):
+			line_id = (key, value[4:].split(",", 1)[0].rstrip(">"))
+			if line_id not in self.ids:
+				self.ids[line_id] = len(lines)
+				lines.append(line)
+			elif replace:
+				lines[self.ids[line_id]] = line
+		elif line not in lines:
+			lines.append(line)
+
+	def structuredIDs(self, key):
+		return [line_id for (line_key, line_id), i in sorted(self.ids.items(), key=lambda item: item[1]) if line_key == key]
+
+	def write(self, stream):
+		for lines in self.lines.values():
+			for line in lines:
+				stream.write(line + "\n")
+		columns = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO"]
+		if self.samples:
+			columns += ["FORMAT"] + self.samples
+		stream.write("\t".join(columns) + "\n")
+
+class MergedVCFWriter:
+	"""Writes records in blocks to a vcf-file with a header made by MergedHeader.
+	Bgzipped output is sorted on chromosome (in the order of the contig lines) and position, so tabix can index it"""
+
+	def __init__(self, output, filenames, bgzip="bgzip", tabix="tabix"):
+		self.output = output
+		self.tabix = tabix
+		self.compressed = output.endswith(".gz")
+		self.buffer = []
+		self.bgzip_process = None
+		self.header = MergedHeader(filenames)
+
+		try:
+			self.output_file = open(output, 'wb' if self.compressed else 'w')
+			if self.compressed:
+				self.bgzip_process = subprocess.Popen([bgzip, "-c"], stdin=subprocess.PIPE, stdout=self.output_file)
+				self.stream = self.bgzip_process.stdin
 			else:
-				for record in vcfD:
-					new_record = extractInfoDelly(record)
-					vcf_writer.write_record(new_record)
+				self.stream = self.output_file
+		except (IOError, OSError):
+			sys.exit('Error: Cannot open vcf-file: {0}'.format(output))
+		self.header.write(self.stream)
+
+	def formatRecord(self, record):
+		fields = [formatValue(value) for value in [record.CHROM, record.POS, record.ID, record.REF]] + [formatValue(record.ALT), '.' if record.QUAL is None else str(record.QUAL), formatFilter(record.FILTER), formatInfo(record.INFO, self.header.info_order)]
+		if self.header.samples:
+			fields.append(record.FORMAT or '.')
+			calls = dict((call.sample, call) for call in record.samples)
+			for sample in self.header.samples:
+				if sample in calls:
+					fields.append(formatSample(calls[sample]))
+				else:
+					fields.append('.')
+		return "\t".join(fields)
+
+	def write_record(self, record):
+		if self.compressed:
+			#kept until close, to be sorted
+			self.buffer.append((self.header.contig_order.get(record.CHROM, len(self.header.contig_order)), record.CHROM, record.POS, self.formatRecord(record)))
+			return
+		self.buffer.append(self.formatRecord(record))
+		if len(self.buffer) >= WRITE_BUFFER_SIZE:
+			self.flush()
+
+	def flush(self):
+		if self.buffer:
+			self.stream.write("\n".join(self.buffer) + "\n")
+			self.buffer = []
+
+	def close(self):
+		if self.compressed:
+			self.buffer.sort(key=operator.itemgetter(0, 1, 2))
+			self.buffer = [line for contig, chrom, pos, line in self.buffer]
+		self.flush()
+		if self.bgzip_process:
+			self.stream.close()
+			if self.bgzip_process.wait() != 0:
+				sys.exit('Error: bgzip could not compress {0}'.format(self.output))
+		self.output_file.close()
+		if self.compressed:
+			if subprocess.call([self.tabix, "-f", "-p", "vcf", self.output]) != 0:
+				sys.exit('Error: tabix could not index {0}'.format(self.output))
+
+def openVCFReaders(delly, manta):
+	try:
+		vcf_delly = open(delly, 'r')
+		vcfD = vcf.Reader(vcf_delly)
+	except IOError:
+		sys.exit('Error: Cannot open vcf-file: {0}'.format(delly))
+	try:
+		vcf_manta = open(manta, 'r')
+		vcfM = vcf.Reader(vcf_manta)
+	except IOError:
+		sys.exit('Error: Cannot open vcf-file: {0}'.format(manta))
 
-				for record in vcfM:
-					new_record = extractInfoManta(record)
-					vcf_writer.write_record(new_record)
+	return vcf_delly, vcfD, vcf_manta, vcfM
 
+def combineVCFs(delly, manta, output, bgzip="bgzip", tabix="tabix"):
+	vcf_delly, vcfD, vcf_manta, vcfM = openVCFReaders(delly, manta)
+	vcf_writer = MergedVCFWriter(output, [delly, manta], bgzip, tabix)
 
-			vcf_delly.close()
-		vcf_manta.close()
-	vcf_output_file.close()
+	for record in vcfD:
+		new_record = extractInfoDelly(record)
+		vcf_writer.write_record(new_record)
 
-def combineVCFsOverlapFilter(delly, manta, output):
-	vcf_reader_template = vcf.Reader(filename='template.vcf')
-	vcf_output_file = open(output, 'w')
-	try:
-		vcf_writer = vcf.Writer(vcf_output_file, vcf_reader_template)
-	except IOError:
-		sys.exit('Error: Cannot open vcf-file: {0}'.format(vcf_output_file))
-	else:
-		try:
-			vcf_delly = open(delly, 'r')
-			vcfD = vcf.Reader(vcf_delly)
-		except IOError:
-			sys.exit('Error: Cannot open vcf-file: {0}'.format(delly))
+	for record in vcfM:
+		new_record = extractInfoManta(record)
+		vcf_writer.write_record(new_record)
 
-		else:
-			try:
-				vcf_manta = open(manta, 'r')
-				vcfM = vcf.Reader(vcf_manta)
-			except IOError:
-				sys.exit('Error: Cannot open vcf-file: {0}'.format(manta))
-			else:
-				list_all_records_MantaDelly = []
-				for record in vcfD:
-					new_recordDelly = extractInfoDelly(record)
-					list_Delly = getInfoInList(new_recordDelly)
-					list_all_records_MantaDelly.append(list_Delly)
+	vcf_delly.close()
+	vcf_manta.close()
+	vcf_writer.close()
 
-				for record in vcfM:
-					new_recordManta = extractInfoManta(record)
-					list_Manta = getInfoInList(new_recordManta)
-					list_all_records_MantaDelly.append(list_Manta)
+def combineVCFsOverlapFilter(delly, manta, output, bgzip="bgzip", tabix="tabix"):
+	vcf_delly, vcfD, vcf_manta, vcfM = openVCFReaders(delly, manta)
+	vcf_writer = MergedVCFWriter(output, [delly, manta], bgzip, tabix)
 
-				#first we will sort on the chrom, then on the startposition of the SV
-				list_all_records_MantaDelly.sort(key=operator.itemgetter("CHROM","POS"))
-				list_for_comparisonSVs = []
-				all_svs_to_write = []
+	list_all_records_MantaDelly = []
+	for record in vcfD:
+		new_recordDelly = extractInfoDelly(record)
+		list_Delly = getInfoInList(new_recordDelly)
+		list_all_records_MantaDelly.append(list_Delly)
 
-				previousLine = list_all_records_MantaDelly[0]
-				for currentLine in list_all_records_MantaDelly:
-					if (conditionsInsForComparison(currentLine, previousLine)):
-						list_for_comparisonSVs.append(currentLine)
+	for record in vcfM:
+		new_recordManta = extractInfoManta(record)
+		list_Manta = getInfoInList(new_recordManta)
+		list_all_records_MantaDelly.append(list_Manta)
 
-					elif (conditionsForComparions(currentLine, previousLine)):
-						list_for_comparisonSVs.append(currentLine)
+	if list_all_records_MantaDelly:
+		#first we will sort on the chrom, then on the startposition of the SV
+		list_all_records_MantaDelly.sort(key=operator.itemgetter("CHROM","POS"))
+		list_for_comparisonSVs = []
+		all_svs_to_write = []
 
-					else:
-						list_sv_to_print = compareFilterSVs(list_for_comparisonSVs)
-						all_svs_to_write.extend(list_sv_to_print)
-						list_for_comparisonSVs = startNewListForComparisonSVs(list_for_comparisonSVs, currentLine)
+		previousLine = list_all_records_MantaDelly[0]
+		for currentLine in list_all_records_MantaDelly:
+			if (conditionsInsForComparison(currentLine, previousLine)):
+				list_for_comparisonSVs.append(currentLine)
+
+			elif (conditionsForComparions(currentLine, previousLine)):
+				list_for_comparisonSVs.append(currentLine)
+
+			else:
+				list_sv_to_print = compareFilterSVs(list_for_comparisonSVs)
+				all_svs_to_write.extend(list_sv_to_print)
+				list_for_comparisonSVs = startNewListForComparisonSVs(list_for_comparisonSVs, currentLine)
 
-					previousLine = currentLine
+			previousLine = currentLine
 
-				if len(list_for_comparisonSVs) == 1: #when the last line in the file was a single SV
-					list_sv_to_print = compareFilterSVs(list_for_comparisonSVs)
-					all_svs_to_write.extend(list_sv_to_print)
+		if len(list_for_comparisonSVs) == 1: #when the last line in the file was a single SV
+			list_sv_to_print = compareFilterSVs(list_for_comparisonSVs)
+			all_svs_to_write.extend(list_sv_to_print)
 
-				filterBndAndWriteSVs(all_svs_to_write, vcf_writer)
+		filterBndAndWriteSVs(all_svs_to_write, vcf_writer)
 
-			vcf_delly.close()
-		vcf_manta.close()
-	vcf_output_file.close()
+	vcf_delly.close()
+	vcf_manta.close()
+	vcf_writer.close()
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description = 'Merging manta and delly file of same BAM')
@@ -407,11 +550,13 @@ if __name__ == '__main__':
 	required_named = parser.add_argument_group('Required arguments')
 	required_named.add_argument('-d', '--dellyVCF', help = "input a vcf file from delly to process", required=True)
 	required_named.add_argument('-m', '--mantaVCF', help = "input a vcf file from manta to process", required=True)
-	required_named.add_argument('-o', '--outputVCF', help = "give the filename of a vcf file for the merged output", required=True)
+	required_named.add_argument('-o', '--outputVCF', help = "give the filename of a vcf file for the merged output, ending with .gz gives bgzipped and tabix indexed output", required=True)
+	parser.add_argument('--bgzip', help = "path to bgzip binary", default = "bgzip")
+	parser.add_argument('--tabix', help = "path to tabix binary", default = "tabix")
 
 	args = parser.parse_args()
 	if args.filterOverlap:
 		print "overlap function used, no double values printed"
-		combineVCFsOverlapFilter(args.dellyVCF, args.mantaVCF, args.outputVCF)
+		combineVCFsOverlapFilter(args.dellyVCF, args.mantaVCF, args.outputVCF, args.bgzip, args.tabix)
 	else:
-		combineVCFs(args.dellyVCF, args.mantaVCF, args.outputVCF)
+		combineVCFs(args.dellyVCF, args.mantaVCF, args.outputVCF, args.bgzip, args.tabix)
@@ -0,0 +1,38 @@
+#!/usr/local/bin/python
+
+import unittest
+import numpy as np
+
+from categorizeSV import LengthSketch, DEFAULT_EDGES, logEdges
+
+def countBins(lengths, edges):
+	#the length bins of countSVs
+	return np.bincount(np.searchsorted(edges, lengths, side='left'), minlength=len(edges) + 1)
+
+class LengthSketchTest(unittest.TestCase):
+
+	def assertSameBins(self, lengths, edges):
+		sketch = LengthSketch()
+		sketch.addLengths("DELLY", "DEL", lengths)
+		self.assertEqual(list(sketch.binCounts(edges)), list(countBins(lengths, edges)))
+
+	def test_lengths_on_default_edges(self):
+		lengths = [0, 1, 999, 1000, 1001, 9999, 10000, 10001, 100000, 100001, 1000000, 1000001, 10000000, 10000001]
+		self.assertSameBins(lengths, DEFAULT_EDGES)
+
+	def test_lengths_on_log_edges(self):
+		edges = logEdges(100, 10000000)
+		lengths = [edge + offset for edge in edges for offset in (-1, 0, 1)]
+		self.assertSameBins(lengths, edges)
+
+	def test_merged_sketches(self):
+		first = LengthSketch()
+		first.addLengths("DELLY", "DEL", [1000, 10000])
+		second = LengthSketch()
+		second.addLengths("MANTA", "DEL", [1001, 10001])
+		first.merge(second)
+		self.assertEqual(list(first.binCounts(DEFAULT_EDGES, svtype="DEL")), [1, 2, 1, 0, 0, 0])
+		self.assertEqual(list(first.binCounts(DEFAULT_EDGES, caller="MANTA")), [0, 1, 1, 0, 0, 0])
+
+if __name__ == '__main__':
+	unittest.main()